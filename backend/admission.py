@@ -0,0 +1,329 @@
+"""
+准入控制
+
+抠图推理、PDF 合并、音视频转换等重负载接口按功能限制同时处理的请求数，并按上传大小估算
+内存占用，总量不超过内存预算：
+- 有空闲槽位且内存预算足够时立即处理
+- 否则进入该功能的有界等待队列，按到达顺序放行；队列已满或等待超时返回 429 与 Retry-After
+- 准入在读取请求体之前完成，被拒绝的上传不会写入磁盘
+- 响应头发出时即归还准入，慢速下载结果不会一直占用槽位；后台任务（HLS 转换）可接管准入，
+  持有到任务结束
+身份证、状态查询等轻量接口不经过准入控制，负载高时仍能及时响应。
+"""
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from typing import Deque, Dict, Optional
+
+from shared_state import WORKER_COUNT
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def _default_memory_budget() -> int:
+    """默认取物理内存的一半，无法获取时为 2GB"""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (AttributeError, ValueError, OSError):
+        return 2048 * MB
+
+
+# 重负载请求的内存预算（字节），多 worker 模式下各 worker 平分
+MEMORY_BUDGET_BYTES = (int(os.environ.get('YUNRAN_MEMORY_BUDGET_MB', '0')) * MB
+                       or _default_memory_budget()) // WORKER_COUNT
+# 排队等待的最长时间（秒），超时返回 429
+QUEUE_TIMEOUT = float(os.environ.get('YUNRAN_ADMISSION_TIMEOUT', '60'))
+
+# 功能 -> (同时处理数, 等待队列长度, 基础内存 MB, 内存相对上传大小的倍数)
+# 可用 YUNRAN_ADMIT_<功能>=同时处理数:队列长度 覆盖，如 YUNRAN_ADMIT_VIDEO=1:2
+ADMISSION_DEFAULTS = {
+    # rembg 推理：模型激活与解码后的 RGBA 图像
+    'photo': (1, 4, 300, 20),
+    'pdf': (2, 8, 20, 3),
+    # pydub 将音频整体解码为 PCM
+    'audio': (2, 8, 50, 12),
+    # 波形、缩略图、预估：ffmpeg 流式读取
+    'preview': (2, 8, 50, 1),
+    # 视频转换：输入先写入磁盘，内存主要为 ffmpeg 进程
+    'video': (2, 4, 300, 1),
+}
+
+# 接口路径前缀 -> 功能（仅 POST）
+ADMISSION_ROUTES = {
+    '/api/photo/': 'photo',
+    '/api/pdf/merge': 'pdf',
+    '/api/audio/convert': 'audio',
+    '/api/audio/waveform': 'preview',
+    '/api/video/estimate': 'preview',
+    '/api/video/thumbnails': 'preview',
+    '/api/video/convert': 'video',
+    # HLS 转换在后台运行，任务接管准入直到转换结束
+    '/api/video/hls': 'video',
+    # 流水线按输入类型使用对应功能的槽位（图像流水线可能包含抠图）
+    '/api/pipeline/image': 'photo',
+    '/api/pipeline/pdf': 'pdf',
+    '/api/pipeline/audio': 'audio',
+}
+
+# 处理耗时初始估计（秒），用于计算 Retry-After
+INITIAL_HOLD_SECONDS = 5.0
+MAX_RETRY_AFTER = 300
+
+
+def _parse_limits(name: str, default: tuple) -> tuple:
+    value = os.environ.get(f'YUNRAN_ADMIT_{name.upper()}', '')
+    if not value:
+        return default
+    try:
+        concurrency, _, queue = value.partition(':')
+        return (max(1, int(concurrency)), max(0, int(queue or default[1]))) + default[2:]
+    except ValueError:
+        logger.warning(f"Invalid YUNRAN_ADMIT_{name.upper()}={value}, using defaults")
+        return default
+
+
+class AdmissionRejected(Exception):
+    """超出处理能力"""
+
+    def __init__(self, feature: str, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.feature = feature
+        self.retry_after = retry_after
+
+
+class _FeatureGate:
+    def __init__(self, name: str, concurrency: int, queue_limit: int, base_bytes: int, factor: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.base_bytes = base_bytes
+        self.factor = factor
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        # 单个请求处理耗时的指数移动平均
+        self.hold_seconds = INITIAL_HOLD_SECONDS
+
+    def cost(self, content_length: int) -> int:
+        return int(self.base_bytes + self.factor * content_length)
+
+    def retry_after(self) -> int:
+        waves = (self.queued + self.running) / self.concurrency
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self.hold_seconds * max(1.0, waves))))
+
+
+class _Waiter:
+    __slots__ = ('seq', 'gate', 'cost', 'future')
+
+    def __init__(self, seq: int, gate: _FeatureGate, cost: int, future: asyncio.Future):
+        self.seq = seq
+        self.gate = gate
+        self.cost = cost
+        self.future = future
+
+
+class Ticket:
+    """一次准入，release() 后归还槽位与内存预算"""
+
+    def __init__(self, controller: 'AdmissionController', gate: _FeatureGate, cost: int):
+        self.controller = controller
+        self.gate = gate
+        self.cost = cost
+        self.start = time.perf_counter()
+        self.detached = False
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+def take_ticket(scope) -> Optional[Ticket]:
+    """
+    由处理函数接管本次请求的准入，中间件不再归还
+
+    用于请求返回后仍在后台处理的任务，接管方在任务结束时调用 release()。
+    """
+    ticket = scope.get("state", {}).get("admission_ticket")
+    if ticket is not None:
+        ticket.detached = True
+    return ticket
+
+
+class AdmissionController:
+    """
+    按功能的并发槽位、有界等待队列与全局内存预算
+
+    只在事件循环线程中使用，不需要加锁。
+    """
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET_BYTES, queue_timeout: float = QUEUE_TIMEOUT,
+                 limits: Optional[Dict[str, tuple]] = None):
+        self.memory_budget = memory_budget
+        self.queue_timeout = queue_timeout
+        self.memory_in_use = 0
+        self.gates: Dict[str, _FeatureGate] = {}
+        for name, default in (limits or ADMISSION_DEFAULTS).items():
+            concurrency, queue_limit, base_mb, factor = _parse_limits(name, default)
+            self.gates[name] = _FeatureGate(name, concurrency, queue_limit, base_mb * MB, factor)
+        self._waiters: Deque[_Waiter] = collections.deque()
+        self._seq = itertools.count()
+
+    def _fits(self, gate: _FeatureGate, cost: int) -> bool:
+        if gate.running >= gate.concurrency:
+            return False
+        # 超出预算的单个请求在没有其他重负载请求时仍可处理
+        running = sum(g.running for g in self.gates.values())
+        return running == 0 or self.memory_in_use + cost <= self.memory_budget
+
+    def _admit(self, gate: _FeatureGate, cost: int) -> Ticket:
+        gate.running += 1
+        gate.admitted += 1
+        self.memory_in_use += cost
+        return Ticket(self, gate, cost)
+
+    def _reject(self, gate: _FeatureGate, reason: str) -> AdmissionRejected:
+        gate.rejected += 1
+        retry_after = gate.retry_after()
+        logger.warning(f"Admission rejected for {gate.name}: {reason}, retry after {retry_after}s")
+        return AdmissionRejected(gate.name, retry_after, reason)
+
+    async def acquire(self, feature: str, content_length: int = 0) -> Ticket:
+        """获取准入；需要排队时等待，队列已满或超时抛出 AdmissionRejected"""
+        gate = self.gates[feature]
+        cost = gate.cost(content_length)
+        # 没有人排队时才能直接处理，保证先到先得
+        if not any(w.gate is gate for w in self._waiters) and self._fits(gate, cost):
+            return self._admit(gate, cost)
+        if gate.queued >= gate.queue_limit:
+            raise self._reject(gate, "服务繁忙，等待队列已满，请稍后重试")
+
+        waiter = _Waiter(next(self._seq), gate, cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        gate.queued += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 超时的同时已被放行
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject(gate, "服务繁忙，排队等待超时，请稍后重试")
+        finally:
+            gate.queued -= 1
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _release(self, ticket: Ticket) -> None:
+        gate = ticket.gate
+        gate.running -= 1
+        self.memory_in_use -= ticket.cost
+        elapsed = time.perf_counter() - ticket.start
+        gate.hold_seconds = 0.8 * gate.hold_seconds + 0.2 * elapsed
+        self._wake()
+
+    def _wake(self) -> None:
+        """按到达顺序放行能放行的等待者；某功能队首放行不了时，其后的同功能请求也不放行"""
+        blocked = set()
+        for waiter in list(self._waiters):
+            gate = waiter.gate
+            if waiter.future.done() or gate.name in blocked:
+                continue
+            if self._fits(gate, waiter.cost):
+                self._waiters.remove(waiter)
+                waiter.future.set_result(self._admit(gate, waiter.cost))
+            else:
+                blocked.add(gate.name)
+
+    def status(self) -> dict:
+        return {
+            "memory_budget_bytes": self.memory_budget,
+            "memory_in_use_bytes": self.memory_in_use,
+            "features": {
+                name: {
+                    "limit": gate.concurrency,
+                    "queue_limit": gate.queue_limit,
+                    "running": gate.running,
+                    "queued": gate.queued,
+                    "admitted": gate.admitted,
+                    "rejected": gate.rejected,
+                    "avg_seconds": round(gate.hold_seconds, 2),
+                }
+                for name, gate in self.gates.items()
+            },
+        }
+
+
+def admission_feature(path: str) -> Optional[str]:
+    matches = [prefix for prefix in ADMISSION_ROUTES if path.startswith(prefix)]
+    if not matches:
+        return None
+    return ADMISSION_ROUTES[max(matches, key=len)]
+
+
+class AdmissionMiddleware:
+    """重负载接口的准入控制 ASGI 中间件，在读取请求体之前完成准入"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        feature = admission_feature(scope["path"]) if scope["type"] == "http" else None
+        if feature is None or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = 0
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                if value.isdigit():
+                    content_length = int(value)
+                break
+
+        try:
+            ticket = await self.controller.acquire(feature, content_length)
+        except AdmissionRejected as e:
+            body = json.dumps({"detail": str(e)}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        scope.setdefault("state", {})["admission_ticket"] = ticket
+
+        def release() -> None:
+            if not ticket.detached:
+                ticket.release()
+
+        async def send_wrapper(message):
+            # 处理已完成，响应体的发送（慢速客户端下载）不再占用槽位与内存预算
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
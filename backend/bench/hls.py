@@ -0,0 +1,105 @@
+"""
+HLS 输出可播放性检查
+
+用法（在 backend 目录下执行）:
+    python -m bench.hls --duration 10
+
+生成一段测试视频，按以下组合分别执行 build_hls_cmd() 构建的命令：
+- 单清晰度（original，即接口默认值）与多清晰度（original,360p）
+- fmp4 与 ts 分段
+然后从 master.m3u8 出发，逐个解析播放列表引用的文件（子播放列表、EXT-X-MAP 初始化分段、媒体分段），
+用 resolve_job_file() 检查每个文件都能通过 /api/video/hls/{job_id}/{path} 访问，并输出转换耗时。
+有文件无法访问时以非零状态退出。
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hls_jobs import HLSJob, resolve_job_file  # noqa: E402
+from media_utils import HLS_MASTER_PLAYLIST, build_hls_cmd  # noqa: E402
+
+CASES = [
+    (['original'], 'fmp4'),
+    (['original'], 'ts'),
+    (['original', '360p'], 'fmp4'),
+    (['original', '360p'], 'ts'),
+]
+
+_MAP_URI_RE = re.compile(r'#EXT-X-MAP:URI="([^"]+)"')
+
+
+def make_input(path: str, duration: int) -> None:
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x480:rate=25:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def playlist_refs(job: HLSJob, rel_path: str) -> List[str]:
+    """播放列表中引用的文件（相对任务目录）"""
+    base = os.path.dirname(rel_path)
+    with open(os.path.join(job.dir, *rel_path.split('/')), encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    refs = []
+    for line in lines:
+        match = _MAP_URI_RE.match(line)
+        if match:
+            refs.append(match.group(1))
+        elif line and not line.startswith('#'):
+            refs.append(line)
+    return [f"{base}/{ref}" if base else ref for ref in refs]
+
+
+def check_job(job: HLSJob) -> List[str]:
+    """从主播放列表出发解析所有引用，返回无法访问的路径"""
+    missing = []
+    pending = [HLS_MASTER_PLAYLIST]
+    while pending:
+        rel_path = pending.pop()
+        if resolve_job_file(job, rel_path) is None:
+            missing.append(rel_path)
+            continue
+        if rel_path.endswith('.m3u8'):
+            pending.extend(playlist_refs(job, rel_path))
+    return missing
+
+
+def main(args) -> int:
+    work_dir = tempfile.mkdtemp(prefix="yunran_hls_")
+    failed = False
+    try:
+        input_path = os.path.join(work_dir, "input.mp4")
+        make_input(input_path, args.duration)
+        for renditions, segment_type in CASES:
+            job_dir = os.path.join(work_dir, f"{'_'.join(renditions)}_{segment_type}")
+            cmd = build_hls_cmd(input_path, job_dir, renditions, True, segment_type)
+            start = time.perf_counter()
+            subprocess.run(cmd[:3] + ["-v", "error"] + cmd[3:], check=True)
+            elapsed = time.perf_counter() - start
+
+            missing = check_job(HLSJob(job_dir, renditions, segment_type))
+            label = f"{','.join(renditions)} {segment_type}"
+            if missing:
+                failed = True
+                print(f"{label:22s} {elapsed:6.2f}s  FAIL: not servable: {', '.join(sorted(missing))}")
+            else:
+                print(f"{label:22s} {elapsed:6.2f}s  ok")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HLS 输出可播放性检查")
+    parser.add_argument("--duration", type=int, default=10, help="测试视频时长（秒）")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+身份证校验微基准测试
+
+用法（在 backend 目录下执行）:
+    python -m bench.idcard --max-hit-us 5
+
+直接调用 validate_id_card()，测量单次校验的耗时（微秒，取多轮中位数）：
+- hit：反复校验同一号码（前端输入时的情形），命中结果缓存
+- miss：每次都是新号码（每轮前清空缓存），走完整校验流程
+- short：长度不足 18 位的号码（输入过程中的大部分请求）
+- endpoint：经 TestClient 调用 /api/idcard/validate 的单次请求耗时，含 FastAPI 表单解析等开销
+hit 路径超过 --max-hit-us 时以非零状态退出。
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('YUNRAN_WARMUP', '')
+logging.disable(logging.INFO)
+
+import main  # noqa: E402
+
+
+def per_call_us(func, number: int, rounds: int, setup=None) -> float:
+    """执行 number 次 func 的平均耗时（微秒），取 rounds 轮的中位数"""
+    samples = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return statistics.median(samples)
+
+
+def run(args) -> int:
+    cards = [main.generate_id_card() for _ in range(args.number)]
+    card = cards[0]
+    distinct = iter(())
+
+    def reset_distinct():
+        nonlocal distinct
+        main._validate_id_card.cache_clear()
+        distinct = iter(cards)
+
+    results = {
+        "hit": per_call_us(lambda: main.validate_id_card(card), args.number, args.rounds),
+        "miss": per_call_us(lambda: main.validate_id_card(next(distinct)), args.number, args.rounds,
+                            reset_distinct),
+        "short": per_call_us(lambda: main.validate_id_card(card[:10]), args.number, args.rounds),
+    }
+
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    requests = max(1, args.number // 20)
+    results["endpoint"] = per_call_us(
+        lambda: client.post("/api/idcard/validate", data={"id_card": card}), requests, args.rounds)
+
+    for name, value in results.items():
+        print(f"{name:9s} {value:9.2f} us/call")
+    print(main._validate_id_card.cache_info())
+
+    if results["hit"] > args.max_hit_us:
+        print(f"FAIL: hit path {results['hit']:.2f}us > {args.max_hit_us}us")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="身份证校验单次调用耗时")
+    parser.add_argument("--number", type=int, default=2000, help="每轮调用次数（miss 路径每轮使用这么多个不同号码）")
+    parser.add_argument("--rounds", type=int, default=5, help="轮数，取中位数")
+    parser.add_argument("--max-hit-us", type=float, default=5.0, help="缓存命中路径的耗时上限（微秒）")
+    sys.exit(run(parser.parse_args()))
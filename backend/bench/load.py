@@ -0,0 +1,445 @@
+"""
+后端并发负载与长时间浸泡测试
+
+用法（在 backend 目录下执行）:
+    python -m bench.load --concurrency 8 --duration 300
+    python -m bench.load --concurrency 4 --duration 10800 --interval 300 --output soak.jsonl
+    python -m bench.load --url http://127.0.0.1:8000 --mix idcard=5,pdf=1
+    python -m bench.load --workers 4 --concurrency 16 --mix idcard=1,pdf=1   # 多 worker 吞吐对比
+
+与 Electron 相同的方式启动单个 uvicorn 进程（或用 --url 连接已运行的后端），由多个线程
+按权重混合发送接近真实使用的请求：身份证校验突发、批量生成、PDF 合并、音频转换与标准化、
+波形、视频转换。每个统计周期输出：
+- 吞吐量、错误率、各场景与总体的 p50/p95/p99 延迟
+- 后端进程常驻内存、打开的文件数（仅 Linux，本机启动时）
+- 临时目录顶层文件数、temp_files_registry 大小、临时空间用量
+- 事件循环卡顿：独立线程每秒请求 /api/health，记录最大延迟与超过 --stall-ms 的次数
+
+结束后停止发压、等待处理收尾，再检查遗留的临时文件，并按整段运行拟合内存增长斜率
+（MB/小时），用于发现泄漏。超过 --max-error-rate、--max-rss-growth-mb 或有遗留临时文件时
+以非零状态退出。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+
+# 默认流量构成（权重）
+DEFAULT_MIX = 'idcard=40,generate=10,pdf=15,audio=15,normalize=5,waveform=10,video=5'
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    """线程安全的延迟与错误统计，按周期取出后清空"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._error_samples: Dict[str, str] = {}
+
+    def record(self, scenario: str, seconds: float, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._latencies.setdefault(scenario, []).append(seconds)
+            if error:
+                self._errors[scenario] = self._errors.get(scenario, 0) + 1
+                self._error_samples[scenario] = error
+
+    def drain(self):
+        with self._lock:
+            latencies, errors, samples = self._latencies, self._errors, self._error_samples
+            self._latencies, self._errors, self._error_samples = {}, {}, {}
+        return latencies, errors, samples
+
+
+# ---------- 场景 ----------
+
+class Scenarios:
+    """各场景发送的请求；输入文件在启动前准备好并读入内存"""
+
+    def __init__(self, base_url: str, work_dir: str):
+        self.base_url = base_url.rstrip('/')
+        self.pdfs = [self._read(os.path.join(ROOT_DIR, name)) for name in ('test1.pdf', 'test2.pdf')]
+        self.wav = self._read(os.path.join(ROOT_DIR, 'test.wav'))
+        self.mp3 = self._read(os.path.join(ROOT_DIR, 'test_audio.mp3'))
+        self.video = None
+        video_path = os.path.join(work_dir, 'clip.mkv')
+        try:
+            subprocess.run([
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25:duration=3",
+                "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+                "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", video_path
+            ], check=True)
+            self.video = ('clip.mkv', self._read(video_path)[1])
+        except (OSError, subprocess.CalledProcessError):
+            print("ffmpeg not available, video scenario disabled")
+        self.id_cards: List[str] = []
+
+    @staticmethod
+    def _read(path: str):
+        with open(path, 'rb') as f:
+            return os.path.basename(path), f.read()
+
+    def table(self) -> Dict[str, Callable[[requests.Session], str]]:
+        table = {
+            'idcard': self.idcard_burst,
+            'generate': self.idcard_generate,
+            'pdf': self.pdf_merge,
+            'audio': self.audio_convert,
+            'normalize': self.audio_normalize,
+            'waveform': self.audio_waveform,
+        }
+        if self.video:
+            table['video'] = self.video_convert
+        return table
+
+    def _post(self, session: requests.Session, path: str, **kwargs) -> requests.Response:
+        response = session.post(f"{self.base_url}{path}", timeout=600, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} {response.status_code}: {response.text[:120]}")
+        return response
+
+    def idcard_burst(self, session: requests.Session) -> None:
+        """连续校验 20 个号码（界面逐个输入时的突发）"""
+        if not self.id_cards:
+            self.idcard_generate(session)
+        for card in random.sample(self.id_cards, min(20, len(self.id_cards))):
+            self._post(session, "/api/idcard/validate", data={"id_card": card})
+
+    def idcard_generate(self, session: requests.Session) -> None:
+        response = self._post(session, "/api/idcard/generate", data={"count": 10})
+        self.id_cards = (self.id_cards + response.json()["idCards"])[-200:]
+
+    def pdf_merge(self, session: requests.Session) -> None:
+        files = [("files", (name, data, "application/pdf")) for name, data in self.pdfs * 3]
+        self._post(session, "/api/pdf/merge", files=files)
+
+    def audio_convert(self, session: requests.Session) -> None:
+        name, data = random.choice([self.wav, self.mp3])
+        target = "mp3" if name.endswith(".wav") else "wav"
+        self._post(session, "/api/audio/convert", files={"file": (name, data)}, data={"format": target})
+
+    def audio_normalize(self, session: requests.Session) -> None:
+        name, data = self.wav
+        self._post(session, "/api/audio/convert", files={"file": (name, data)},
+                   data={"format": "mp3", "normalize": "-16"})
+
+    def audio_waveform(self, session: requests.Session) -> None:
+        name, data = self.mp3
+        self._post(session, "/api/audio/waveform", files={"file": (name, data)})
+
+    def video_convert(self, session: requests.Session) -> None:
+        name, data = self.video
+        self._post(session, "/api/video/convert", files={"file": (name, data)}, data={"format": "mp4"})
+
+
+# ---------- 后端进程 ----------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(port: int, log_path: str, workers: int = 1) -> subprocess.Popen:
+    """与 electron/main.js 相同的方式启动单个 uvicorn 进程；workers 大于 1 时用 serve.py 启动多 worker"""
+    log = open(log_path, 'wb')
+    if workers > 1:
+        cmd = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    # 各场景反复提交相同的输入，关闭结果缓存，压测实际处理
+    env = dict(os.environ)
+    env.setdefault('YUNRAN_RESULT_CACHE_MB', '0')
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+
+def wait_ready(base_url: str, timeout: float = 120) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/ready", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"backend at {base_url} not ready after {timeout}s")
+
+
+def _child_pids(pid: int) -> List[int]:
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_sample(pid: Optional[int]) -> dict:
+    """后端进程（多 worker 时为主进程与各 worker 之和）的常驻内存与打开的文件数（仅 Linux）"""
+    if pid is None:
+        return {}
+    rss = fds = 0
+    # 多 worker 模式下 worker 为主进程的子进程；不计入 ffmpeg 等孙进程
+    pids = [pid] + [child for child in _child_pids(pid) if _is_python(child)]
+    try:
+        for p in pids:
+            with open(f'/proc/{p}/statm', 'r') as f:
+                rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            fds += len(os.listdir(f'/proc/{p}/fd'))
+    except OSError:
+        return {}
+    return {"rss_bytes": rss, "open_fds": fds}
+
+
+def _is_python(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/comm', 'r') as f:
+            return f.read().startswith('python')
+    except OSError:
+        return False
+
+
+def temp_sample(base_url: str, temp_dir: str) -> dict:
+    """临时目录顶层文件（处理中的上传与中间产物，缓存与结果在子目录中）及登记表大小"""
+    sample = {}
+    try:
+        status = requests.get(f"{base_url}/api/status", timeout=10).json()
+        sample["registry"] = status.get("temp_files_count")
+        sample["temp_used_bytes"] = status.get("temp_store", {}).get("used_bytes")
+        temp_dir = temp_dir or status.get("temp_dir")
+    except (requests.RequestException, ValueError):
+        pass
+    if temp_dir and os.path.isdir(temp_dir):
+        sample["temp_files"] = sum(1 for entry in os.scandir(temp_dir) if not entry.name.startswith('.')
+                                   and (entry.is_file() or entry.name.startswith('video_segments_')))
+    return sample
+
+
+# ---------- 发压 ----------
+
+def worker(scenarios: Dict[str, Callable], weights: Dict[str, int], stats: Stats, stop: threading.Event) -> None:
+    names = list(weights)
+    session = requests.Session()
+    while not stop.is_set():
+        scenario = random.choices(names, [weights[n] for n in names])[0]
+        start = time.perf_counter()
+        try:
+            scenarios[scenario](session)
+        except Exception as e:
+            stats.record(scenario, time.perf_counter() - start, str(e) or type(e).__name__)
+        else:
+            stats.record(scenario, time.perf_counter() - start)
+
+
+def stall_probe(base_url: str, stats: Stats, stop: threading.Event) -> None:
+    """每秒请求一次 /api/health：它不做任何处理，延迟升高说明事件循环被阻塞"""
+    session = requests.Session()
+    while not stop.wait(1.0):
+        start = time.perf_counter()
+        try:
+            session.get(f"{base_url}/api/health", timeout=30)
+            stats.record('health', time.perf_counter() - start)
+        except requests.RequestException as e:
+            stats.record('health', time.perf_counter() - start, str(e))
+
+
+def rss_slope_mb_per_hour(samples: List[dict]) -> Optional[float]:
+    """按最小二乘拟合常驻内存随时间的增长斜率"""
+    points = [(s["elapsed"], s["rss_bytes"]) for s in samples if s.get("rss_bytes")]
+    if len(points) < 3:
+        return None
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_r = sum(r for _, r in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var_t:
+        return None
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in points) / var_t
+    return slope * 3600 / 1024 / 1024
+
+
+def report(elapsed: float, window: float, stats: Stats, base_url: str, pid: Optional[int],
+           temp_dir: str, stall_ms: float) -> dict:
+    latencies, errors, samples = stats.drain()
+    health = latencies.pop('health', [])
+    health_errors = errors.pop('health', 0)
+    total = sum(len(v) for v in latencies.values())
+    failed = sum(errors.values())
+    all_latencies = [v for values in latencies.values() for v in values]
+    row = {
+        "elapsed": round(elapsed, 1),
+        "requests": total,
+        "throughput": round(total / window, 2) if window else 0,
+        "errors": failed,
+        "error_rate": round(failed / total, 4) if total else 0,
+        "p50": round(percentile(all_latencies, 50), 4),
+        "p95": round(percentile(all_latencies, 95), 4),
+        "p99": round(percentile(all_latencies, 99), 4),
+        "scenarios": {
+            name: {"count": len(values), "errors": errors.get(name, 0),
+                   "p50": round(percentile(values, 50), 4), "p95": round(percentile(values, 95), 4),
+                   "p99": round(percentile(values, 99), 4)}
+            for name, values in sorted(latencies.items())
+        },
+        "health_max_ms": round(max(health, default=0) * 1000, 1),
+        "stalls": sum(1 for v in health if v * 1000 > stall_ms) + health_errors,
+        "error_samples": samples,
+    }
+    row.update(process_sample(pid))
+    row.update(temp_sample(base_url, temp_dir))
+    rss = f"{row['rss_bytes'] / 1024 / 1024:.0f}M" if row.get("rss_bytes") else '-'
+    print(f"[{elapsed:7.0f}s] {row['throughput']:7.2f} req/s  err {row['error_rate'] * 100:5.2f}%  "
+          f"p50 {row['p50'] * 1000:7.1f}ms  p95 {row['p95'] * 1000:7.1f}ms  p99 {row['p99'] * 1000:7.1f}ms  "
+          f"rss {rss:>6}  fds {row.get('open_fds', '-')}  temp {row.get('temp_files', '-')}  "
+          f"registry {row.get('registry', '-')}  health max {row['health_max_ms']}ms  stalls {row['stalls']}")
+    for name, sample in samples.items():
+        print(f"           {name} error: {sample}")
+    return row
+
+
+def run_load(args) -> int:
+    weights = {}
+    for item in args.mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() and int(weight or 1) > 0:
+            weights[name.strip()] = int(weight or 1)
+
+    process = None
+    work_dir = tempfile.mkdtemp(prefix="yunran_load_")
+    base_url = args.url
+    temp_dir = ''
+    if not base_url:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_backend(port, os.path.join(work_dir, 'backend.log'), args.workers)
+        temp_dir = os.path.join(BACKEND_DIR, 'temp')
+    pid = process.pid if process else None
+
+    stop = threading.Event()
+    samples: List[dict] = []
+    failed = False
+    try:
+        wait_ready(base_url)
+        scenarios = Scenarios(base_url, work_dir).table()
+        unknown = set(weights) - set(scenarios)
+        for name in unknown:
+            print(f"scenario {name} unavailable, skipped")
+            weights.pop(name)
+        if not weights:
+            print("no scenarios to run")
+            return 1
+
+        print(f"target {base_url}, workers {args.workers if process else '-'}, concurrency {args.concurrency}, "
+              f"duration {args.duration}s, mix {weights}")
+        baseline = {"elapsed": 0.0, **process_sample(pid), **temp_sample(base_url, temp_dir)}
+        samples.append(baseline)
+        stats = Stats()
+        threads = [threading.Thread(target=worker, args=(scenarios, weights, stats, stop), daemon=True)
+                   for _ in range(args.concurrency)]
+        threads.append(threading.Thread(target=stall_probe, args=(base_url, stats, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        start = last = time.time()
+        output = open(args.output, 'a', encoding='utf-8') if args.output else None
+        try:
+            while time.time() - start < args.duration:
+                time.sleep(min(args.interval, max(0.0, args.duration - (time.time() - start))))
+                now = time.time()
+                row = report(now - start, now - last, stats, base_url, pid, temp_dir, args.stall_ms)
+                last = now
+                samples.append(row)
+                if output:
+                    output.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    output.flush()
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=600)
+            if output:
+                output.close()
+
+        # 发压结束后等待后台清理，再检查遗留
+        time.sleep(args.settle)
+        final = {**process_sample(pid), **temp_sample(base_url, temp_dir)}
+        total = sum(s.get("requests", 0) for s in samples)
+        errors = sum(s.get("errors", 0) for s in samples)
+        error_rate = errors / total if total else 0
+        slope = rss_slope_mb_per_hour(samples[1:])
+        print("\nSummary")
+        print(f"  requests {total}, errors {errors} ({error_rate * 100:.2f}%), "
+              f"throughput {total / args.duration:.2f} req/s")
+        print(f"  stalls (health > {args.stall_ms}ms) {sum(s.get('stalls', 0) for s in samples)}, "
+              f"max health latency {max((s.get('health_max_ms', 0) for s in samples), default=0)}ms")
+        rss_growth = None
+        if baseline.get("rss_bytes") and final.get("rss_bytes"):
+            rss_growth = (final["rss_bytes"] - baseline["rss_bytes"]) / 1024 / 1024
+            print(f"  rss {baseline['rss_bytes'] / 1024 / 1024:.0f}M -> {final['rss_bytes'] / 1024 / 1024:.0f}M "
+                  f"({rss_growth:+.0f}M), trend {slope if slope is None else round(slope, 1)} MB/hour")
+            print(f"  open fds {baseline.get('open_fds')} -> {final.get('open_fds')}")
+        leftover = final.get("temp_files", 0) - baseline.get("temp_files", 0)
+        print(f"  leftover temp files {leftover}, registry {baseline.get('registry')} -> {final.get('registry')}, "
+              f"temp used {final.get('temp_used_bytes')}")
+
+        if args.max_error_rate is not None and error_rate > args.max_error_rate:
+            print(f"FAIL: error rate {error_rate * 100:.2f}% exceeds {args.max_error_rate * 100:.2f}%")
+            failed = True
+        if args.max_rss_growth_mb and rss_growth is not None and rss_growth > args.max_rss_growth_mb:
+            print(f"FAIL: rss grew {rss_growth:.0f}MB, limit {args.max_rss_growth_mb}MB")
+            failed = True
+        if leftover > 0 or (final.get("registry") or 0) > (baseline.get("registry") or 0):
+            print("FAIL: temp files left behind after load")
+            failed = True
+    finally:
+        stop.set()
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            # 保留后端日志，删除生成的输入
+            print(f"backend log: {os.path.join(work_dir, 'backend.log')}")
+            for name in os.listdir(work_dir):
+                if name != 'backend.log':
+                    os.remove(os.path.join(work_dir, name))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后端并发负载与浸泡测试")
+    parser.add_argument("--url", default="", help="已运行后端的地址，默认在本机启动一个 uvicorn 进程")
+    parser.add_argument("--workers", type=int, default=1, help="本机启动时的后端 worker 数（大于 1 时使用 serve.py）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发发压线程数")
+    parser.add_argument("--duration", type=float, default=300, help="运行时长（秒），浸泡测试可设为数小时")
+    parser.add_argument("--interval", type=float, default=30, help="统计输出周期（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="场景=权重，逗号分隔")
+    parser.add_argument("--output", default="", help="每个周期的统计追加写入该 JSON Lines 文件")
+    parser.add_argument("--stall-ms", type=float, default=200, help="health 延迟超过该值记为一次卡顿")
+    parser.add_argument("--settle", type=float, default=5, help="发压结束后等待多久再检查遗留（秒）")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="允许的错误率")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=0, help="允许的内存增长（MB），0 表示不检查")
+    sys.exit(run_load(parser.parse_args()))
@@ -0,0 +1,142 @@
+"""
+后端冷启动基准测试
+
+用法（在 backend 目录下执行）:
+    python -m bench.startup --runs 3 --max-health-seconds 3
+
+每轮在新进程中测量：
+- import main 的耗时，以及 -X importtime 统计出的最慢的几个模块
+- import main 后是否意外导入了重量级依赖（rembg、onnxruntime、PIL、pydub、pypdf、numpy 等）
+- 启动 uvicorn 到 /api/health 首次响应的时间（Electron 等待的就是这个接口）
+- 到 /api/ready 返回 200（后台预热完成）的时间
+超过阈值或导入了重量级依赖时以非零状态退出，可作为启动性能的回归检查。
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 不应在 import main 时导入的模块
+HEAVY_MODULES = ('rembg', 'onnxruntime', 'PIL', 'cv2', 'pydub', 'pypdf', 'numpy', 'ffmpeg')
+
+_IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import() -> dict:
+    """在新进程中导入 main，返回耗时与已导入的重量级模块"""
+    result = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(count: int = 8) -> list:
+    """-X importtime 统计的累计耗时最长的顶层模块 [(毫秒, 模块名)]"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, start: float, timeout: float) -> float:
+    """轮询直到 url 返回 200，返回距 start 的秒数"""
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def measure_server(timeout: float) -> dict:
+    """启动 uvicorn，测量到 /api/health 首次响应与 /api/ready 就绪的时间"""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        health = _wait_for(f"http://127.0.0.1:{port}/api/health", start, timeout)
+        ready = _wait_for(f"http://127.0.0.1:{port}/api/ready", start, timeout)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/ready", timeout=2) as response:
+            features = json.loads(response.read())["features"]
+        return {"health": health, "ready": ready, "features": features}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main(args) -> int:
+    print(f"Python {sys.version.split()[0]}, runs: {args.runs}")
+    imports, healths, readies = [], [], []
+    heavy = set()
+    features = {}
+    for run in range(args.runs):
+        probe = measure_import()
+        server = measure_server(args.timeout)
+        imports.append(probe["seconds"])
+        heavy.update(probe["heavy"])
+        healths.append(server["health"])
+        readies.append(server["ready"])
+        features = server["features"]
+        print(f"  run {run + 1}: import {probe['seconds']:.3f}s, health {server['health']:.3f}s, "
+              f"ready {server['ready']:.3f}s")
+
+    print(f"\nimport main:        median {statistics.median(imports):.3f}s")
+    print(f"first /api/health:  median {statistics.median(healths):.3f}s")
+    print(f"/api/ready:         median {statistics.median(readies):.3f}s")
+    print("\nFeature warmup:")
+    for name, state in features.items():
+        print(f"  {name:10s} {state['state']:12s} {state['load_seconds'] or '-'}")
+    print("\nSlowest imports (cumulative ms):")
+    for ms, name in slowest_imports():
+        print(f"  {ms:8.1f}  {name}")
+
+    failed = False
+    if heavy:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(sorted(heavy))}")
+        failed = True
+    if args.max_health_seconds and statistics.median(healths) > args.max_health_seconds:
+        print(f"\nFAIL: first health response {statistics.median(healths):.3f}s "
+              f"exceeds {args.max_health_seconds}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后端冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=3, help="测量轮数，取中位数")
+    parser.add_argument("--max-health-seconds", type=float, default=3.0,
+                        help="首次 health 响应时间上限（秒），0 表示不检查")
+    parser.add_argument("--timeout", type=float, default=60, help="单轮等待上限（秒）")
+    sys.exit(main(parser.parse_args()))
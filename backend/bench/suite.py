@@ -0,0 +1,406 @@
+"""
+后端处理流程微基准测试
+
+用法（在 backend 目录下执行）:
+    python -m bench.suite                      # 运行并与基线比较
+    python -m bench.suite --update             # 运行并写入基线
+    python -m bench.suite --only pdf,audio --sizes small,medium,large
+
+在进程内通过 TestClient 调用各接口（身份证校验与生成直接调用函数），覆盖上传、解析、
+处理、编码与结果返回的完整流程。输入为根目录的样例文件及按 small / medium / large
+生成的合成文件。每个用例先运行一次预热（加载依赖、填充探测缓存），再取多次运行耗时
+的中位数；另跑一次记录内存峰值：
+- peak_bytes：tracemalloc 统计的 Python 分配峰值（跨平台）
+- peak_rss_bytes：常驻内存峰值（仅 Linux，通过 /proc/self/clear_refs 重置后读取 VmHWM）
+ffmpeg 子进程的内存不计入。
+
+结果写入 JSON 基线（默认 bench/baseline.json，与机器相关，应在同一台机器上比较）。
+耗时、内存或输出大小超过基线的阈值比例时以非零状态退出；接口返回 503（依赖未安装、
+模型未下载）的用例记为跳过。
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 预热由用例自己完成，不启动后台预热线程
+os.environ.setdefault('YUNRAN_WARMUP', '')
+# 同一输入重复运行，关闭结果缓存以测量实际处理耗时
+os.environ.setdefault('YUNRAN_RESULT_CACHE_MB', '0')
+logging.disable(logging.INFO)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+SIZES = ('fixture', 'small', 'medium', 'large')
+GROUPS = ('idcard', 'pdf', 'photo', 'audio', 'video')
+
+# 流水线用例：证件照全流程（抠图、换底色、裁成一寸、编码一次），音频裁剪后标准化
+ID_PHOTO_STEPS = json.dumps([
+    {"op": "remove-bg"}, {"op": "change-bg", "color": "#438edb"},
+    {"op": "resize", "width": 295, "height": 413, "mode": "fill"}, {"op": "encode", "format": "jpeg", "dpi": 300},
+])
+AUDIO_PIPELINE_STEPS = json.dumps([
+    {"op": "trim", "start": 1}, {"op": "normalize", "target": -16}, {"op": "encode", "format": "mp3"},
+])
+
+# 阈值以内的差异视为噪声：耗时至少相差 10ms，内存至少相差 1MB
+MIN_TIME_DELTA = 0.01
+MIN_MEMORY_DELTA = 1024 * 1024
+
+
+class Skip(Exception):
+    """用例在当前环境不可运行（依赖或模型缺失）"""
+
+
+class Case:
+    """一个基准用例：run() 执行一次并返回输出字节数"""
+
+    def __init__(self, group: str, name: str, size: str, run: Callable[[], Optional[int]]):
+        self.group = group
+        self.name = name
+        self.size = size
+        self.run = run
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/{self.size}"
+
+
+# ---------- 输入生成 ----------
+
+def ffmpeg(*args: str) -> None:
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def make_wav(path: str, seconds: int) -> str:
+    ffmpeg("-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}", "-ac", "2", "-ar", "44100", path)
+    return path
+
+
+def make_video(path: str, seconds: int, size: str) -> str:
+    ffmpeg("-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+           "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+           "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", "-c:a", "aac", "-shortest", path)
+    return path
+
+
+def make_pdf(path: str, pages: int) -> str:
+    pdf = main.features.get("pdf")
+    writer = pdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def make_image(path: str, side: int) -> str:
+    """渐变背景上的几何图形，接近证件照的大块纯色区域"""
+    from PIL import Image, ImageDraw
+
+    image = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((side, side)),
+        Image.radial_gradient("L").resize((side, side)),
+        Image.linear_gradient("L").rotate(90).resize((side, side)),
+    ])
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((side // 4, side // 8, side * 3 // 4, side * 5 // 8), fill=(230, 190, 160))
+    draw.rectangle((side // 6, side * 5 // 8, side * 5 // 6, side), fill=(40, 40, 80))
+    image.save(path)
+    return path
+
+
+def make_id_cards(count: int) -> List[str]:
+    """生成一半有效、一半校验码错误的身份证号"""
+    rng = random.Random(count)
+    cards = []
+    for i in range(count):
+        card = main.generate_id_card()
+        if i % 2:
+            card = card[:17] + rng.choice([c for c in "0123456789X" if c != card[17]])
+        cards.append(card)
+    return cards
+
+
+# ---------- 用例 ----------
+
+def validate_case(cards: List[str]) -> Callable[[], None]:
+    def run() -> None:
+        for card in cards:
+            main.validate_id_card(card)
+    return run
+
+
+def generate_case(count: int) -> Callable[[], None]:
+    def run() -> None:
+        for _ in range(count):
+            main.generate_id_card()
+    return run
+
+
+def post_case(client: TestClient, path: str, files: List[tuple], data: Optional[dict] = None) -> Callable[[], int]:
+    """构造一个调用接口的用例；files 为 (字段, 文件路径)，文件内容预先读入内存"""
+    payload = [(field, (os.path.basename(p), open(p, "rb").read())) for field, p in files]
+
+    def run() -> int:
+        response = client.post(path, files=payload, data=data or {})
+        if response.status_code == 503:
+            raise Skip(response.json().get("detail", "503"))
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+        result_id = response.headers.get("X-Result-Id")
+        if result_id:
+            main.result_store.remove(result_id)
+        return len(response.content)
+
+    return run
+
+
+def build_cases(client: TestClient, work_dir: str, sizes: List[str], groups: List[str]) -> List[Case]:
+    """生成输入并构造用例，只生成所选分组需要的输入"""
+    cases: List[Case] = []
+    fixture = lambda name: os.path.join(ROOT_DIR, name)  # noqa: E731
+    temp = lambda name: os.path.join(work_dir, name)  # noqa: E731
+
+    # 身份证：纯计算，直接调用函数
+    id_counts = {'small': 1000, 'medium': 10000, 'large': 100000}
+    for size in sizes:
+        if size in id_counts and 'idcard' in groups:
+            cards = make_id_cards(id_counts[size])
+            cases.append(Case('idcard', 'idcard_validate', size, validate_case(cards)))
+            cases.append(Case('idcard', 'idcard_generate', size, generate_case(id_counts[size] // 10)))
+
+    # PDF 合并：文件数 x 页数
+    pdf_inputs = {'small': (2, 5), 'medium': (10, 20), 'large': (50, 40)}
+    if 'pdf' not in groups:
+        pdf_inputs = {}
+    elif 'fixture' in sizes:
+        cases.append(Case('pdf', 'pdf_merge', 'fixture', post_case(
+            client, "/api/pdf/merge", [("files", fixture("test1.pdf")), ("files", fixture("test2.pdf"))])))
+    for size, (count, pages) in pdf_inputs.items():
+        if size in sizes and main.features["pdf"].available():
+            files = [("files", make_pdf(temp(f"{size}_{i}.pdf"), pages)) for i in range(count)]
+            cases.append(Case('pdf', 'pdf_merge', size, post_case(client, "/api/pdf/merge", files)))
+
+    # 抠图 / 换背景：边长
+    image_sides = {'small': 512, 'medium': 1024, 'large': 2048}
+    images = {'fixture': fixture("test_output.png")} if 'fixture' in sizes else {}
+    if 'photo' not in groups:
+        images, image_sides = {}, {}
+    for size, side in image_sides.items():
+        if size in sizes and main.features["photo"].installed():
+            images[size] = make_image(temp(f"{size}.png"), side)
+    for size, image in images.items():
+        cases.append(Case('photo', 'photo_remove_bg', size,
+                          post_case(client, "/api/photo/remove-bg", [("file", image)])))
+        cases.append(Case('photo', 'photo_change_bg', size,
+                          post_case(client, "/api/photo/change-bg", [("file", image)], {"color": "#438edb"})))
+        cases.append(Case('photo', 'photo_pipeline', size,
+                          post_case(client, "/api/pipeline/image", [("files", image)], {"steps": ID_PHOTO_STEPS})))
+
+    # 音频：时长（秒）
+    audio_seconds = {'small': 10, 'medium': 60, 'large': 300}
+    audios = {}
+    if 'audio' not in groups:
+        audio_seconds = {}
+    elif 'fixture' in sizes:
+        audios['fixture'] = fixture("test.wav")
+        audios['fixture_mp3'] = fixture("test_audio.mp3")
+    for size, seconds in audio_seconds.items():
+        if size in sizes and main.FFMPEG_AVAILABLE:
+            audios[size] = make_wav(temp(f"{size}.wav"), seconds)
+    for size, audio in audios.items():
+        target = "wav" if audio.endswith(".mp3") else "mp3"
+        cases.append(Case('audio', f'audio_convert_{target}', size,
+                          post_case(client, "/api/audio/convert", [("file", audio)], {"format": target})))
+        cases.append(Case('audio', 'audio_normalize', size,
+                          post_case(client, "/api/audio/convert", [("file", audio)],
+                                    {"format": "mp3", "normalize": "-16"})))
+        cases.append(Case('audio', 'audio_pipeline', size,
+                          post_case(client, "/api/pipeline/audio", [("files", audio)], {"steps": AUDIO_PIPELINE_STEPS})))
+
+    # 视频：仅换容器（流复制）与缩放转码；时长与分辨率
+    video_inputs = {'small': (2, "320x240"), 'medium': (5, "640x360"), 'large': (10, "1280x720")}
+    for size, (seconds, resolution) in video_inputs.items():
+        if size in sizes and 'video' in groups and main.FFMPEG_AVAILABLE:
+            video = make_video(temp(f"{size}.mkv"), seconds, resolution)
+            cases.append(Case('video', 'video_remux', size,
+                              post_case(client, "/api/video/convert", [("file", video)], {"format": "mp4"})))
+            cases.append(Case('video', 'video_transcode', size,
+                              post_case(client, "/api/video/convert", [("file", video)],
+                                        {"format": "mp4", "resolution": "720p"})))
+    return cases
+
+
+# ---------- 测量 ----------
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> Optional[int]:
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def measure(case: Case, repeat: int) -> dict:
+    """预热一次，取 repeat 次耗时中位数，再单独测一次内存峰值"""
+    output_bytes = case.run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - start)
+
+    rss_supported = _reset_peak_rss()
+    tracemalloc.start()
+    try:
+        case.run()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {
+        "seconds": round(statistics.median(times), 6),
+        "peak_bytes": peak_bytes,
+        "output_bytes": output_bytes,
+    }
+    if rss_supported:
+        result["peak_rss_bytes"] = _peak_rss()
+    return result
+
+
+def compare(current: dict, base: Optional[dict], thresholds: dict) -> List[str]:
+    """返回超出阈值的指标说明，空列表表示未退化"""
+    if not base:
+        return []
+    regressions = []
+    for metric, threshold, floor in (
+        ("seconds", thresholds["time"], MIN_TIME_DELTA),
+        ("peak_bytes", thresholds["memory"], MIN_MEMORY_DELTA),
+        ("peak_rss_bytes", thresholds["memory"], MIN_MEMORY_DELTA),
+        ("output_bytes", thresholds["size"], 0),
+    ):
+        new, old = current.get(metric), base.get(metric)
+        if new is None or old is None:
+            continue
+        if new - old > floor and new > old * (1 + threshold):
+            change = (new / old - 1) * 100 if old else float('inf')
+            regressions.append(f"{metric} +{change:.0f}%")
+    return regressions
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return '-'
+    if value >= 1024 * 1024:
+        return f"{value / 1024 / 1024:.1f}M"
+    return f"{value / 1024:.1f}K"
+
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def run_suite(args) -> int:
+    baseline = load_baseline(args.baseline)
+    base_cases = baseline.get("cases", {})
+    thresholds = {"time": args.time_threshold, "memory": args.memory_threshold, "size": args.size_threshold}
+    if not base_cases and not args.update:
+        print(f"No baseline at {args.baseline}; run with --update to record one.")
+
+    work_dir = tempfile.mkdtemp(prefix="yunran_bench_")
+    results: Dict[str, dict] = {}
+    failed = errors = False
+    try:
+        client = TestClient(main.app)
+        cases = build_cases(client, work_dir, args.sizes, args.groups)
+        if args.cases:
+            cases = [c for c in cases if c.name in args.cases or c.group in args.only]
+        print(f"Python {sys.version.split()[0]}, {platform.platform()}, repeat: {args.repeat}\n")
+        print(f"{'case':<34}{'seconds':>10}{'baseline':>10}{'peak':>9}{'rss':>9}{'output':>9}  status")
+        for case in cases:
+            try:
+                result = measure(case, args.repeat)
+            except Skip as e:
+                print(f"{case.key:<34}{'':>47}  skip ({e})")
+                continue
+            except Exception as e:
+                print(f"{case.key:<34}{'':>47}  ERROR {e}")
+                errors = True
+                continue
+            results[case.key] = result
+            base = base_cases.get(case.key)
+            regressions = compare(result, base, thresholds)
+            status = "REGRESSED " + ", ".join(regressions) if regressions else ("ok" if base else "new")
+            failed = failed or bool(regressions)
+            base_seconds = f"{base['seconds']:.4f}" if base else '-'
+            print(f"{case.key:<34}{result['seconds']:>10.4f}{base_seconds:>10}"
+                  f"{_format_bytes(result['peak_bytes']):>9}{_format_bytes(result.get('peak_rss_bytes')):>9}"
+                  f"{_format_bytes(result['output_bytes']):>9}  {status}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        main.cleanup_all_temp_files()
+
+    if args.update:
+        # 保留本次未运行的用例
+        merged = dict(base_cases)
+        merged.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "cases": dict(sorted(merged.items())),
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline written to {args.baseline} ({len(results)} cases updated)")
+        return 1 if errors else 0
+    return 1 if failed or errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后端处理流程微基准测试")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线 JSON 文件路径")
+    parser.add_argument("--update", action="store_true", help="将本次结果写入基线")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例计时的运行次数（另有一次预热）")
+    parser.add_argument("--sizes", default="fixture,small,medium",
+                        help=f"逗号分隔的输入规模：{','.join(SIZES)}（large 耗时较长，默认不运行）")
+    parser.add_argument("--only", default="", help=f"逗号分隔的分组（{','.join(GROUPS)}）或用例名，默认全部")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="耗时允许增加的比例")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="内存峰值允许增加的比例")
+    parser.add_argument("--size-threshold", type=float, default=0.10, help="输出大小允许增加的比例")
+    args = parser.parse_args()
+    args.sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    args.only = {s.strip() for s in args.only.split(",") if s.strip()}
+    args.cases = args.only - set(GROUPS)
+    # 按用例名筛选时也要生成其所属分组的输入
+    args.groups = [g for g in GROUPS if not args.only or g in args.only
+                   or any(c.startswith(g + '_') for c in args.cases)]
+    sys.exit(run_suite(args))
@@ -0,0 +1,195 @@
+"""
+传输方式基准测试：Unix 域套接字与回环 TCP
+
+用法（在 backend 目录下执行）:
+    python -m bench.transport --requests 2000 --upload-mb 256
+
+分别以 --uds 与 --host/--port 启动 uvicorn，在同一条保持连接上测量：
+- 小请求往返：GET /api/health 的 p50/p95/p99 延迟与每秒请求数
+- 大文件上传吞吐：通过分块上传接口（PUT /api/uploads/{id}）写入 upload-mb 数据，
+  取多轮中最快的一轮（两种方式写盘开销相同，差异来自传输）
+客户端为标准库 http.client，两种方式除连接建立外完全相同；Electron 主进程转发的开销不在此范围内。
+Windows 不支持 AF_UNIX 服务端，只测 TCP。
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB = 1024 * 1024
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """连接 Unix 域套接字的 HTTPConnection"""
+
+    def __init__(self, socket_path: str, timeout: float = 60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Backend:
+    """以指定传输方式启动的 uvicorn 进程"""
+
+    def __init__(self, transport: str, work_dir: str):
+        self.transport = transport
+        if transport == "uds":
+            self.socket_path = os.path.join(work_dir, "backend.sock")
+            listen = ["--uds", self.socket_path]
+        else:
+            self.port = _free_port()
+            listen = ["--host", "127.0.0.1", "--port", str(self.port)]
+        env = dict(os.environ, YUNRAN_WARMUP="")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--log-level", "warning", "--no-access-log"] + listen,
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self.transport == "uds":
+            return UnixHTTPConnection(self.socket_path)
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"backend ({self.transport}) exited with {self.process.returncode}")
+            conn = self.connect()
+            try:
+                conn.request("GET", "/api/health")
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            time.sleep(0.05)
+        raise TimeoutError(f"backend ({self.transport}) not ready after {timeout}s")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _request(conn: http.client.HTTPConnection, method: str, path: str, body=None,
+             headers: Optional[dict] = None) -> bytes:
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    if response.status >= 400:
+        raise RuntimeError(f"{method} {path} -> {response.status}: {data[:200]!r}")
+    return data
+
+
+def measure_round_trips(backend: Backend, count: int, warmup: int = 100) -> dict:
+    """同一连接上顺序发送小请求，返回延迟分位数（毫秒）与吞吐"""
+    conn = backend.connect()
+    try:
+        for _ in range(warmup):
+            _request(conn, "GET", "/api/health")
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(count):
+            t = time.perf_counter()
+            _request(conn, "GET", "/api/health")
+            latencies.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "requests_per_second": count / elapsed,
+    }
+
+
+def measure_upload(backend: Backend, size_mb: int, chunk_mb: int, runs: int) -> dict:
+    """分块上传 size_mb 数据，返回最快一轮的吞吐（MB/s）"""
+    chunk = os.urandom(chunk_mb * MB)
+    size = size_mb * MB
+    best = None
+    for _ in range(runs):
+        conn = backend.connect()
+        try:
+            form = f"filename=bench.bin&size={size}"
+            meta = json.loads(_request(conn, "POST", "/api/uploads", form,
+                                       {"Content-Type": "application/x-www-form-urlencoded"}))
+            upload_id = meta["upload_id"]
+            start = time.perf_counter()
+            for offset in range(0, size, len(chunk)):
+                body = memoryview(chunk)[:min(len(chunk), size - offset)]
+                _request(conn, "PUT", f"/api/uploads/{upload_id}?offset={offset}", body,
+                         {"Content-Type": "application/octet-stream"})
+            elapsed = time.perf_counter() - start
+            _request(conn, "DELETE", f"/api/uploads/{upload_id}")
+        finally:
+            conn.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return {"seconds": best, "mb_per_second": size_mb / best}
+
+
+def main(args) -> int:
+    transports = ["tcp"] if sys.platform == "win32" else ["tcp", "uds"]
+    work_dir = tempfile.mkdtemp(prefix="yunran_transport_")
+    results = {}
+    try:
+        for transport in transports:
+            backend = Backend(transport, work_dir)
+            try:
+                backend.wait_ready()
+                small = measure_round_trips(backend, args.requests)
+                upload = measure_upload(backend, args.upload_mb, args.chunk_mb, args.runs)
+            finally:
+                backend.stop()
+            results[transport] = {**small, "upload_mb_per_second": upload["mb_per_second"]}
+            print(f"{transport:4s}  health p50 {small['p50_ms']:.3f}ms  p95 {small['p95_ms']:.3f}ms  "
+                  f"p99 {small['p99_ms']:.3f}ms  {small['requests_per_second']:.0f} req/s  "
+                  f"upload {upload['mb_per_second']:.0f} MB/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if "uds" in results:
+        tcp, uds = results["tcp"], results["uds"]
+        print(f"\nuds vs tcp: p50 {uds['p50_ms'] / tcp['p50_ms'] - 1:+.1%}, "
+              f"req/s {uds['requests_per_second'] / tcp['requests_per_second'] - 1:+.1%}, "
+              f"upload {uds['upload_mb_per_second'] / tcp['upload_mb_per_second'] - 1:+.1%}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Unix 域套接字与回环 TCP 传输对比")
+    parser.add_argument("--requests", type=int, default=2000, help="小请求往返次数")
+    parser.add_argument("--upload-mb", type=int, default=256, help="上传数据量（MB）")
+    parser.add_argument("--chunk-mb", type=int, default=16, help="每个上传分块的大小（MB），不超过 64")
+    parser.add_argument("--runs", type=int, default=3, help="上传轮数，取最快一轮")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    sys.exit(main(parser.parse_args()))
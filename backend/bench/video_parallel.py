@@ -0,0 +1,90 @@
+"""
+分段并行视频编码基准测试
+
+用法（在 backend 目录下执行）:
+    python -m bench.video_parallel --duration 60 --codec libvpx-vp9 --workers 1,2,4,8
+
+生成合成测试视频（lavfi testsrc2 + sine），先用单个 ffmpeg 进程编码作为基线，
+再按不同并发数运行分段并行编码，输出耗时及相对基线的加速比。
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ffmpeg_runner import run_ffmpeg  # noqa: E402
+from video_parallel import encode_parallel  # noqa: E402
+
+CODEC_ARGS = {
+    'libx264': (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'], ['-c:a', 'aac', '-b:a', '192k'], 'mp4'),
+    'libvpx-vp9': (['-c:v', 'libvpx-vp9', '-crf', '30', '-b:v', '0'], ['-c:a', 'libopus', '-b:a', '128k'], 'webm'),
+}
+
+
+async def make_clip(path: str, duration: int, size: str) -> None:
+    """生成合成测试视频（每 2 秒一个关键帧，便于切分）"""
+    result = await run_ffmpeg([
+        "ffmpeg", "-hide_banner", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", "-c:a", "aac", "-shortest", path
+    ], feature="bench", timeout=3600)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-500:])
+
+
+async def encode_serial(input_path: str, output_path: str, video_args, audio_args) -> None:
+    result = await run_ffmpeg(
+        ["ffmpeg", "-hide_banner", "-y", "-i", input_path] + video_args + audio_args + [output_path],
+        feature="bench", timeout=3600
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-500:])
+
+
+async def main(args) -> None:
+    video_args, audio_args, ext = CODEC_ARGS[args.codec]
+    work_root = tempfile.mkdtemp(prefix="yunran_bench_")
+    try:
+        clip = os.path.join(work_root, "clip.mp4")
+        print(f"Generating {args.duration}s {args.size} test clip...")
+        await make_clip(clip, args.duration, args.size)
+
+        print(f"CPU cores: {os.cpu_count()}, codec: {args.codec}, segment: {args.segment}s")
+        start = time.perf_counter()
+        await encode_serial(clip, os.path.join(work_root, f"serial.{ext}"), video_args, audio_args)
+        baseline = time.perf_counter() - start
+        print(f"{'mode':<16}{'segments':>10}{'seconds':>10}{'speedup':>10}")
+        print(f"{'single process':<16}{'-':>10}{baseline:>10.2f}{1.0:>10.2f}")
+
+        for workers in args.workers:
+            work_dir = os.path.join(work_root, f"segments_{workers}")
+            start = time.perf_counter()
+            segments = await encode_parallel(
+                clip, os.path.join(work_root, f"parallel_{workers}.{ext}"), work_dir,
+                video_args, audio_args, workers=workers, segment_seconds=args.segment, timeout=3600
+            )
+            elapsed = time.perf_counter() - start
+            shutil.rmtree(work_dir, ignore_errors=True)
+            print(f"{f'{workers} workers':<16}{segments:>10}{elapsed:>10.2f}{baseline / elapsed:>10.2f}")
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分段并行视频编码基准测试")
+    parser.add_argument("--duration", type=int, default=60, help="测试视频时长（秒）")
+    parser.add_argument("--size", default="1280x720", help="测试视频分辨率")
+    parser.add_argument("--codec", choices=sorted(CODEC_ARGS), default="libvpx-vp9")
+    parser.add_argument("--segment", type=float, default=10, help="片段时长（秒）")
+    parser.add_argument("--workers", default=",".join(
+        str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})
+    ), help="逗号分隔的并发数列表")
+    args = parser.parse_args()
+    args.workers = [int(n) for n in args.workers.split(",") if n.strip()]
+    asyncio.run(main(args))
@@ -0,0 +1,138 @@
+"""
+功能模块的延迟加载
+
+rembg（连带 onnxruntime、PIL）、pydub、pypdf 等依赖导入较慢，不在启动时导入：
+- 启动时只用 importlib.util.find_spec 判断依赖是否安装（不执行模块代码）
+- 首次使用时加载，或由启动后的后台预热提前加载
+- /api/ready 分别报告每个功能的状态：pending / loading / ready / unavailable / error
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 启动后在后台预热的功能，逗号分隔；设为空字符串则全部按需加载
+WARMUP_FEATURES = os.environ.get('YUNRAN_WARMUP', 'pdf,audio,waveform,photo')
+
+
+class Feature:
+    """一个可延迟加载的功能"""
+
+    def __init__(self, name: str, loader: Callable[[], object], requires: Sequence[str] = (),
+                 unavailable_message: str = ''):
+        self.name = name
+        self.loader = loader
+        self.requires = tuple(requires)
+        self.unavailable_message = unavailable_message or f"{name} 功能不可用"
+        self.state = 'pending'
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._value = None
+        self._lock = threading.Lock()
+        self._installed: Optional[bool] = None
+
+    def installed(self) -> bool:
+        """依赖是否已安装（只查找模块，不导入）"""
+        if self._installed is None:
+            self._installed = all(importlib.util.find_spec(module) is not None for module in self.requires)
+            if not self._installed:
+                self.state = 'unavailable'
+                logger.warning(f"{self.name}: {self.unavailable_message}")
+        return self._installed
+
+    def available(self) -> bool:
+        """是否可用：已安装且加载未失败（未加载时不会触发加载）"""
+        return self.installed() and self.state != 'error'
+
+    def load(self):
+        """加载并返回功能对象，重复调用直接返回；不可用时抛出 503"""
+        if self.state == 'ready':
+            return self._value
+        if not self.installed():
+            raise HTTPException(status_code=503, detail=self.unavailable_message)
+        with self._lock:
+            if self.state == 'pending':
+                self.state = 'loading'
+                start = time.perf_counter()
+                try:
+                    self._value = self.loader()
+                except Exception as e:
+                    self.state = 'error'
+                    self.error = str(e)
+                    logger.error(f"Failed to load feature {self.name}: {e}")
+                else:
+                    self.state = 'ready'
+                    self.load_seconds = round(time.perf_counter() - start, 3)
+                    logger.info(f"Feature {self.name} loaded in {self.load_seconds}s")
+        if self.state != 'ready':
+            raise HTTPException(status_code=503, detail=f"{self.unavailable_message}: {self.error}")
+        return self._value
+
+    def status(self) -> dict:
+        self.installed()
+        return {
+            "state": self.state,
+            "available": self.available(),
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+class FeatureRegistry:
+    """功能注册表"""
+
+    def __init__(self):
+        self._features: Dict[str, Feature] = {}
+        self.warmup_done = False
+
+    def register(self, name: str, loader: Callable[[], object], requires: Sequence[str] = (),
+                 unavailable_message: str = '') -> Feature:
+        feature = Feature(name, loader, requires, unavailable_message)
+        self._features[name] = feature
+        return feature
+
+    def __getitem__(self, name: str) -> Feature:
+        return self._features[name]
+
+    def get(self, name: str):
+        """同步获取（在线程池或同步代码中使用）"""
+        return self._features[name].load()
+
+    async def require(self, name: str):
+        """在请求处理中获取；未加载时在线程池中加载，不阻塞事件循环"""
+        feature = self._features[name]
+        if feature.state == 'ready':
+            return feature.load()
+        return await run_in_threadpool(feature.load)
+
+    def warmup(self, names: Iterable[str]) -> None:
+        """依次加载指定功能（在后台线程中调用），失败只记录不抛出"""
+        try:
+            for name in names:
+                feature = self._features.get(name)
+                if feature is None or not feature.installed():
+                    continue
+                try:
+                    feature.load()
+                except HTTPException:
+                    pass
+        finally:
+            self.warmup_done = True
+
+    def status(self) -> dict:
+        return {name: feature.status() for name, feature in self._features.items()}
+
+    def ready(self) -> bool:
+        """预热已结束且没有功能处于加载中"""
+        return self.warmup_done and all(f.state != 'loading' for f in self._features.values())
+
+
+def warmup_list(value: str = WARMUP_FEATURES) -> list:
+    return [name.strip() for name in value.split(',') if name.strip()]
@@ -0,0 +1,277 @@
+"""
+异步 ffmpeg 执行器
+
+使用 asyncio 子进程运行 ffmpeg/ffprobe，不阻塞事件循环：
+- 通过 -progress 输出解析转换进度，正在运行的任务可通过 active_runs() 查询
+- 客户端断开连接或超时时终止子进程
+- 按功能限制同时运行的进程数，避免转换任务占满 CPU 导致其他接口无响应
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import re
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# 每类功能同时运行的 ffmpeg 进程上限
+FEATURE_CONCURRENCY = {
+    'audio': int(os.environ.get('YUNRAN_AUDIO_CONCURRENCY', '2')),
+    'video': int(os.environ.get('YUNRAN_VIDEO_CONCURRENCY', '1')),
+    'preview': int(os.environ.get('YUNRAN_PREVIEW_CONCURRENCY', '2')),
+    # 分段并行编码的片段进程池
+    'video_segment': int(os.environ.get('YUNRAN_SEGMENT_CONCURRENCY', str(os.cpu_count() or 1))),
+}
+
+# 断开检测与进度刷新间隔（秒）
+POLL_INTERVAL = 0.5
+# 保留的 stderr 尾部长度
+STDERR_TAIL_BYTES = 64 * 1024
+# 子进程输出单行长度上限
+STREAM_LIMIT = 1024 * 1024
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+# 各功能正在排队与占用槽位的数量
+_queued: Dict[str, int] = {}
+_running: Dict[str, int] = {}
+_active_runs: Dict[int, dict] = {}
+_run_ids = itertools.count(1)
+
+_DURATION_RE = re.compile(rb'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+class FFmpegCancelled(Exception):
+    """客户端断开连接，任务已终止"""
+
+
+class FFmpegTimeout(Exception):
+    """执行超时，任务已终止"""
+
+
+class FFmpegResult:
+    """ffmpeg 执行结果；elapsed 为进程实际运行的秒数，不含排队等待槽位的时间"""
+
+    def __init__(self, returncode: int, stdout: bytes, stderr: bytes, elapsed: float = 0.0):
+        self.returncode = returncode
+        self.stdout_bytes = stdout
+        self.stderr_bytes = stderr
+        self.elapsed = elapsed
+
+    @property
+    def stdout(self) -> str:
+        return self.stdout_bytes.decode('utf-8', errors='replace')
+
+    @property
+    def stderr(self) -> str:
+        return self.stderr_bytes.decode('utf-8', errors='replace')
+
+
+def _get_semaphore(feature: str) -> asyncio.Semaphore:
+    if feature not in _semaphores:
+        _semaphores[feature] = asyncio.Semaphore(FEATURE_CONCURRENCY.get(feature, 1))
+    return _semaphores[feature]
+
+
+def slot_usage() -> Dict[str, dict]:
+    """各功能的槽位上限、占用数与排队数"""
+    return {
+        feature: {
+            'limit': FEATURE_CONCURRENCY.get(feature, 1),
+            'running': _running.get(feature, 0),
+            'queued': _queued.get(feature, 0),
+        }
+        for feature in set(FEATURE_CONCURRENCY) | set(_running) | set(_queued)
+    }
+
+
+def active_runs() -> List[dict]:
+    """获取正在运行的 ffmpeg 任务及其进度"""
+    now = time.time()
+    runs = []
+    for run_id, info in _active_runs.items():
+        run = dict(info, id=run_id, elapsed=round(now - info['started'], 2))
+        if info.get('duration') and info.get('out_time') is not None:
+            run['percent'] = round(min(100.0, info['out_time'] / info['duration'] * 100), 1)
+        runs.append(run)
+    return runs
+
+
+async def _is_disconnected(request) -> bool:
+    if request is None:
+        return False
+    try:
+        return await request.is_disconnected()
+    except Exception:
+        return False
+
+
+async def _acquire(semaphore: asyncio.Semaphore, request) -> None:
+    """排队等待执行槽位，排队期间客户端断开则放弃"""
+    while True:
+        try:
+            await asyncio.wait_for(semaphore.acquire(), POLL_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            if await _is_disconnected(request):
+                raise FFmpegCancelled()
+
+
+@contextlib.asynccontextmanager
+async def feature_slot(feature: str, request=None):
+    """
+    占用一个功能槽位
+
+    run_ffmpeg 每次执行都会占用槽位；由多个 ffmpeg 进程组成的任务（如分段并行编码）
+    可用它让整个任务只占一个槽位。
+    """
+    semaphore = _get_semaphore(feature)
+    _queued[feature] = _queued.get(feature, 0) + 1
+    try:
+        with stage(f"{feature}_queue"):
+            await _acquire(semaphore, request)
+    finally:
+        _queued[feature] -= 1
+    _running[feature] = _running.get(feature, 0) + 1
+    try:
+        yield
+    finally:
+        _running[feature] -= 1
+        semaphore.release()
+
+
+async def _kill(process) -> None:
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+def _parse_progress(line: bytes, info: dict) -> None:
+    key, _, value = line.decode('ascii', errors='ignore').strip().partition('=')
+    if key == 'out_time_us' and value.isdigit():
+        info['out_time'] = int(value) / 1_000_000
+    elif key == 'speed' and value.endswith('x'):
+        try:
+            info['speed'] = float(value[:-1])
+        except ValueError:
+            pass
+    elif key == 'progress':
+        info['state'] = value
+
+
+async def run_ffmpeg(cmd: List[str], request=None, feature: str = 'video', timeout: float = 300,
+                     stdout_consumer: Optional[Callable[[bytes], None]] = None,
+                     on_progress: Optional[Callable[[dict], None]] = None) -> FFmpegResult:
+    """
+    异步执行 ffmpeg/ffprobe 命令
+
+    request 为当前 HTTP 请求，客户端断开时终止子进程并抛出 FFmpegCancelled；
+    超过 timeout 秒抛出 FFmpegTimeout。stdout_consumer 用于流式处理 ffmpeg 写到 stdout
+    的数据（此时不解析进度）；否则对 ffmpeg 命令追加 -progress pipe:1 并解析进度。
+    非零退出码不抛异常，由调用方检查 returncode。
+    """
+    use_progress = os.path.basename(cmd[0]) == 'ffmpeg' and stdout_consumer is None
+    if use_progress:
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+
+    stage_name = "ffprobe" if os.path.basename(cmd[0]) == 'ffprobe' else "ffmpeg_run"
+    async with feature_slot(feature, request), stage(stage_name):
+        began = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LIMIT,
+            )
+        except NotImplementedError:
+            # Windows 下 SelectorEventLoop（如 --reload 开发模式）不支持异步子进程
+            return await _run_in_thread(cmd, timeout, stdout_consumer)
+
+        run_id = next(_run_ids)
+        info = {'feature': feature, 'pid': process.pid, 'started': time.time(),
+                'duration': None, 'out_time': None, 'speed': None, 'state': 'starting'}
+        _active_runs[run_id] = info
+        stdout_chunks: List[bytes] = []
+        stderr_tail = bytearray()
+
+        async def read_stdout():
+            if use_progress:
+                async for line in process.stdout:
+                    _parse_progress(line, info)
+                    if on_progress:
+                        on_progress(info)
+            else:
+                while True:
+                    chunk = await process.stdout.read(256 * 1024)
+                    if not chunk:
+                        break
+                    if stdout_consumer:
+                        stdout_consumer(chunk)
+                    else:
+                        stdout_chunks.append(chunk)
+
+        async def read_stderr():
+            async for line in process.stderr:
+                if info['duration'] is None:
+                    match = _DURATION_RE.search(line)
+                    if match:
+                        h, m, sec = match.groups()
+                        info['duration'] = int(h) * 3600 + int(m) * 60 + float(sec)
+                stderr_tail.extend(line)
+                if len(stderr_tail) > STDERR_TAIL_BYTES:
+                    del stderr_tail[:-STDERR_TAIL_BYTES]
+
+        readers = asyncio.ensure_future(asyncio.gather(read_stdout(), read_stderr()))
+        deadline = time.monotonic() + timeout
+        try:
+            while not readers.done():
+                await asyncio.wait({readers}, timeout=POLL_INTERVAL)
+                if readers.done():
+                    break
+                if await _is_disconnected(request):
+                    logger.warning(f"Client disconnected, killing ffmpeg (pid {process.pid})")
+                    raise FFmpegCancelled()
+                if time.monotonic() > deadline:
+                    logger.warning(f"ffmpeg timed out after {timeout}s (pid {process.pid})")
+                    raise FFmpegTimeout()
+            readers.result()
+            await process.wait()
+        except BaseException:
+            # 断开、超时或任务被取消时都要终止子进程
+            readers.cancel()
+            readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+            await _kill(process)
+            raise
+        finally:
+            _active_runs.pop(run_id, None)
+
+        return FFmpegResult(process.returncode, b''.join(stdout_chunks), bytes(stderr_tail),
+                            time.perf_counter() - began)
+
+
+async def _run_in_thread(cmd: List[str], timeout: float,
+                         stdout_consumer: Optional[Callable[[bytes], None]]) -> FFmpegResult:
+    """同步回退：在线程中执行，不支持进度与断开检测"""
+    def run():
+        began = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise FFmpegTimeout()
+        elapsed = time.perf_counter() - began
+        if stdout_consumer and result.stdout:
+            stdout_consumer(result.stdout)
+            return FFmpegResult(result.returncode, b'', result.stderr[-STDERR_TAIL_BYTES:], elapsed)
+        return FFmpegResult(result.returncode, result.stdout, result.stderr[-STDERR_TAIL_BYTES:], elapsed)
+
+    return await asyncio.get_running_loop().run_in_executor(None, run)
@@ -0,0 +1,272 @@
+"""
+HLS 分段输出任务
+
+转换在后台运行，播放列表和分段写入每个任务独立的目录，生成一个即可访问一个，
+前端无需等待整个文件转换完成即可开始播放或下载。
+
+任务状态同时写入任务目录下的 job.json，多 worker 模式下其他进程也能查询；
+其他进程取消任务时写入 cancel 标记，由运行任务的进程终止转换并删除目录。
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from ffmpeg_runner import run_ffmpeg, FFmpegTimeout
+from media_utils import HLS_SEGMENT_TYPES, HLS_MASTER_PLAYLIST
+from shared_state import pid_alive
+
+logger = logging.getLogger(__name__)
+
+# 已结束任务的保留时间（秒）
+JOB_RETENTION_SECONDS = int(os.environ.get('YUNRAN_HLS_RETENTION', '3600'))
+# 单个任务的最长运行时间（秒）
+JOB_TIMEOUT = 3600
+# 进度写入 job.json 的最小间隔与取消标记的检查间隔（秒）
+STATE_INTERVAL = 1.0
+
+JOB_STATE_FILE = 'job.json'
+CANCEL_MARKER = 'cancel'
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# 允许访问的任务文件（相对任务目录）
+_SERVABLE_RE = re.compile(r'^(master\.m3u8|stream_\d+/(index\.m3u8|init(_\d+)?\.mp4|seg_\d{5}\.(m4s|ts)))$')
+
+MEDIA_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.ts': 'video/mp2t',
+    '.mp4': 'video/mp4',
+}
+
+
+class HLSJob:
+    """一个 HLS 转换任务"""
+
+    def __init__(self, job_dir: str, renditions: List[str], segment_type: str):
+        self.id = os.path.basename(job_dir)
+        self.dir = job_dir
+        self.renditions = renditions
+        self.segment_type = segment_type
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.percent: Optional[float] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.pid = os.getpid()
+        self._saved = 0.0
+
+    def save(self, force: bool = True) -> None:
+        """写入 job.json；进度更新时按 STATE_INTERVAL 限频"""
+        now = time.time()
+        if not force and now - self._saved < STATE_INTERVAL:
+            return
+        self._saved = now
+        state = {key: getattr(self, key) for key in (
+            'renditions', 'segment_type', 'status', 'error', 'percent', 'created', 'finished', 'pid')}
+        path = os.path.join(self.dir, JOB_STATE_FILE)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # 任务目录已被删除（取消）
+            pass
+
+    @classmethod
+    def load(cls, job_dir: str) -> Optional['HLSJob']:
+        """从 job.json 读取其他进程的任务（只读快照）"""
+        try:
+            with open(os.path.join(job_dir, JOB_STATE_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(job_dir, state['renditions'], state['segment_type'])
+        for key in ('status', 'error', 'percent', 'created', 'finished', 'pid'):
+            setattr(job, key, state.get(key))
+        return job
+
+    def segment_counts(self) -> List[int]:
+        """各清晰度已生成的分段数"""
+        ext = '.' + HLS_SEGMENT_TYPES[self.segment_type]
+        counts = []
+        for i in range(len(self.renditions)):
+            stream_dir = os.path.join(self.dir, f"stream_{i}")
+            try:
+                counts.append(sum(1 for name in os.listdir(stream_dir) if name.endswith(ext)))
+            except FileNotFoundError:
+                counts.append(0)
+        return counts
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "percent": self.percent,
+            "error": self.error,
+            "renditions": self.renditions,
+            "segment_type": self.segment_type,
+            "segments": self.segment_counts(),
+            "playlist_ready": os.path.exists(os.path.join(self.dir, HLS_MASTER_PLAYLIST)),
+            "playlist": f"/api/video/hls/{self.id}/{HLS_MASTER_PLAYLIST}",
+            "elapsed": round((self.finished or time.time()) - self.created, 2),
+        }
+
+
+_jobs: Dict[str, HLSJob] = {}
+# 清扫任务在线程池中调用 prune_jobs，_jobs 的修改与遍历都需持有该锁
+_jobs_lock = threading.Lock()
+
+
+def new_job_dir(base_dir: str) -> str:
+    """创建任务目录"""
+    job_dir = os.path.join(base_dir, uuid.uuid4().hex)
+    os.makedirs(job_dir)
+    return job_dir
+
+
+def get_job(job_id: str, base_dir: str) -> Optional[HLSJob]:
+    """本进程的任务，或其他 worker 写入 job.json 的任务"""
+    job = _jobs.get(job_id)
+    if job is None and _JOB_ID_RE.match(job_id):
+        job = HLSJob.load(os.path.join(base_dir, job_id))
+    return job
+
+
+def list_jobs() -> List[dict]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return [job.to_dict() for job in jobs]
+
+
+async def _run_job(job: HLSJob, cmd: List[str], input_path: str, ticket=None) -> None:
+    def on_progress(info: dict) -> None:
+        job.status = 'running'
+        if info.get('duration') and info.get('out_time') is not None:
+            job.percent = round(min(100.0, info['out_time'] / info['duration'] * 100), 1)
+        job.save(force=False)
+
+    watcher = asyncio.ensure_future(_watch_cancel(job))
+    try:
+        result = await run_ffmpeg(cmd, None, feature="video", timeout=JOB_TIMEOUT, on_progress=on_progress)
+        if result.returncode == 0:
+            job.status = 'done'
+            job.percent = 100.0
+        else:
+            job.status = 'failed'
+            job.error = result.stderr[-1000:]
+            logger.error(f"HLS job {job.id} failed: {job.error}")
+    except FFmpegTimeout:
+        job.status = 'failed'
+        job.error = "转换超时"
+    except asyncio.CancelledError:
+        job.status = 'cancelled'
+    finally:
+        watcher.cancel()
+        if ticket is not None:
+            ticket.release()
+        job.finished = time.time()
+        job.save()
+        try:
+            os.remove(input_path)
+        except OSError:
+            pass
+        if os.path.exists(os.path.join(job.dir, CANCEL_MARKER)):
+            with _jobs_lock:
+                _jobs.pop(job.id, None)
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+
+async def _watch_cancel(job: HLSJob) -> None:
+    """检查其他 worker 写入的取消标记（排队等待 ffmpeg 槽位期间也有效）"""
+    marker = os.path.join(job.dir, CANCEL_MARKER)
+    while True:
+        await asyncio.sleep(STATE_INTERVAL)
+        if os.path.exists(marker):
+            logger.info(f"HLS job {job.id} cancelled by another worker")
+            job.task.cancel()
+            return
+
+
+def start_job(job_dir: str, input_path: str, cmd: List[str], renditions: List[str],
+              segment_type: str, ticket=None) -> HLSJob:
+    """在后台启动 HLS 转换任务；ticket 为接管的准入，任务结束时归还"""
+    prune_jobs()
+    job = HLSJob(job_dir, renditions, segment_type)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.save()
+    job.task = asyncio.ensure_future(_run_job(job, cmd, input_path, ticket))
+    logger.info(f"HLS job {job.id} started: {renditions} ({segment_type})")
+    return job
+
+
+async def cancel_job(job_id: str, base_dir: str) -> Optional[HLSJob]:
+    """取消任务并删除其输出"""
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job is None:
+        job = get_job(job_id, base_dir)
+        if job is None:
+            return None
+        if job.finished is None:
+            # 由其他 worker 运行：写入取消标记，由该进程终止并删除目录
+            with open(os.path.join(job.dir, CANCEL_MARKER), 'w'):
+                pass
+            job.status = 'cancelled'
+            return job
+        shutil.rmtree(job.dir, ignore_errors=True)
+        return job
+    if job.task and not job.task.done():
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+    shutil.rmtree(job.dir, ignore_errors=True)
+    return job
+
+
+def prune_jobs(base_dir: Optional[str] = None) -> None:
+    """
+    删除超过保留时间的已结束任务
+
+    指定 base_dir 时（清扫任务，在线程池中执行）还按 job.json 删除其他 worker 的过期任务，
+    以及运行进程已退出、不会再结束的任务。
+    """
+    now = time.time()
+    removed = []
+    with _jobs_lock:
+        for job_id, job in list(_jobs.items()):
+            # 后台协程尚未执行完收尾的任务不删除
+            finished = job.finished and (job.task is None or job.task.done())
+            if finished and now - job.finished > JOB_RETENTION_SECONDS:
+                removed.append(_jobs.pop(job_id))
+        local_ids = set(_jobs)
+    for job in removed:
+        shutil.rmtree(job.dir, ignore_errors=True)
+        logger.info(f"HLS job {job.id} expired")
+    if base_dir is None:
+        return
+    for job_id in os.listdir(base_dir):
+        if job_id in local_ids or not _JOB_ID_RE.match(job_id):
+            continue
+        job = HLSJob.load(os.path.join(base_dir, job_id))
+        if job is None:
+            continue
+        expired = job.finished and now - job.finished > JOB_RETENTION_SECONDS
+        if expired or (job.finished is None and not pid_alive(job.pid)):
+            shutil.rmtree(job.dir, ignore_errors=True)
+            logger.info(f"HLS job {job_id} expired")
+
+
+def resolve_job_file(job: HLSJob, rel_path: str) -> Optional[str]:
+    """将请求路径解析为任务目录下的文件，不允许的路径或尚未生成的文件返回 None"""
+    if not _SERVABLE_RE.match(rel_path):
+        return None
+    path = os.path.join(job.dir, *rel_path.split('/'))
+    return path if os.path.isfile(path) else None
@@ -1,14 +1,24 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import os
 import io
 import re
 import random
 import atexit
+import asyncio
+import functools
+import json
+import math
+import operator
 import shutil
-from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+import zipfile
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 import logging
 
@@ -19,19 +29,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 图像处理
-try:
-    from rembg import remove
-    from PIL import Image
-    REMBG_AVAILABLE = True
-except ImportError:
-    REMBG_AVAILABLE = False
-    logger.warning("rembg or PIL not available, photo tools will be disabled")
+# 功能模块延迟加载：rembg（连带 onnxruntime）、pydub、pypdf 等导入较慢，
+# 启动时只检查是否安装，首次使用或后台预热时才导入
+from types import SimpleNamespace
+from features import FeatureRegistry, warmup_list
+
+features = FeatureRegistry()
 
 # 检查 rembg 模型是否存在
 def check_rembg_model():
     """检查 rembg 模型是否已下载"""
-    import os
     # rembg 模型通常存储在用户目录下的 .u2net 文件夹
     home_dir = os.path.expanduser('~')
     model_paths = [
@@ -51,46 +58,100 @@ def check_rembg_model():
     
     return False, None
 
-REMBG_MODEL_AVAILABLE, REMBG_MODEL_PATH = check_rembg_model()
-if REMBG_AVAILABLE and not REMBG_MODEL_AVAILABLE:
-    logger.warning("rembg model not found, background removal will download model on first use")
+def load_photo_feature():
+    """图像处理：导入 rembg 与 PIL；模型已下载时同时创建推理会话"""
+    from rembg import remove, new_session
+    from PIL import Image
+    photo = SimpleNamespace(remove=remove, new_session=new_session, Image=Image, session=None,
+                            session_lock=threading.Lock())
+    if check_rembg_model()[0]:
+        photo.session = new_session()
+    return photo
+
+def get_rembg_session(photo):
+    """rembg 推理会话只创建一次（不传 session 时每次调用都会重新加载模型）"""
+    if photo.session is None:
+        with photo.session_lock:
+            if photo.session is None:
+                photo.session = photo.new_session()
+    return photo.session
 
-# PDF处理
-try:
+def load_image_feature():
+    """流水线中不需要抠图的图像步骤只依赖 PIL"""
+    from PIL import Image
+    return Image
+
+def load_pdf_feature():
     from pypdf import PdfWriter, PdfReader
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    logger.warning("pypdf not available, PDF tools will be disabled")
+    return SimpleNamespace(PdfWriter=PdfWriter, PdfReader=PdfReader)
 
-# 音频处理
-try:
+def load_audio_feature():
     from pydub import AudioSegment
-    AUDIO_AVAILABLE = True
-except ImportError:
-    AUDIO_AVAILABLE = False
-    logger.warning("pydub not available, audio tools will be disabled")
+    return AudioSegment
+
+def load_waveform_feature():
+    import numpy
+    return numpy
+
+features.register("photo", load_photo_feature, ("rembg", "PIL"), "图像处理功能不可用，请安装rembg和Pillow")
+features.register("image", load_image_feature, ("PIL",), "图像处理功能不可用，请安装Pillow")
+features.register("pdf", load_pdf_feature, ("pypdf",), "PDF处理功能不可用，请安装pypdf")
+features.register("audio", load_audio_feature, ("pydub",), "音频处理功能不可用，请安装pydub")
+features.register("waveform", load_waveform_feature, ("numpy",), "波形功能不可用，请安装numpy")
 
 # 检查 ffmpeg 是否安装
 def check_ffmpeg():
-    """检查 ffmpeg 是否已安装"""
-    try:
-        import subprocess
-        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    """检查 ffmpeg 是否已安装（只查找可执行文件，避免启动时运行子进程）"""
+    return shutil.which('ffmpeg') is not None
 
 FFMPEG_AVAILABLE = check_ffmpeg()
 if not FFMPEG_AVAILABLE:
     logger.warning("ffmpeg not found in PATH, audio conversion will not work properly")
 
+# ffprobe 用于探测输入流，缺失时转换会退回到全量转码
+FFPROBE_AVAILABLE = shutil.which('ffprobe') is not None
+if not FFPROBE_AVAILABLE:
+    logger.warning("ffprobe not found in PATH, stream copy planning will be disabled")
+
 app = FastAPI(
     title="云褍实用工具 API",
     description="Electron + React + Python FastAPI 后端服务",
     version="1.0.0"
 )
 
+# 临时文件目录
+TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+logger.info(f"Temp directory: {TEMP_DIR}")
+
+# 临时空间配额：按上传大小预留空间，缓存与结果按 LRU 淘汰
+from temp_store import TempStore, QuotaMiddleware, SWEEP_INTERVAL
+
+temp_store = TempStore(TEMP_DIR)
+app.add_middleware(QuotaMiddleware, store=temp_store)
+
+# 按需性能分析：X-Profile 请求头或 /api/profiles/arm 开启，在准入之后、处理之前开始采样
+from profiling import Profiler, ProfilingMiddleware, FILE_KINDS as PROFILE_FILE_KINDS, MODES as PROFILE_MODES
+
+profiler = Profiler(os.path.join(TEMP_DIR, "profiles"))
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# 准入控制：重负载接口按功能限制并发与内存预算，超出时排队或返回 429
+from admission import AdmissionController, AdmissionMiddleware, take_ticket
+
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# 上传大小限制：Content-Length 超限时在读取请求体之前拒绝
+from uploads import UploadLimitMiddleware, SavedUpload, receive_upload, MB
+
+app.add_middleware(UploadLimitMiddleware)
+
+# 运行指标：按路由记录请求耗时，供 /api/metrics 抓取
+from metrics import MetricsMiddleware, REGISTRY as METRICS_REGISTRY, stage
+
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -98,49 +159,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 允许前端读取断点续传与转换信息相关的响应头
+    expose_headers=[
+        "Content-Disposition", "Content-Range", "Accept-Ranges", "ETag",
+        "X-Result-Id", "X-Conversion-Plan", "X-Parallel-Segments",
+        "X-Encode-Preset", "X-Estimated-Seconds", "Retry-After", "X-Profile-Id", "X-Cache",
+        "X-Pipeline-Timings",
+    ],
 )
 
-# 临时文件目录
-TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp")
-os.makedirs(TEMP_DIR, exist_ok=True)
-logger.info(f"Temp directory: {TEMP_DIR}")
 
-# 注册临时文件列表，用于清理
-temp_files_registry = set()
+# 注册临时文件列表，用于清理；多 worker 模式下另存放在 SQLite 中由各进程共享（后台线程写入）
+from shared_state import TempFileRegistry, LeaderLock, WORKER_COUNT
+
+STATE_DIR = os.path.join(TEMP_DIR, "state")
+os.makedirs(STATE_DIR, exist_ok=True)
+temp_files_registry = TempFileRegistry(os.path.join(STATE_DIR, "temp_files.sqlite3"), shared=WORKER_COUNT > 1)
 
 def register_temp_file(filepath: str):
     """注册临时文件以便清理"""
     temp_files_registry.add(filepath)
 
+def temp_stamp() -> str:
+    """临时文件名中的时间戳，附加随机后缀，避免同一秒内的并发请求使用相同路径"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
 def cleanup_temp_file(filepath: str):
     """清理单个临时文件"""
     try:
+        temp_files_registry.discard(filepath)
         if os.path.exists(filepath):
             os.remove(filepath)
-            temp_files_registry.discard(filepath)
             logger.debug(f"Cleaned up temp file: {filepath}")
     except Exception as e:
         logger.error(f"Failed to cleanup temp file {filepath}: {e}")
 
+def cleanup_orphaned_temp_files():
+    """清理已退出进程（异常退出的 worker）登记的临时文件"""
+    for filepath in temp_files_registry.orphaned():
+        cleanup_temp_file(filepath)
+
 def cleanup_all_temp_files():
-    """清理所有注册的临时文件"""
-    logger.info(f"Cleaning up {len(temp_files_registry)} temp files...")
-    for filepath in list(temp_files_registry):
+    """清理本进程注册的临时文件（其他 worker 的文件可能仍在使用）"""
+    owned = temp_files_registry.owned()
+    logger.info(f"Cleaning up {len(owned)} temp files...")
+    for filepath in owned:
         cleanup_temp_file(filepath)
+    cleanup_orphaned_temp_files()
     # 额外清理temp目录中超过1小时的文件
     cleanup_old_temp_files()
+    result_store.prune()
+    # worker 退出前确保登记表的删除已写入
+    temp_files_registry.flush()
 
 def cleanup_old_temp_files(max_age_hours: int = 1):
-    """清理超过指定时间的临时文件"""
+    """清理超过指定时间的临时文件（含异常退出遗留的分段编码目录）"""
     try:
         current_time = datetime.now()
         for filename in os.listdir(TEMP_DIR):
             filepath = os.path.join(TEMP_DIR, filename)
-            if os.path.isfile(filepath):
+            is_work_dir = os.path.isdir(filepath) and filename.startswith("video_segments_")
+            if os.path.isfile(filepath) or is_work_dir:
                 file_time = datetime.fromtimestamp(os.path.getctime(filepath))
                 if (current_time - file_time).total_seconds() > max_age_hours * 3600:
                     try:
-                        os.remove(filepath)
+                        if is_work_dir:
+                            shutil.rmtree(filepath)
+                        else:
+                            os.remove(filepath)
+                        temp_files_registry.discard(filepath)
                         logger.debug(f"Cleaned up old temp file: {filepath}")
                     except Exception as e:
                         logger.error(f"Failed to cleanup old temp file {filepath}: {e}")
@@ -150,6 +237,89 @@ def cleanup_old_temp_files(max_age_hours: int = 1):
 # 注册退出时的清理函数
 atexit.register(cleanup_all_temp_files)
 
+# 内容哈希缓存目录（按输入内容的 sha256 存放可复用的分析结果）
+CACHE_DIR = os.path.join(TEMP_DIR, "cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+def get_cache_path(kind: str, key: str, ext: str) -> str:
+    """获取缓存文件路径，按类型和内容哈希分目录存放；已存在时标记为最近使用"""
+    path = temp_store.content_path(kind, key, ext)
+    if os.path.exists(path):
+        temp_store.touch(path)
+    return path
+
+# 转换结果目录：产物直接从磁盘返回（支持 Range），保留一段时间供续传
+from results import ResultStore
+
+RESULTS_DIR = os.path.join(TEMP_DIR, "results")
+result_store = ResultStore(RESULTS_DIR)
+
+# 可续传的分块上传，完成后以 upload_id 代替文件字段提交
+from resumable import ResumableUploads
+
+UPLOADS_DIR = os.path.join(TEMP_DIR, "uploads")
+resumable_uploads = ResumableUploads(UPLOADS_DIR)
+
+async def save_upload(file: Optional[UploadFile], max_mb: int, categories: Optional[set] = None,
+                      dest_dir: Optional[str] = TEMP_DIR, prefix: str = "upload",
+                      upload_id: str = "") -> SavedUpload:
+    """
+    接收上传文件并流式写入 dest_dir（登记为临时文件），同时计算内容哈希
+
+    dest_dir 为 None 时不落盘，直接使用上传缓冲（适合按文件对象处理的小文件）。
+    upload_id 不为空时使用已完成的分块上传代替 file，dest_dir 中得到的是数据文件的硬链接。
+    """
+    with stage("upload"):
+        if upload_id:
+            upload = await run_in_threadpool(
+                resumable_uploads.saved_upload, upload_id, max_mb * MB, categories, dest_dir, prefix
+            )
+        elif file is None:
+            raise HTTPException(status_code=400, detail="未选择文件")
+        else:
+            upload = await receive_upload(file, max_mb * MB, categories, dest_dir, prefix)
+    if dest_dir is not None:
+        register_temp_file(upload.path)
+    return upload
+
+def store_result(path: str, media_type: str, filename: str) -> dict:
+    """将转换产物移入结果目录，返回结果元数据"""
+    result = result_store.add(path, media_type, filename)
+    temp_files_registry.discard(path)
+    return result
+
+# 转换结果缓存：相同内容与参数的重复转换直接返回上次的产物
+from result_cache import ResultCache, cache_key, link_or_copy
+
+result_cache = ResultCache(temp_store)
+
+def cached_result(operation: str, key: str, request: Request):
+    """结果缓存命中时返回文件响应（X-Cache: hit），否则返回 None"""
+    hit = result_cache.get(operation, key)
+    if hit is None:
+        return None
+    cached_path, meta = hit
+    link_path = os.path.join(TEMP_DIR, f"cached_{temp_stamp()}.{meta['ext']}")
+    register_temp_file(link_path)
+    try:
+        link_or_copy(cached_path, link_path)
+        result = store_result(link_path, meta["media_type"], meta["filename"])
+    except OSError as e:
+        # 读取期间被淘汰，按未命中处理
+        logger.warning(f"Failed to serve cached result {key}: {e}")
+        return None
+    finally:
+        cleanup_temp_file(link_path)
+    return result_store.response(result, request, dict(meta["headers"], **{"X-Cache": "hit"}))
+
+async def store_and_cache_result(key: str, path: str, media_type: str, filename: str,
+                                 request: Request, headers: Optional[dict] = None):
+    """缓存转换产物（硬链接）并移入结果目录，返回文件响应（X-Cache: miss）"""
+    # 写入缓存后会按上限遍历淘汰，放到线程池中执行
+    await run_in_threadpool(result_cache.put, key, path, media_type, filename, headers)
+    result = store_result(path, media_type, filename)
+    return result_store.response(result, request, dict(headers or {}, **{"X-Cache": "miss"}))
+
 # ==================== 身份证工具 API ====================
 
 # 导入省市级联数据
@@ -158,8 +328,15 @@ from area_codes import AREA_CODES_HIERARCHY, AREA_CODES, get_all_city_codes, get
 WEIGHTS = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
 CHECK_CODES = ['1', '0', 'X', '9', '8', '7', '6', '5', '4', '3', '2']
 
+# 各位数字按 ASCII 码加权求和后需减去的偏移（'0' 的码值为 48）
+WEIGHT_OFFSET = 48 * sum(WEIGHTS)
+
 def calculate_check_code(id17: str) -> str:
     """计算身份证校验码"""
+    head = id17[:17]
+    if len(head) == 17 and head.isascii() and head.isdigit():
+        # 直接用字节值加权求和，不逐位转换为 int
+        return CHECK_CODES[(sum(map(operator.mul, head.encode(), WEIGHTS)) - WEIGHT_OFFSET) % 11]
     try:
         sum_val = sum(int(id17[i]) * WEIGHTS[i] for i in range(17))
         return CHECK_CODES[sum_val % 11]
@@ -167,14 +344,40 @@ def calculate_check_code(id17: str) -> str:
         logger.error(f"Error calculating check code: {e}")
         raise ValueError(f"Invalid ID format: {e}")
 
+# 身份证号格式：17 位数字 + 数字或 X
+ID_CARD_PATTERN = re.compile(r'^\d{17}[\dX]$')
+# 最近的校验结果（前端输入时会反复校验同一号码），按当天日期区分，跨天后自然失效
+VALIDATE_CACHE_SIZE = 4096
+
+class _Today:
+    """当天日期，跨过午夜时才重新获取，避免每次校验都调用 datetime.now()"""
+
+    def __init__(self):
+        self.date = None
+        self.expires = 0.0
+
+    def get(self) -> date:
+        now = time.time()
+        if now >= self.expires:
+            self.date = date.today()
+            self.expires = datetime.combine(self.date + timedelta(days=1), datetime.min.time()).timestamp()
+        return self.date
+
+today_cache = _Today()
+
 def validate_id_card(id_card: str) -> dict:
-    """验证身份证号码"""
+    """验证身份证号码（结果按号码与当天日期缓存，返回副本）"""
     id_card = id_card.strip().upper()
     
+    # 输入过程中的大部分请求长度不足，不经过缓存
     if len(id_card) != 18:
         return {"valid": False, "message": "身份证号码长度必须为18位"}
     
-    if not re.match(r'^\d{17}[\dX]$', id_card):
+    return dict(_validate_id_card(id_card, today_cache.get()))
+
+@functools.lru_cache(maxsize=VALIDATE_CACHE_SIZE)
+def _validate_id_card(id_card: str, today_date: date) -> dict:
+    if not ID_CARD_PATTERN.match(id_card):
         return {"valid": False, "message": "身份证号码格式错误"}
     
     # 地区码验证
@@ -182,17 +385,14 @@ def validate_id_card(id_card: str) -> dict:
     if area_code not in AREA_CODES:
         return {"valid": False, "message": "地区码无效"}
     
-    # 出生日期验证
+    # 出生日期验证（date 构造时检查月、日是否有效）
     try:
         year = int(id_card[6:10])
         month = int(id_card[10:12])
         day = int(id_card[12:14])
-        birth_date = datetime(year, month, day)
-        if birth_date > datetime.now():
+        birth_date = date(year, month, day)
+        if birth_date > today_date:
             return {"valid": False, "message": "出生日期不能是未来日期"}
-        # 检查日期是否有效
-        if month < 1 or month > 12 or day < 1 or day > 31:
-            return {"valid": False, "message": "出生日期无效"}
     except ValueError as e:
         return {"valid": False, "message": f"出生日期无效: {str(e)}"}
     
@@ -209,7 +409,7 @@ def validate_id_card(id_card: str) -> dict:
     gender = "男" if gender_code % 2 == 1 else "女"
     
     # 年龄
-    age = datetime.now().year - year
+    age = today_date.year - year
     
     return {
         "valid": True,
@@ -222,24 +422,38 @@ def validate_id_card(id_card: str) -> dict:
         "constellation": get_constellation(month, day)
     }
 
+ZODIAC_ANIMALS = ('猴', '鸡', '狗', '猪', '鼠', '牛', '虎', '兔', '龙', '蛇', '马', '羊')
+
 def get_zodiac(year: int) -> str:
     """获取生肖"""
-    animals = ['猴', '鸡', '狗', '猪', '鼠', '牛', '虎', '兔', '龙', '蛇', '马', '羊']
-    return animals[year % 12]
+    return ZODIAC_ANIMALS[year % 12]
 
-def get_constellation(month: int, day: int) -> str:
-    """获取星座"""
-    constellations = [
-        (1, 20, "水瓶座"), (2, 19, "双鱼座"), (3, 21, "白羊座"),
-        (4, 20, "金牛座"), (5, 21, "双子座"), (6, 22, "巨蟹座"),
-        (7, 23, "狮子座"), (8, 23, "处女座"), (9, 23, "天秤座"),
-        (10, 24, "天蝎座"), (11, 23, "射手座"), (12, 22, "摩羯座")
-    ]
-    for m, d, name in constellations:
+# 各星座的起始日期 (月, 日, 星座)
+CONSTELLATIONS = (
+    (1, 20, "水瓶座"), (2, 19, "双鱼座"), (3, 21, "白羊座"),
+    (4, 20, "金牛座"), (5, 21, "双子座"), (6, 22, "巨蟹座"),
+    (7, 23, "狮子座"), (8, 23, "处女座"), (9, 23, "天秤座"),
+    (10, 24, "天蝎座"), (11, 23, "射手座"), (12, 22, "摩羯座")
+)
+
+def find_constellation(month: int, day: int) -> str:
+    """按起始日期查找星座"""
+    for m, d, name in CONSTELLATIONS:
         if (month == m and day >= d) or (month == (m % 12 + 1) and day < d):
             return name
     return "摩羯座"
 
+# 预先计算的 (月, 日) -> 星座，下标为 月 * 32 + 日
+CONSTELLATION_TABLE = tuple(
+    find_constellation(index // 32, index % 32) for index in range(13 * 32)
+)
+
+def get_constellation(month: int, day: int) -> str:
+    """获取星座"""
+    if 1 <= month <= 12 and 1 <= day <= 31:
+        return CONSTELLATION_TABLE[month * 32 + day]
+    return find_constellation(month, day)
+
 def generate_id_card(area_code: str = None, birth_date: str = None, gender: str = None) -> str:
     """生成身份证号码"""
     logger.info(f"Generating ID card with area_code={area_code}, birth_date={birth_date}, gender={gender}")
@@ -373,80 +587,81 @@ async def api_get_areas():
 # ==================== PDF合并 API ====================
 
 @app.post("/api/pdf/merge")
-async def api_merge_pdf(files: List[UploadFile] = File(...)):
-    """合并PDF文件"""
-    logger.info(f"PDF merge request received, files count: {len(files)}")
+async def api_merge_pdf(
+    request: Request,
+    files: List[UploadFile] = File(None),
+    upload_ids: str = Form("")
+):
+    """
+    合并PDF文件
+
+    upload_ids 为逗号分隔的分块上传 ID（见 /api/uploads），排在 files 之后合并。
+    """
+    sources = [(file, "") for file in files or []]
+    sources += [(None, upload_id.strip()) for upload_id in upload_ids.split(',') if upload_id.strip()]
+    logger.info(f"PDF merge request received, files count: {len(sources)}")
     
-    if not PDF_AVAILABLE:
-        raise HTTPException(status_code=503, detail="PDF处理功能不可用，请安装pypdf")
+    pdf = await features.require("pdf")
     
-    if len(files) < 1:
+    if len(sources) < 1:
         raise HTTPException(status_code=400, detail="至少需要1个PDF文件")
     
-    if len(files) > 50:
+    if len(sources) > 50:
         raise HTTPException(status_code=400, detail="最多支持50个PDF文件")
     
-    writer = PdfWriter()
-    temp_files = []
+    writer = pdf.PdfWriter()
+    added_count = 0
     output_path = None
+    streams = []
     
     try:
-        for idx, file in enumerate(files):
-            logger.info(f"Processing file {idx}: {file.filename}")
+        uploads = []
+        for idx, (file, upload_id) in enumerate(sources):
+            logger.info(f"Processing file {idx}: {file.filename if file else upload_id}")
             
-            if not file.filename:
+            if file and not file.filename:
                 logger.warning(f"File {idx} has no filename, skipping")
                 continue
-            if not file.filename.lower().endswith('.pdf'):
-                logger.warning(f"File {file.filename} is not a PDF, skipping")
-                continue
-            
-            # 读取文件内容
-            try:
-                content = await file.read()
-                logger.info(f"File {file.filename} size: {len(content)} bytes")
-            except Exception as e:
-                logger.error(f"Error reading file {file.filename}: {e}")
-                raise HTTPException(status_code=400, detail=f"读取文件失败: {file.filename}")
-            
-            # 限制单个文件大小 (50MB)
-            if len(content) > 50 * 1024 * 1024:
-                raise HTTPException(status_code=400, detail=f"文件 {file.filename} 超过50MB限制")
-            
-            # 保存临时文件
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            temp_filename = f"temp_{timestamp}_{idx}_{file.filename}"
-            temp_path = os.path.join(TEMP_DIR, temp_filename)
-            
-            try:
-                with open(temp_path, "wb") as f:
-                    f.write(content)
-                temp_files.append(temp_path)
-                register_temp_file(temp_path)
-                logger.info(f"Saved temp file: {temp_path}")
-            except Exception as e:
-                logger.error(f"Error saving temp file {temp_path}: {e}")
-                raise HTTPException(status_code=500, detail=f"保存文件失败: {file.filename}")
             
-            # 添加到 writer
+            # 校验大小并识别类型（单个文件限制 50MB），直接使用上传缓冲，不复制到内存
+            upload = await save_upload(file, 50, dest_dir=None, upload_id=upload_id)
+            logger.info(f"File {upload.filename} size: {upload.size} bytes")
+            if upload.kind != 'pdf':
+                logger.warning(f"File {upload.filename} is not a PDF, skipping")
+                continue
+            uploads.append(upload)
+        
+        # 同一组文件（按内容与顺序）合并过时直接返回
+        key = cache_key("pdf_merge", {}, [upload.sha256 for upload in uploads])
+        if uploads:
+            cached = cached_result("pdf_merge", key, request)
+            if cached is not None:
+                return cached
+        
+        for upload in uploads:
+            # 添加到 writer（页面在写出时才读取，文件保持打开到合并结束）
             try:
-                reader = PdfReader(temp_path)
-                for page in reader.pages:
-                    writer.add_page(page)
-                logger.info(f"Added {file.filename} to writer")
+                stream = upload.open()
+                streams.append(stream)
+                with stage("parse"):
+                    reader = pdf.PdfReader(stream)
+                    for page in reader.pages:
+                        writer.add_page(page)
+                added_count += 1
+                logger.info(f"Added {upload.filename} to writer")
             except Exception as e:
-                logger.error(f"Error adding {file.filename} to writer: {e}")
-                raise HTTPException(status_code=400, detail=f"无效的PDF文件: {file.filename}")
+                logger.error(f"Error adding {upload.filename} to writer: {e}")
+                raise HTTPException(status_code=400, detail=f"无效的PDF文件: {upload.filename}")
         
-        if len(temp_files) == 0:
+        if added_count == 0:
             raise HTTPException(status_code=400, detail="没有有效的PDF文件")
         
         # 生成输出文件
-        output_filename = f"merged_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+        output_filename = f"merged_{temp_stamp()}.pdf"
         output_path = os.path.join(TEMP_DIR, output_filename)
         
         try:
-            with open(output_path, "wb") as f:
+            with stage("write"), open(output_path, "wb") as f:
                 writer.write(f)
             register_temp_file(output_path)
             logger.info(f"Merged PDF saved to: {output_path}")
@@ -454,147 +669,132 @@ async def api_merge_pdf(files: List[UploadFile] = File(...)):
             logger.error(f"Error writing merged PDF: {e}")
             raise HTTPException(status_code=500, detail=f"合并PDF失败: {str(e)}")
         
-        # 读取文件并返回
-        try:
-            with open(output_path, "rb") as f:
-                file_content = f.read()
-            logger.info(f"Returning merged PDF, size: {len(file_content)} bytes")
-        except Exception as e:
-            logger.error(f"Error reading merged PDF: {e}")
-            raise HTTPException(status_code=500, detail="读取合并后的文件失败")
-        
-        # 清理临时文件
-        for temp_file in temp_files:
-            cleanup_temp_file(temp_file)
-        cleanup_temp_file(output_path)
-        
-        return StreamingResponse(
-            io.BytesIO(file_content),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=merged.pdf"}
-        )
+        # 移入结果目录，直接从磁盘返回
+        logger.info(f"Returning merged PDF, size: {os.path.getsize(output_path)} bytes")
+        return await store_and_cache_result(key, output_path, "application/pdf", "merged.pdf", request)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error merging PDF: {e}")
-        # 清理临时文件
-        for temp_file in temp_files:
-            cleanup_temp_file(temp_file)
         if output_path:
             cleanup_temp_file(output_path)
         raise HTTPException(status_code=500, detail=f"合并失败: {str(e)}")
+    finally:
+        for stream in streams:
+            stream.close()
 
 # ==================== 证件照抠图 API ====================
 
+from pipeline import parse_color
+
+# 支持的证件照格式（按文件头识别）
+PHOTO_KINDS = {'jpg', 'png', 'bmp', 'webp'}
+
 @app.post("/api/photo/remove-bg")
-async def api_remove_background(file: UploadFile = File(...)):
+async def api_remove_background(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form("")
+):
     """移除图片背景"""
-    if not REMBG_AVAILABLE:
-        raise HTTPException(status_code=503, detail="图像处理功能不可用，请安装rembg和Pillow")
+    photo = await features.require("photo")
     
     # 检查模型是否可用
-    if not REMBG_MODEL_AVAILABLE:
+    if not check_rembg_model()[0]:
         raise HTTPException(
             status_code=503, 
             detail="AI模型未下载。首次使用需要下载176MB模型文件，请检查网络连接或手动下载模型到 ~/.u2net/u2net.onnx"
         )
     
+    output_path = None
     try:
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="未选择文件")
-        
-        # 检查文件类型
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-        file_ext = os.path.splitext(file.filename.lower())[1]
-        if file_ext not in allowed_extensions:
-            raise HTTPException(status_code=400, detail=f"不支持的文件格式: {file_ext}")
+        # 限制文件大小 (20MB)，按文件头检查类型，直接从上传缓冲解码
+        upload = await save_upload(file, 20, {'image'}, dest_dir=None, upload_id=upload_id)
+        if upload.kind not in PHOTO_KINDS:
+            raise HTTPException(status_code=400, detail=f"不支持的文件格式: {upload.ext}")
         
-        image_data = await file.read()
+        # 同一张图片抠过时直接返回上次的结果，不再推理
+        key = cache_key("remove_bg", {}, [upload.sha256])
+        cached = cached_result("remove_bg", key, request)
+        if cached is not None:
+            return cached
         
-        # 限制文件大小 (20MB)
-        if len(image_data) > 20 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="文件大小超过20MB限制")
-        
-        input_image = Image.open(io.BytesIO(image_data))
-        
-        # 转换为RGBA模式
-        if input_image.mode != 'RGBA':
-            input_image = input_image.convert('RGBA')
+        with stage("decode"), upload.open() as stream:
+            input_image = photo.Image.open(stream)
+            input_image.load()
+            
+            # 转换为RGBA模式
+            if input_image.mode != 'RGBA':
+                input_image = input_image.convert('RGBA')
         
         # 使用rembg移除背景
-        output_image = remove(input_image)
+        with stage("infer"):
+            output_image = photo.remove(input_image, session=get_rembg_session(photo))
         
-        # 保存到内存
-        output_buffer = io.BytesIO()
-        output_image.save(output_buffer, format="PNG")
-        output_buffer.seek(0)
-        
-        return StreamingResponse(output_buffer, media_type="image/png")
+        # 写入结果目录，与缓存命中时一样从磁盘返回（支持 Range 与 X-Result-Id）
+        output_path = os.path.join(TEMP_DIR, f"no_bg_{temp_stamp()}.png")
+        register_temp_file(output_path)
+        with stage("encode"):
+            output_image.save(output_path, format="PNG")
+        return await store_and_cache_result(key, output_path, "image/png", "no_bg.png", request)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error removing background: {e}")
+        if output_path:
+            cleanup_temp_file(output_path)
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 @app.post("/api/photo/change-bg")
 async def api_change_background(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
     color: str = Form("#ffffff")
 ):
     """更换证件照背景色"""
-    if not REMBG_AVAILABLE:
-        raise HTTPException(status_code=503, detail="图像处理功能不可用，请安装rembg和Pillow")
+    photo = await features.require("photo")
     
     # 检查模型是否可用
-    if not REMBG_MODEL_AVAILABLE:
+    if not check_rembg_model()[0]:
         raise HTTPException(
             status_code=503, 
             detail="AI模型未下载。首次使用需要下载176MB模型文件，请检查网络连接或手动下载模型到 ~/.u2net/u2net.onnx"
         )
     
     try:
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="未选择文件")
-        
-        # 检查文件类型
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-        file_ext = os.path.splitext(file.filename.lower())[1]
-        if file_ext not in allowed_extensions:
-            raise HTTPException(status_code=400, detail=f"不支持的文件格式: {file_ext}")
-        
-        image_data = await file.read()
-        
-        # 限制文件大小 (20MB)
-        if len(image_data) > 20 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="文件大小超过20MB限制")
-        
-        input_image = Image.open(io.BytesIO(image_data))
+        # 限制文件大小 (20MB)，按文件头检查类型，直接从上传缓冲解码
+        upload = await save_upload(file, 20, {'image'}, dest_dir=None, upload_id=upload_id)
+        if upload.kind not in PHOTO_KINDS:
+            raise HTTPException(status_code=400, detail=f"不支持的文件格式: {upload.ext}")
         
-        # 确保是RGBA模式
-        if input_image.mode != 'RGBA':
-            input_image = input_image.convert('RGBA')
+        with stage("decode"), upload.open() as stream:
+            input_image = photo.Image.open(stream)
+            input_image.load()
+            
+            # 确保是RGBA模式
+            if input_image.mode != 'RGBA':
+                input_image = input_image.convert('RGBA')
         
         # 解析颜色
-        color = color.lstrip('#')
-        if len(color) == 3:
-            color = ''.join([c*2 for c in color])
-        if not re.match(r'^[0-9A-Fa-f]{6}$', color):
-            raise HTTPException(status_code=400, detail="无效的颜色格式")
-        
-        rgb = tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
-        
-        # 创建背景色图层
-        background = Image.new('RGBA', input_image.size, rgb + (255,))
-        
-        # 合并
-        background.paste(input_image, (0, 0), input_image)
+        try:
+            rgb = parse_color(color)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # 转换为RGB并保存
-        final_image = background.convert('RGB')
+        with stage("composite"):
+            # 创建背景色图层
+            background = photo.Image.new('RGBA', input_image.size, rgb + (255,))
+            
+            # 合并
+            background.paste(input_image, (0, 0), input_image)
+            
+            # 转换为RGB
+            final_image = background.convert('RGB')
         
-        output_buffer = io.BytesIO()
-        final_image.save(output_buffer, format="JPEG", quality=95)
-        output_buffer.seek(0)
+        with stage("encode"):
+            output_buffer = io.BytesIO()
+            final_image.save(output_buffer, format="JPEG", quality=95)
+            output_buffer.seek(0)
         
         return StreamingResponse(output_buffer, media_type="image/jpeg")
     except HTTPException:
@@ -605,15 +805,97 @@ async def api_change_background(
 
 # ==================== 音频转换 API ====================
 
+from media_utils import (
+    AUDIO_MIME_TYPES, AUDIO_BITRATE_FORMATS, normalize_bitrate,
+    parse_audio_targets, audio_output_name, build_audio_fanout_cmd,
+    build_probe_cmd, probe_duration, parse_ffmpeg_duration, plan_audio_conversion, plan_video_conversion,
+    VIDEO_TRANSCODE_ARGS,
+    parse_loudness_target, build_loudness_measure_cmd, parse_loudness_stats, build_loudnorm_filter,
+    build_pcm_decode_cmd, WaveformAccumulator, pack_waveform, unpack_waveform
+)
+
+from ffmpeg_runner import run_ffmpeg, active_runs, slot_usage, FFmpegCancelled, FFmpegTimeout
+
+async def probe_media(input_path: str, key: str, request: Request = None) -> Optional[dict]:
+    """使用 ffprobe 探测输入流信息，结果按内容哈希缓存；探测不可用或失败时返回 None"""
+    if not FFPROBE_AVAILABLE:
+        return None
+    
+    cache_path = get_cache_path("probe", key, "json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    try:
+        result = await run_ffmpeg(build_probe_cmd(input_path), request, feature="preview", timeout=60)
+        if result.returncode != 0:
+            logger.warning(f"ffprobe failed for {input_path}: {result.stderr}")
+            return None
+        probe = json.loads(result.stdout)
+    except (FFmpegTimeout, ValueError) as e:
+        logger.warning(f"ffprobe failed for {input_path}: {e}")
+        return None
+    
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(probe, f)
+    return probe
+
+async def get_loudness_stats(input_path: str, key: str, request: Request = None, pre_filter: str = '') -> dict:
+    """测量输入响度（EBU R128 第一遍），结果按内容哈希缓存；pre_filter 不为空时 key 需包含滤镜"""
+    cache_path = get_cache_path("loudness", key, "json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            logger.info(f"Loudness cache hit: {cache_path}")
+            return json.load(f)
+    
+    cmd = build_loudness_measure_cmd(input_path, pre_filter)
+    logger.info(f"Measuring loudness: {' '.join(cmd)}")
+    result = await run_ffmpeg(cmd, request, feature="audio", timeout=300)
+    if result.returncode != 0:
+        logger.error(f"FFmpeg error: {result.stderr}")
+        raise HTTPException(status_code=400, detail=f"响度测量失败: {result.stderr[-500:]}")
+    
+    stats = parse_loudness_stats(result.stderr)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    return stats
+
+async def get_loudnorm_filter(input_path: str, key: str, target: float, request: Request = None) -> Optional[str]:
+    """获取响度标准化滤镜，静音输入无法标准化时返回 None"""
+    stats = await get_loudness_stats(input_path, key, request)
+    if not math.isfinite(stats['input_i']):
+        logger.warning(f"Input is silent, skipping loudness normalization: {input_path}")
+        return None
+    return build_loudnorm_filter(stats, target)
+
+def audio_cache_bitrate(format_lower: str, bitrate: str) -> str:
+    """缓存键中的比特率：规范化写法，无损等不使用比特率的格式为空"""
+    if format_lower not in AUDIO_BITRATE_FORMATS:
+        return ''
+    try:
+        return normalize_bitrate(bitrate)
+    except ValueError:
+        return bitrate
+
 @app.post("/api/audio/convert")
 async def api_convert_audio(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
     format: str = Form("mp3"),
-    bitrate: str = Form("192k")
+    bitrate: str = Form("192k"),
+    normalize: str = Form("")
 ):
-    """转换音频格式"""
-    if not AUDIO_AVAILABLE:
-        raise HTTPException(status_code=503, detail="音频处理功能不可用，请安装pydub")
+    """
+    转换音频格式
+
+    normalize 为目标响度（LUFS，如 -16；ebu 表示 -23），为空则不做标准化。
+    标准化时直接由 ffmpeg 单次解码完成滤镜与编码，测量值按内容哈希缓存复用。
+    源编码与目标格式一致时直接复制音频流，不再解码。
+    """
+    # pydub 只在常规转码时才导入，这里只检查是否安装
+    if not features["audio"].installed():
+        raise HTTPException(status_code=503, detail=features["audio"].unavailable_message)
     
     if not FFMPEG_AVAILABLE:
         raise HTTPException(
@@ -621,26 +903,43 @@ async def api_convert_audio(
             detail="ffmpeg未安装，无法进行音频转换。请安装ffmpeg: https://ffmpeg.org/download.html"
         )
     
+    upload = None
     try:
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="未选择文件")
-        
         # 检查输出格式
         allowed_formats = {'mp3', 'wav', 'aac', 'flac', 'ogg', 'm4a', 'wma'}
         format_lower = format.lower()
         if format_lower not in allowed_formats:
             raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
         
-        input_data = await file.read()
+        try:
+            loudness_target = parse_loudness_target(normalize)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # 限制文件大小 (100MB)，流式写入临时文件
+        upload = await save_upload(file, 100, {'audio', 'video'}, prefix="audio_input", upload_id=upload_id)
         
-        # 限制文件大小 (100MB)
-        if len(input_data) > 100 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="文件大小超过100MB限制")
+        output_filename = f"converted.{format}"
+        
+        key = cache_key("audio_convert", {
+            "format": format_lower,
+            "bitrate": audio_cache_bitrate(format_lower, bitrate),
+            "normalize": loudness_target,
+        }, [upload.sha256])
+        cached = cached_result("audio_convert", key, request)
+        if cached is not None:
+            return cached
         
-        input_buffer = io.BytesIO(input_data)
+        converted = await convert_audio_with_ffmpeg(
+            upload, format_lower, bitrate, loudness_target, request
+        )
+        if converted is not None:
+            output_path, mode = converted
+            return await store_and_cache_result(key, output_path, AUDIO_MIME_TYPES.get(format_lower, 'audio/mpeg'),
+                                                output_filename, request, {"X-Conversion-Plan": mode})
         
-        # 检测输入格式
-        input_format = file.filename.split('.')[-1].lower()
+        # 检测输入格式（按文件头识别，无法识别时使用扩展名）
+        input_format = upload.ext
         
         # 处理特殊格式映射
         format_mapping = {
@@ -660,18 +959,6 @@ async def api_convert_audio(
         
         pydub_format = format_mapping.get(input_format, input_format)
         
-        # 使用pydub加载音频
-        try:
-            audio = AudioSegment.from_file(input_buffer, format=pydub_format)
-        except Exception as e:
-            logger.error(f"Error loading audio file: {e}")
-            # 尝试不指定格式加载
-            input_buffer.seek(0)
-            audio = AudioSegment.from_file(input_buffer)
-        
-        # 导出为指定格式
-        output_buffer = io.BytesIO()
-        
         # 设置导出参数
         export_params = {"format": format}
         if format_lower in ['mp3', 'ogg']:
@@ -680,48 +967,384 @@ async def api_convert_audio(
                 bitrate = bitrate + 'k'
             export_params["bitrate"] = bitrate or '192k'
         
-        audio.export(output_buffer, **export_params)
-        output_buffer.seek(0)
+        AudioSegment = await features.require("audio")
         
-        output_filename = f"converted.{format}"
-        mime_types = {
-            'mp3': 'audio/mpeg',
-            'wav': 'audio/wav',
-            'aac': 'audio/aac',
-            'flac': 'audio/flac',
-            'ogg': 'audio/ogg',
-            'm4a': 'audio/mp4',
-            'wma': 'audio/x-ms-wma',
-        }
+        def convert_with_pydub():
+            # 使用pydub加载音频
+            with stage("decode"):
+                try:
+                    audio = AudioSegment.from_file(upload.path, format=pydub_format)
+                except Exception as e:
+                    logger.error(f"Error loading audio file: {e}")
+                    # 尝试不指定格式加载
+                    audio = AudioSegment.from_file(upload.path)
+            
+            # 导出为指定格式
+            with stage("encode"):
+                audio.export(output_path, **export_params)
         
-        return StreamingResponse(
-            output_buffer,
-            media_type=mime_types.get(format_lower, 'audio/mpeg'),
-            headers={"Content-Disposition": f"attachment; filename={output_filename}"}
-        )
+        timestamp = temp_stamp()
+        output_path = os.path.join(TEMP_DIR, f"audio_output_{timestamp}.{format_lower}")
+        register_temp_file(output_path)
+        try:
+            # pydub 为同步调用，放到线程池中执行，避免阻塞事件循环
+            await run_in_threadpool(convert_with_pydub)
+            return await store_and_cache_result(key, output_path, AUDIO_MIME_TYPES.get(format_lower, 'audio/mpeg'),
+                                                output_filename, request, {"X-Conversion-Plan": "transcode"})
+        finally:
+            cleanup_temp_file(output_path)
     except HTTPException:
         raise
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，转换已取消")
     except Exception as e:
         logger.error(f"Error converting audio: {e}")
         raise HTTPException(status_code=500, detail=f"转换失败: {str(e)}")
+    finally:
+        if upload:
+            cleanup_temp_file(upload.path)
+
+async def convert_audio_with_ffmpeg(upload: SavedUpload, format_lower: str,
+                                    bitrate: str, loudness_target: Optional[float],
+                                    request: Request = None):
+    """
+    ffmpeg 直接转换路径
+
+    响度标准化时由 ffmpeg 单次解码完成滤镜与编码（避免 pydub 将整段音频载入内存）；
+    否则先探测输入流，源编码可直接复制时只更换容器。
+    返回 (输出文件路径, 模式)，调用方负责移走或删除输出文件；
+    需要常规转码时返回 None，由调用方走 pydub 流程。
+    """
+    timestamp = temp_stamp()
+    input_path = upload.path
+    output_path = os.path.join(TEMP_DIR, f"audio_ffmpeg_output_{timestamp}.{format_lower}")
+    register_temp_file(output_path)
+    converted = None
+    
+    try:
+        try:
+            bitrate = normalize_bitrate(bitrate) if format_lower in AUDIO_BITRATE_FORMATS else ''
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        key = upload.sha256
+        
+        if loudness_target is not None:
+            mode = "transcode"
+            audio_filter = await get_loudnorm_filter(input_path, key, loudness_target, request)
+            cmd = build_audio_fanout_cmd(input_path, [(format_lower, bitrate, output_path)], audio_filter)
+        else:
+            try:
+                probe = await probe_media(input_path, key, request)
+                plan = plan_audio_conversion(probe, format_lower, bitrate)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if plan["mode"] != "remux":
+                return None
+            mode = plan["mode"]
+            cmd = ["ffmpeg", "-hide_banner", "-y", "-i", input_path] + plan["args"] + [output_path]
+        
+        logger.info(f"Converting audio ({mode}): {' '.join(cmd)}")
+        result = await run_ffmpeg(cmd, request, feature="audio", timeout=300)
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            if mode == "remux":
+                # 直接复制失败时交给常规转码流程
+                return None
+            raise HTTPException(status_code=500, detail=f"音频转换失败: {result.stderr[-500:]}")
+        
+        converted = output_path, mode
+        return converted
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="音频转换超时，请尝试更小的文件")
+    finally:
+        if converted is None:
+            cleanup_temp_file(output_path)
+
+@app.post("/api/audio/convert-multi")
+async def api_convert_audio_multi(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
+    targets: str = Form("mp3:192k"),
+    normalize: str = Form("")
+):
+    """
+    一次解码、多格式输出
+
+    targets 为逗号分隔的 "格式[:比特率]" 列表，如 "mp3:192k,m4a:256k,flac"。
+    输入只解码一次，由单个 ffmpeg 进程同时编码全部输出，结果打包为 zip 返回。
+    normalize 同 /api/audio/convert，标准化滤镜只运行一次后分发给各输出。
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(
+            status_code=503, 
+            detail="ffmpeg未安装，无法进行音频转换。请安装ffmpeg: https://ffmpeg.org/download.html"
+        )
+    
+    input_path = None
+    output_paths = []
+    try:
+        try:
+            target_list = parse_audio_targets(targets)
+            loudness_target = parse_loudness_target(normalize)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # 限制文件大小 (100MB)，流式写入临时文件
+        upload = await save_upload(file, 100, {'audio', 'video'}, prefix="audio_multi_input", upload_id=upload_id)
+        input_path = upload.path
+        timestamp = temp_stamp()
+        
+        outputs = []
+        for idx, (fmt, bitrate) in enumerate(target_list):
+            output_path = os.path.join(TEMP_DIR, f"audio_multi_output_{timestamp}_{idx}.{fmt}")
+            register_temp_file(output_path)
+            output_paths.append(output_path)
+            outputs.append((fmt, bitrate, output_path))
+        
+        audio_filter = None
+        if loudness_target is not None:
+            audio_filter = await get_loudnorm_filter(input_path, upload.sha256, loudness_target, request)
+        
+        cmd = build_audio_fanout_cmd(input_path, outputs, audio_filter)
+        logger.info(f"Converting audio (fan-out x{len(outputs)}): {' '.join(cmd)}")
+        result = await run_ffmpeg(cmd, request, feature="audio", timeout=300)
+        
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            raise HTTPException(status_code=500, detail=f"音频转换失败: {result.stderr[-500:]}")
+        
+        # 打包结果（音频本身已压缩，zip 只做存储）
+        zip_path = os.path.join(TEMP_DIR, f"audio_multi_{timestamp}.zip")
+        register_temp_file(zip_path)
+        output_paths.append(zip_path)
+        with stage("package"), zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            for fmt, bitrate, output_path in outputs:
+                zf.write(output_path, arcname=audio_output_name(fmt, bitrate))
+        
+        result = store_result(zip_path, "application/zip", "converted.zip")
+        return result_store.response(result, request)
+    except HTTPException:
+        raise
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="音频转换超时，请尝试更小的文件")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，转换已取消")
+    except Exception as e:
+        logger.error(f"Error converting audio (fan-out): {e}")
+        raise HTTPException(status_code=500, detail=f"转换失败: {str(e)}")
+    finally:
+        if input_path:
+            cleanup_temp_file(input_path)
+        for output_path in output_paths:
+            cleanup_temp_file(output_path)
+
+@app.post("/api/audio/waveform")
+async def api_audio_waveform(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
+    format: str = Form("json")
+):
+    """
+    计算音频波形峰值（多分辨率 min/max）
+
+    单次流式解码并计算全部层级，结果按内容哈希缓存。format 为 json 或 binary，
+    binary 为紧凑二进制格式（见 media_utils.pack_waveform）。
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(
+            status_code=503, 
+            detail="ffmpeg未安装，无法生成波形。请安装ffmpeg: https://ffmpeg.org/download.html"
+        )
+    
+    await features.require("waveform")
+    
+    format_lower = format.lower()
+    if format_lower not in ('json', 'binary'):
+        raise HTTPException(status_code=400, detail=f"不支持的波形格式: {format}")
+    
+    input_path = None
+    try:
+        # 限制文件大小 (100MB)；先只计算哈希，缓存未命中时才落盘
+        upload = await save_upload(file, 100, {'audio', 'video'}, dest_dir=None, upload_id=upload_id)
+        cache_path = get_cache_path("waveform", upload.sha256, "bin")
+        
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                blob = f.read()
+            logger.info(f"Waveform cache hit: {cache_path}")
+        else:
+            timestamp = temp_stamp()
+            input_path = os.path.join(TEMP_DIR, f"waveform_input_{timestamp}.{upload.ext}")
+            register_temp_file(input_path)
+            await run_in_threadpool(upload.write_to, input_path)
+            
+            cmd = build_pcm_decode_cmd(input_path)
+            logger.info(f"Computing waveform: {' '.join(cmd)}")
+            accumulator = WaveformAccumulator()
+            result = await run_ffmpeg(cmd, request, feature="preview", timeout=300,
+                                      stdout_consumer=accumulator.feed)
+            
+            if result.returncode != 0:
+                logger.error(f"FFmpeg error: {result.stderr}")
+                raise HTTPException(status_code=400, detail=f"音频解码失败: {result.stderr[-500:]}")
+            
+            blob = pack_waveform(*accumulator.finish())
+            with open(cache_path, "wb") as f:
+                f.write(blob)
+        
+        if format_lower == 'binary':
+            return StreamingResponse(io.BytesIO(blob), media_type="application/octet-stream")
+        return unpack_waveform(blob)
+    except HTTPException:
+        raise
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="波形计算超时，请尝试更小的文件")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，已取消")
+    except Exception as e:
+        logger.error(f"Error computing waveform: {e}")
+        raise HTTPException(status_code=500, detail=f"波形计算失败: {str(e)}")
+    finally:
+        if input_path:
+            cleanup_temp_file(input_path)
 
 # ==================== 视频转换 API ====================
 
-# 检查 ffmpeg-python 是否可用
-try:
-    import ffmpeg
-    FFMPEG_PYTHON_AVAILABLE = True
-except ImportError:
-    FFMPEG_PYTHON_AVAILABLE = False
-    logger.warning("ffmpeg-python not available, video conversion will use subprocess")
+from video_parallel import encode_parallel, ParallelEncodeError, MIN_PARALLEL_DURATION
+from video_deadline import ENCODER_PROFILES, encoder_for_target, plan_deadline_encode
+from media_utils import (
+    THUMBNAIL_MAX_COUNT, THUMBNAIL_MIN_WIDTH, THUMBNAIL_MAX_WIDTH,
+    thumbnail_times, thumbnail_cell_size, build_thumbnail_sprite_cmd, parse_thumbnail_times,
+    select_streams, HLS_SEGMENT_TYPES, parse_hls_renditions, build_hls_cmd
+)
+import hls_jobs
+
+# HLS 任务目录，任务不跨进程保留，启动时清空
+HLS_DIR = os.path.join(TEMP_DIR, "hls")
+shutil.rmtree(HLS_DIR, ignore_errors=True)
+os.makedirs(HLS_DIR, exist_ok=True)
+
+# 分辨率对应的缩放滤镜
+VIDEO_SCALE_FILTERS = {
+    "720p": "scale=-1:720",
+    "1080p": "scale=-1:1080",
+    "4k": "scale=-1:2160",
+}
+
+def stream_needs_transcode(plan: dict, codec_type: str) -> bool:
+    """指定类型的流是否需要重新编码"""
+    if not plan["streams"]:
+        return plan["mode"] == "transcode"
+    return any(s["type"] == codec_type and s["action"] == "transcode" for s in plan["streams"])
+
+async def get_media_duration(input_path: str, probe: Optional[dict], request: Request = None) -> Optional[float]:
+    """获取输入时长，ffprobe 不可用时从 ffmpeg 输出中解析"""
+    duration = probe_duration(probe)
+    if duration is None:
+        result = await run_ffmpeg(["ffmpeg", "-hide_banner", "-i", input_path], request, feature="preview", timeout=60)
+        duration = parse_ffmpeg_duration(result.stderr)
+    return duration
+
+async def has_audio_stream(input_path: str, probe: Optional[dict], request: Request = None) -> bool:
+    """输入是否包含音频流，ffprobe 不可用时从 ffmpeg 输出中判断"""
+    if probe is not None:
+        return 'audio' in select_streams(probe)
+    result = await run_ffmpeg(["ffmpeg", "-hide_banner", "-i", input_path], request, feature="preview", timeout=60)
+    return "Audio:" in result.stderr
+
+async def get_deadline_settings(input_path: str, key: str, format_lower: str, resolution: str,
+                                deadline: float, plan: dict, probe: Optional[dict],
+                                request: Request = None) -> dict:
+    """
+    时间预算模式：编码样本测速（按内容哈希缓存），选出能在 deadline 秒内完成的最高画质参数
+    """
+    if encoder_for_target(format_lower) not in ENCODER_PROFILES:
+        raise HTTPException(status_code=400, detail=f"{format_lower} 格式不支持时间预算模式")
+    
+    duration = await get_media_duration(input_path, probe, request)
+    if not duration:
+        raise HTTPException(status_code=400, detail="无法获取视频时长")
+    
+    cache_path = get_cache_path("encode_speed", f"{key}_{format_lower}_{resolution}", "json")
+    costs = None
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            costs = json.load(f)
+        logger.info(f"Encode speed cache hit: {cache_path}")
+    
+    audio_args = VIDEO_TRANSCODE_ARGS[format_lower][1] if stream_needs_transcode(plan, "audio") else None
+    try:
+        settings, costs = await plan_deadline_encode(
+            input_path, duration, format_lower, deadline,
+            VIDEO_SCALE_FILTERS.get(resolution, ""), audio_args, costs, request
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(costs, f)
+    
+    logger.info(f"Deadline {deadline}s: preset {settings['preset']} crf {settings['crf']}, "
+                f"estimated {settings['estimated_seconds']}s (fits: {settings['fits']})")
+    return settings
+
+async def convert_video_parallel(input_path: str, output_path: str, timestamp: str, format_lower: str,
+                                 scale_filter: str, plan: dict, probe: Optional[dict],
+                                 request: Request = None, video_args: Optional[List[str]] = None,
+                                 timeout: float = 300) -> int:
+    """
+    尝试分段并行编码，返回片段数；不适用或失败时返回 0，由调用方走普通编码流程
+    """
+    streams = {stream["type"]: stream for stream in plan["streams"]}
+    video_stream = streams.get("video")
+    duration = probe_duration(probe)
+    if video_stream is None or video_stream["action"] != "transcode":
+        logger.info("Parallel encode skipped: video stream does not need transcoding")
+        return 0
+    if duration is None or duration < MIN_PARALLEL_DURATION:
+        logger.info(f"Parallel encode skipped: input too short or duration unknown ({duration})")
+        return 0
+    
+    default_video_args, audio_args = VIDEO_TRANSCODE_ARGS[format_lower]
+    video_args = video_args or default_video_args
+    audio_stream = streams.get("audio")
+    if audio_stream is None:
+        audio_args = None
+    elif audio_stream["action"] == "copy":
+        audio_args = ["-c:a", "copy"]
+    
+    work_dir = os.path.join(TEMP_DIR, f"video_segments_{timestamp}")
+    try:
+        return await encode_parallel(
+            input_path, output_path, work_dir, video_args, audio_args,
+            scale_filter=scale_filter, request=request, timeout=timeout
+        )
+    except ParallelEncodeError as e:
+        logger.warning(f"Parallel encode failed, falling back to single process: {e}")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 @app.post("/api/video/convert")
 async def api_convert_video(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
     format: str = Form("mp4"),
-    resolution: str = Form("original")
+    resolution: str = Form("original"),
+    parallel: bool = Form(False),
+    deadline: float = Form(0)
 ):
-    """转换视频格式"""
+    """
+    转换视频格式
+
+    通过 ffprobe 探测输入流：编码已被目标容器支持的流直接复制，仅在容器要求时转码，
+    仅更换容器的转换无需重新编码。
+    parallel 为 true 且视频流需要转码时，在关键帧处分段并发编码后无损拼接。
+    deadline 大于 0 时启用时间预算模式，按本机样本测速选择能在该秒数内完成的编码预设。
+    """
     if not FFMPEG_AVAILABLE:
         raise HTTPException(
             status_code=503, 
@@ -729,82 +1352,86 @@ async def api_convert_video(
         )
     
     try:
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="未选择文件")
-        
         # 检查输出格式
         allowed_formats = {'mp4', 'avi', 'mkv', 'mov', 'wmv', 'flv', 'webm'}
         format_lower = format.lower()
         if format_lower not in allowed_formats:
             raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
         
-        input_data = await file.read()
+        # 限制文件大小 (500MB)，流式写入临时文件
+        upload = await save_upload(file, 500, {'video', 'audio'}, prefix="video_input", upload_id=upload_id)
+        input_path = upload.path
         
-        # 限制文件大小 (500MB)
-        if len(input_data) > 500 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="文件大小超过500MB限制")
+        # 分段并行与否不影响结果内容，不计入缓存键
+        key = cache_key("video_convert", {
+            "format": format_lower,
+            "resolution": resolution if resolution in VIDEO_SCALE_FILTERS else "original",
+            "deadline": deadline if deadline > 0 else 0,
+        }, [upload.sha256])
+        cached = cached_result("video_convert", key, request)
+        if cached is not None:
+            cleanup_temp_file(input_path)
+            return cached
         
-        # 保存输入文件
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        input_filename = f"video_input_{timestamp}.{file.filename.split('.')[-1]}"
+        timestamp = temp_stamp()
         output_filename = f"video_output_{timestamp}.{format_lower}"
-        input_path = os.path.join(TEMP_DIR, input_filename)
         output_path = os.path.join(TEMP_DIR, output_filename)
-        
-        with open(input_path, "wb") as f:
-            f.write(input_data)
-        register_temp_file(input_path)
         register_temp_file(output_path)
         
-        # 构建 ffmpeg 命令
-        import subprocess
-        
         # 分辨率设置
-        scale_filter = ""
-        if resolution == "720p":
-            scale_filter = "scale=-1:720"
-        elif resolution == "1080p":
-            scale_filter = "scale=-1:1080"
-        elif resolution == "4k":
-            scale_filter = "scale=-1:2160"
-        
-        # 构建命令
-        cmd = ["ffmpeg", "-i", input_path, "-y"]
-        
-        if scale_filter:
-            cmd.extend(["-vf", scale_filter])
-        
-        # 根据格式设置编码器
-        if format_lower == "mp4":
-            cmd.extend(["-c:v", "libx264", "-preset", "fast", "-crf", "23"])
-            cmd.extend(["-c:a", "aac", "-b:a", "192k"])
-        elif format_lower == "webm":
-            cmd.extend(["-c:v", "libvpx-vp9", "-crf", "30", "-b:v", "0"])
-            cmd.extend(["-c:a", "libopus", "-b:a", "128k"])
-        elif format_lower == "avi":
-            cmd.extend(["-c:v", "mpeg4", "-q:v", "3"])
-            cmd.extend(["-c:a", "libmp3lame", "-q:a", "4"])
-        else:
-            # 默认自动选择
-            cmd.extend(["-c:v", "copy", "-c:a", "copy"])
+        scale_filter = VIDEO_SCALE_FILTERS.get(resolution, "")
         
-        cmd.append(output_path)
+        # 探测输入流，逐流决定直接复制还是转码
+        input_key = upload.sha256
+        probe = await probe_media(input_path, input_key, request)
+        try:
+            plan = plan_video_conversion(probe, format_lower, scale_filter)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # 执行转换
-        logger.info(f"Converting video: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        # 时间预算模式：替换视频编码参数，并按预计耗时放宽超时
+        settings = None
+        video_args = None
+        timeout = 300
+        if deadline > 0 and stream_needs_transcode(plan, "video"):
+            settings = await get_deadline_settings(
+                input_path, input_key, format_lower, resolution, deadline, plan, probe, request
+            )
+            video_args = settings["video_args"]
+            plan = plan_video_conversion(probe, format_lower, scale_filter, video_args=video_args)
+            timeout = max(300, deadline * 2, settings["estimated_seconds"] * 2)
         
-        if result.returncode != 0:
+        segment_count = 0
+        if parallel:
+            segment_count = await convert_video_parallel(
+                input_path, output_path, timestamp, format_lower, scale_filter, plan, probe, request,
+                video_args=video_args, timeout=timeout
+            )
+        
+        if segment_count:
+            result = None
+        else:
+            cmd = ["ffmpeg", "-i", input_path, "-y"] + plan["args"] + [output_path]
+            
+            # 执行转换
+            logger.info(f"Converting video ({plan['mode']}): {' '.join(cmd)}")
+            result = await run_ffmpeg(cmd, request, feature="video", timeout=timeout)
+        
+        if result and result.returncode != 0 and plan["mode"] != "transcode" and probe is not None:
+            # 复制流失败（如时间戳异常）时退回全量转码
+            logger.warning(f"Stream copy failed, falling back to transcode: {result.stderr[-500:]}")
+            plan = plan_video_conversion(probe, format_lower, scale_filter, force_transcode=True,
+                                         video_args=video_args)
+            cmd = ["ffmpeg", "-i", input_path, "-y"] + plan["args"] + [output_path]
+            logger.info(f"Converting video ({plan['mode']}): {' '.join(cmd)}")
+            result = await run_ffmpeg(cmd, request, feature="video", timeout=timeout)
+        
+        if result and result.returncode != 0:
             logger.error(f"FFmpeg error: {result.stderr}")
             raise HTTPException(status_code=500, detail=f"视频转换失败: {result.stderr}")
         
-        # 读取输出文件
-        with open(output_path, "rb") as f:
-            output_data = f.read()
-        
-        # 清理临时文件
+        # 清理输入文件，输出移入结果目录直接从磁盘返回
         cleanup_temp_file(input_path)
-        cleanup_temp_file(output_path)
         
         mime_types = {
             'mp4': 'video/mp4',
@@ -816,20 +1443,304 @@ async def api_convert_video(
             'webm': 'video/webm',
         }
         
-        return StreamingResponse(
-            io.BytesIO(output_data),
-            media_type=mime_types.get(format_lower, 'video/mp4'),
-            headers={"Content-Disposition": f"attachment; filename=converted.{format_lower}"}
-        )
+        headers = {
+            "X-Conversion-Plan": plan["mode"],
+            "X-Parallel-Segments": str(segment_count),
+        }
+        if settings:
+            headers["X-Encode-Preset"] = f"{settings['preset']}/crf{settings['crf']}"
+            headers["X-Estimated-Seconds"] = str(settings["estimated_seconds"])
+            # 预计耗时按单进程、基准 CRF 测速得出，分段并发编码或上调 CRF 后仅供参考
+            if settings["extrapolated"] or segment_count:
+                headers["X-Estimate-Extrapolated"] = "1"
+        
+        return await store_and_cache_result(key, output_path, mime_types.get(format_lower, 'video/mp4'),
+                                            f"converted.{format_lower}", request, headers)
         
     except HTTPException:
         raise
-    except subprocess.TimeoutExpired:
+    except FFmpegTimeout:
         raise HTTPException(status_code=500, detail="视频转换超时，请尝试更小的文件")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，转换已取消")
     except Exception as e:
         logger.error(f"Error converting video: {e}")
         raise HTTPException(status_code=500, detail=f"转换失败: {str(e)}")
 
+@app.post("/api/video/estimate")
+async def api_estimate_video(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
+    format: str = Form("mp4"),
+    resolution: str = Form("original"),
+    deadline: float = Form(...),
+    parallel: bool = Form(False)
+):
+    """
+    时间预算模式预估
+
+    编码一小段样本测出本机速度，返回能在 deadline 秒内完成的编码参数与预计耗时，
+    转换前即可告知用户完成时间。测速结果会缓存，随后以相同参数转换时不再重复测速。
+    预计耗时按单进程编码估算；parallel 为 true 且视频足够长会分段并发编码时，
+    或预算不足上调了 CRF 时，settings.extrapolated 为 true，预计耗时仅供参考。
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(status_code=503, detail="ffmpeg未安装，无法进行视频转换")
+    
+    input_path = None
+    try:
+        if deadline <= 0:
+            raise HTTPException(status_code=400, detail="时间预算必须大于0秒")
+        
+        format_lower = format.lower()
+        if format_lower not in VIDEO_TRANSCODE_ARGS:
+            raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+        
+        upload = await save_upload(file, 500, {'video', 'audio'}, prefix="video_estimate", upload_id=upload_id)
+        input_path = upload.path
+        
+        input_key = upload.sha256
+        probe = await probe_media(input_path, input_key, request)
+        try:
+            plan = plan_video_conversion(probe, format_lower, VIDEO_SCALE_FILTERS.get(resolution, ""))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if not stream_needs_transcode(plan, "video"):
+            # 视频流直接复制，耗时主要取决于磁盘读写
+            return {"mode": plan["mode"], "transcode": False, "settings": None}
+        
+        settings = await get_deadline_settings(
+            input_path, input_key, format_lower, resolution, deadline, plan, probe, request
+        )
+        if parallel and settings["duration"] >= MIN_PARALLEL_DURATION:
+            settings["extrapolated"] = True
+        return {"mode": plan["mode"], "transcode": True, "settings": settings}
+        
+    except HTTPException:
+        raise
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="样本编码超时")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，预估已取消")
+    except Exception as e:
+        logger.error(f"Error estimating video conversion: {e}")
+        raise HTTPException(status_code=500, detail=f"预估失败: {str(e)}")
+    finally:
+        if input_path:
+            cleanup_temp_file(input_path)
+
+# 缩略图精灵图 ID：内容哈希_数量_宽度_列数
+THUMBNAIL_ID_PATTERN = re.compile(r'^[0-9a-f]{64}_\d+_\d+_\d+$')
+
+@app.post("/api/video/thumbnails")
+async def api_video_thumbnails(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
+    count: int = Form(10),
+    width: int = Form(160),
+    columns: int = Form(0)
+):
+    """
+    生成关键帧缩略图精灵图
+
+    按时长均匀取 count 个时间点，每个时间点只定位并解码最近的关键帧，拼成一张精灵图。
+    返回时间索引（每格的位置与实际关键帧时间），精灵图通过 GET /api/video/thumbnails/{id} 获取。
+    结果按内容哈希缓存。
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(status_code=503, detail="ffmpeg未安装，无法生成缩略图")
+    
+    input_path = None
+    try:
+        if not 1 <= count <= THUMBNAIL_MAX_COUNT:
+            raise HTTPException(status_code=400, detail=f"缩略图数量必须在1到{THUMBNAIL_MAX_COUNT}之间")
+        if not THUMBNAIL_MIN_WIDTH <= width <= THUMBNAIL_MAX_WIDTH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"缩略图宽度必须在{THUMBNAIL_MIN_WIDTH}到{THUMBNAIL_MAX_WIDTH}之间"
+            )
+        width -= width % 2
+        columns = min(count, columns if columns > 0 else 10)
+        
+        # 先只计算哈希，缓存未命中时才落盘
+        upload = await save_upload(file, 500, {'video'}, dest_dir=None, upload_id=upload_id)
+        input_key = upload.sha256
+        sprite_id = f"{input_key}_{count}_{width}_{columns}"
+        index_path = get_cache_path("thumbnails", sprite_id, "json")
+        sprite_path = get_cache_path("thumbnails", sprite_id, "jpg")
+        if os.path.exists(index_path) and os.path.exists(sprite_path):
+            logger.info(f"Thumbnail cache hit: {sprite_id}")
+            with open(index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        
+        timestamp = temp_stamp()
+        input_path = os.path.join(TEMP_DIR, f"video_thumbs_{timestamp}.{upload.ext}")
+        register_temp_file(input_path)
+        await run_in_threadpool(upload.write_to, input_path)
+        
+        probe = await probe_media(input_path, input_key, request)
+        duration = await get_media_duration(input_path, probe, request)
+        if not duration:
+            raise HTTPException(status_code=400, detail="无法获取视频时长")
+        
+        times = thumbnail_times(duration, count)
+        cell_width, cell_height = thumbnail_cell_size(probe, width)
+        cmd = build_thumbnail_sprite_cmd(input_path, times, cell_width, cell_height, columns, sprite_path)
+        logger.info(f"Generating thumbnail sprite: {count} keyframes, {cell_width}x{cell_height}")
+        result = await run_ffmpeg(cmd, request, feature="preview", timeout=120)
+        if result.returncode != 0 or not os.path.exists(sprite_path):
+            logger.error(f"Thumbnail sprite failed: {result.stderr[-1000:]}")
+            raise HTTPException(status_code=500, detail="缩略图生成失败，文件可能不包含视频流")
+        
+        frame_times = parse_thumbnail_times(result.stderr, count)
+        index = {
+            "id": sprite_id,
+            "sprite": f"/api/video/thumbnails/{sprite_id}",
+            "duration": round(duration, 3),
+            "cell_width": cell_width,
+            "cell_height": cell_height,
+            "columns": columns,
+            "rows": -(-count // columns),
+            "frames": [
+                {
+                    "index": i,
+                    "target_time": t,
+                    "time": frame_times[i] if frame_times[i] is not None else t,
+                    "x": (i % columns) * cell_width,
+                    "y": (i // columns) * cell_height,
+                }
+                for i, t in enumerate(times)
+            ],
+        }
+        with open(index_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        return index
+        
+    except HTTPException:
+        raise
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="缩略图生成超时")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，已取消")
+    except Exception as e:
+        logger.error(f"Error generating thumbnails: {e}")
+        raise HTTPException(status_code=500, detail=f"缩略图生成失败: {str(e)}")
+    finally:
+        if input_path:
+            cleanup_temp_file(input_path)
+
+@app.get("/api/video/thumbnails/{sprite_id}")
+async def api_video_thumbnail_sprite(sprite_id: str):
+    """获取已生成的缩略图精灵图"""
+    if not THUMBNAIL_ID_PATTERN.match(sprite_id):
+        raise HTTPException(status_code=400, detail="无效的缩略图ID")
+    sprite_path = get_cache_path("thumbnails", sprite_id, "jpg")
+    if not os.path.exists(sprite_path):
+        raise HTTPException(status_code=404, detail="缩略图不存在或已过期")
+    return FileResponse(
+        sprite_path,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.post("/api/video/hls")
+async def api_start_hls(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: str = Form(""),
+    renditions: str = Form("original"),
+    segment_type: str = Form("fmp4"),
+    segment_seconds: int = Form(4)
+):
+    """
+    以 HLS 分段形式转换视频
+
+    转换在后台进行，立即返回任务信息。播放列表与分段写入任务目录，
+    生成后即可通过 GET /api/video/hls/{job_id}/master.m3u8 访问，无需等待转换完成。
+    renditions 为逗号分隔的清晰度（original/1080p/720p/480p/360p），一次解码同时输出多种清晰度。
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(status_code=503, detail="ffmpeg未安装，无法进行视频转换")
+    
+    job_dir = None
+    try:
+        if segment_type not in HLS_SEGMENT_TYPES:
+            raise HTTPException(status_code=400, detail=f"不支持的分段类型: {segment_type}")
+        if not 1 <= segment_seconds <= 30:
+            raise HTTPException(status_code=400, detail="分段时长必须在1到30秒之间")
+        try:
+            rendition_list = parse_hls_renditions(renditions)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # 输入直接写入任务目录，随任务一起清理
+        job_dir = hls_jobs.new_job_dir(HLS_DIR)
+        upload = await save_upload(file, 500, {'video'}, job_dir, prefix="input", upload_id=upload_id)
+        input_path = upload.path
+        
+        probe = await probe_media(input_path, upload.sha256, request)
+        if probe is not None and 'video' not in select_streams(probe):
+            raise HTTPException(status_code=400, detail="输入文件中没有视频流")
+        has_audio = await has_audio_stream(input_path, probe, request)
+        
+        cmd = build_hls_cmd(input_path, job_dir, rendition_list, has_audio, segment_type, segment_seconds)
+        logger.info(f"Starting HLS job: {' '.join(cmd)}")
+        # 转换在后台运行，视频准入由任务持有到转换结束
+        job = hls_jobs.start_job(job_dir, input_path, cmd, rendition_list, segment_type,
+                                 take_ticket(request.scope))
+        return job.to_dict()
+        
+    except HTTPException:
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        logger.error(f"Error starting HLS job: {e}")
+        raise HTTPException(status_code=500, detail=f"启动转换失败: {str(e)}")
+
+@app.get("/api/video/hls/{job_id}")
+async def api_hls_status(job_id: str):
+    """获取 HLS 任务状态"""
+    job = hls_jobs.get_job(job_id, HLS_DIR)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict()
+
+@app.get("/api/video/hls/{job_id}/{file_path:path}")
+async def api_hls_file(job_id: str, file_path: str):
+    """获取 HLS 播放列表或分段"""
+    job = hls_jobs.get_job(job_id, HLS_DIR)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    path = hls_jobs.resolve_job_file(job, file_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="文件不存在或尚未生成")
+    
+    ext = os.path.splitext(path)[1]
+    if ext == ".m3u8" and job.status in ("queued", "running"):
+        # 播放列表在编码过程中持续追加
+        cache_control = "no-cache"
+    else:
+        cache_control = "public, max-age=3600"
+    return FileResponse(
+        path,
+        media_type=hls_jobs.MEDIA_TYPES.get(ext, "application/octet-stream"),
+        headers={"Cache-Control": cache_control}
+    )
+
+@app.delete("/api/video/hls/{job_id}")
+async def api_cancel_hls(job_id: str):
+    """取消 HLS 任务并删除已生成的文件"""
+    job = await hls_jobs.cancel_job(job_id, HLS_DIR)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return {"job_id": job_id, "status": job.status}
+
 @app.get("/api/video/status")
 async def api_video_status():
     """获取视频转换功能状态"""
@@ -840,8 +1751,349 @@ async def api_video_status():
         "supported_resolutions": ["original", "720p", "1080p", "4k"]
     }
 
+# ==================== 处理流水线 API ====================
+
+from pipeline import (
+    Timings, parse_steps, run_image_pipeline, run_pdf_pipeline, write_pdf_documents,
+    audio_needs_duration, build_audio_filters
+)
+
+# 流水线类型 -> (单个文件大小上限 MB, 允许的文件类别, 最多输入文件数)
+PIPELINE_INPUTS = {
+    'image': (20, {'image'}, 1),
+    'pdf': (50, {'pdf'}, 50),
+    'audio': (100, {'audio', 'video'}, 1),
+}
+
+async def run_audio_steps(upload: SavedUpload, step_list: List[dict], output_path: str,
+                          timings: Timings, request: Request) -> None:
+    """音频流水线：各步骤编译为一条滤镜链，由单个 ffmpeg 进程解码、处理并编码"""
+    duration = None
+    if audio_needs_duration(step_list):
+        probe = await probe_media(upload.path, upload.sha256, request)
+        duration = await get_media_duration(upload.path, probe, request)
+    
+    chain = []
+    for op, audio_filter in build_audio_filters(step_list, duration):
+        if op == 'normalize':
+            # 测量经过之前各步骤处理后的响度，测量值按输入内容与滤镜缓存
+            pre_filter = ','.join(chain)
+            stats_key = cache_key("loudness", {"filter": pre_filter}, [upload.sha256]) if pre_filter else upload.sha256
+            with timings.step("normalize"):
+                stats = await get_loudness_stats(upload.path, stats_key, request, pre_filter)
+            if not math.isfinite(stats['input_i']):
+                logger.warning(f"Input is silent, skipping loudness normalization: {upload.path}")
+                continue
+            target = next(step['target'] for step in step_list if step['op'] == 'normalize')
+            audio_filter = build_loudnorm_filter(stats, target)
+        chain.append(audio_filter)
+    
+    encode = step_list[-1]
+    cmd = build_audio_fanout_cmd(upload.path, [(encode['format'], encode['bitrate'], output_path)],
+                                 ','.join(chain) or None)
+    logger.info(f"Running audio pipeline: {' '.join(cmd)}")
+    with timings.step("encode"):
+        result = await run_ffmpeg(cmd, request, feature="audio", timeout=300)
+    if result.returncode != 0:
+        logger.error(f"FFmpeg error: {result.stderr}")
+        raise HTTPException(status_code=500, detail=f"音频处理失败: {result.stderr[-500:]}")
+
+@app.post("/api/pipeline/{kind}")
+async def api_pipeline(
+    request: Request,
+    kind: str,
+    steps: str = Form(...),
+    files: List[UploadFile] = File(None),
+    upload_ids: str = Form("")
+):
+    """
+    多步处理流水线：一次上传，按顺序执行 steps，只在最后编码一次
+
+    kind 为 image / pdf / audio，steps 为 JSON 数组（格式见 pipeline.py）。
+    upload_ids 为逗号分隔的分块上传 ID，排在 files 之后；image 与 audio 只接受一个输入。
+    各步骤耗时以 JSON 放在 X-Pipeline-Timings 响应头中；相同输入与步骤直接返回缓存的结果。
+    """
+    if kind not in PIPELINE_INPUTS:
+        raise HTTPException(status_code=404, detail=f"不支持的流水线类型: {kind}")
+    try:
+        step_list = parse_steps(kind, steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    sources = [(file, "") for file in files or []]
+    sources += [(None, upload_id.strip()) for upload_id in upload_ids.split(',') if upload_id.strip()]
+    max_mb, categories, max_inputs = PIPELINE_INPUTS[kind]
+    if not sources:
+        raise HTTPException(status_code=400, detail="未选择文件")
+    if len(sources) > max_inputs:
+        raise HTTPException(status_code=400, detail=f"最多支持{max_inputs}个输入文件")
+    logger.info(f"Pipeline request ({kind}): {len(sources)} inputs, steps: {[step['op'] for step in step_list]}")
+    
+    if kind == 'image':
+        Image = await features.require("image")
+        photo = None
+        if any(step['op'] == 'remove-bg' for step in step_list):
+            photo = await features.require("photo")
+            if not check_rembg_model()[0]:
+                raise HTTPException(
+                    status_code=503,
+                    detail="AI模型未下载。首次使用需要下载176MB模型文件，请检查网络连接或手动下载模型到 ~/.u2net/u2net.onnx"
+                )
+    elif kind == 'pdf':
+        pdf = await features.require("pdf")
+    elif not FFMPEG_AVAILABLE:
+        raise HTTPException(
+            status_code=503,
+            detail="ffmpeg未安装，无法进行音频处理。请安装ffmpeg: https://ffmpeg.org/download.html"
+        )
+    
+    uploads = []
+    streams = []
+    output_path = None
+    timings = Timings()
+    try:
+        for file, upload_id in sources:
+            # 音频由 ffmpeg 读取，需要落盘；图像与 PDF 直接从上传缓冲解码
+            upload = await save_upload(file, max_mb, categories, dest_dir=TEMP_DIR if kind == 'audio' else None,
+                                       prefix="pipeline_input", upload_id=upload_id)
+            uploads.append(upload)
+            if kind == 'image' and upload.kind not in PHOTO_KINDS:
+                raise HTTPException(status_code=400, detail=f"不支持的文件格式: {upload.ext}")
+        
+        operation = f"pipeline_{kind}"
+        key = cache_key(operation, {"steps": step_list}, [upload.sha256 for upload in uploads])
+        cached = cached_result(operation, key, request)
+        if cached is not None:
+            return cached
+        
+        encode = step_list[-1]
+        if kind == 'image':
+            ext = 'jpg' if encode['format'] == 'jpeg' else encode['format']
+            output_path = os.path.join(TEMP_DIR, f"pipeline_{temp_stamp()}.{ext}")
+            register_temp_file(output_path)
+            filename = f"processed.{ext}"
+            
+            # 第一步即抠图、且同一张图片抠过时，直接使用 /api/photo/remove-bg 缓存的结果，不再推理
+            cutout = None
+            if step_list[0]['op'] == 'remove-bg':
+                cutout = result_cache.get("remove_bg", cache_key("remove_bg", {}, [uploads[0].sha256]))
+            
+            def remove_background(image):
+                nonlocal cutout
+                if cutout is not None:
+                    image = Image.open(cutout[0])
+                    image.load()
+                    cutout = None
+                    return image
+                if image.mode != 'RGBA':
+                    image = image.convert('RGBA')
+                return photo.remove(image, session=get_rembg_session(photo))
+            
+            streams.append(uploads[0].open())
+            media_type = await run_in_threadpool(
+                run_image_pipeline, Image, streams[0], step_list, output_path, timings, remove_background
+            )
+        elif kind == 'pdf':
+            # 页面在写出时才读取，文件保持打开到处理结束
+            streams = [upload.open() for upload in uploads]
+            
+            def process_pdf():
+                documents = run_pdf_pipeline(pdf, list(zip([u.filename for u in uploads], streams)), step_list, timings)
+                path = os.path.join(TEMP_DIR, f"pipeline_{temp_stamp()}.{'pdf' if len(documents) == 1 else 'zip'}")
+                register_temp_file(path)
+                return (path,) + write_pdf_documents(pdf, documents, path, timings)
+            
+            output_path, media_type, filename = await run_in_threadpool(process_pdf)
+        else:
+            output_path = os.path.join(TEMP_DIR, f"pipeline_{temp_stamp()}.{encode['format']}")
+            register_temp_file(output_path)
+            media_type = AUDIO_MIME_TYPES.get(encode['format'], 'audio/mpeg')
+            filename = f"processed.{encode['format']}"
+            await run_audio_steps(uploads[0], step_list, output_path, timings, request)
+        
+        logger.info(f"Pipeline ({kind}) finished: {timings.header()}")
+        # 耗时只属于本次处理，不随结果缓存
+        await run_in_threadpool(result_cache.put, key, output_path, media_type, filename)
+        result = store_result(output_path, media_type, filename)
+        return result_store.response(result, request, {"X-Pipeline-Timings": timings.header(), "X-Cache": "miss"})
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FFmpegTimeout:
+        raise HTTPException(status_code=500, detail="音频处理超时，请尝试更小的文件")
+    except FFmpegCancelled:
+        raise HTTPException(status_code=499, detail="客户端已断开，处理已取消")
+    except Exception as e:
+        logger.error(f"Error running {kind} pipeline: {e}")
+        raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
+    finally:
+        for stream in streams:
+            stream.close()
+        # 只删除落盘的音频输入；图像与 PDF 使用分块上传时 path 为上传的数据文件本身，不得删除
+        if kind == 'audio':
+            for upload in uploads:
+                cleanup_temp_file(upload.path)
+        if output_path:
+            cleanup_temp_file(output_path)
+
+# ==================== 分块上传 API ====================
+
+from starlette.requests import ClientDisconnect
+from temp_store import QuotaExceeded
+from uploads import COPY_CHUNK_SIZE
+
+@app.post("/api/uploads")
+async def api_create_upload(filename: str = Form(...), size: int = Form(...)):
+    """
+    创建可续传上传
+
+    返回 upload_id 与建议的分块大小，随后用 PUT /api/uploads/{upload_id}?offset=N 上传分块。
+    """
+    try:
+        # 数据文件按总大小预分配，先确认临时空间足够
+        reservation = await run_in_threadpool(temp_store.reserve, size)
+        reservation.release()
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    meta = await run_in_threadpool(resumable_uploads.create, filename, size)
+    return resumable_uploads.describe(meta)
+
+@app.put("/api/uploads/{upload_id}")
+async def api_upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    """
+    上传分块：请求体为原始字节，写入文件的 offset 处
+
+    分块可乱序、并发或重复上传；连接中断时已收到的部分仍会记录，可通过查询接口得知缺失范围。
+    """
+    meta, f, writer = await run_in_threadpool(resumable_uploads.open_chunk, upload_id, offset)
+    limit = meta["size"] - offset
+    written = 0
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            if written + len(buffer) + len(chunk) > limit:
+                raise HTTPException(status_code=400, detail="分块超出文件大小")
+            buffer.extend(chunk)
+            if len(buffer) >= COPY_CHUNK_SIZE:
+                await run_in_threadpool(f.write, buffer)
+                written += len(buffer)
+                buffer = bytearray()
+        if buffer:
+            await run_in_threadpool(f.write, buffer)
+            written += len(buffer)
+    except ClientDisconnect:
+        logger.warning(f"Client disconnected during chunk upload {upload_id} at {offset + written}")
+    finally:
+        await run_in_threadpool(f.close)
+        meta = await run_in_threadpool(resumable_uploads.record_chunk, upload_id, offset, offset + written, writer)
+    return resumable_uploads.describe(meta)
+
+@app.get("/api/uploads/{upload_id}")
+async def api_get_upload(upload_id: str):
+    """查询上传状态与已接收的字节范围（[起始, 结束) 列表）"""
+    return resumable_uploads.describe(resumable_uploads.get(upload_id))
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def api_complete_upload(upload_id: str, sha256: str = Form(...)):
+    """完成上传：校验全部字节已接收且 sha256 一致"""
+    meta = await run_in_threadpool(resumable_uploads.complete, upload_id, sha256)
+    return resumable_uploads.describe(meta)
+
+@app.delete("/api/uploads/{upload_id}")
+async def api_delete_upload(upload_id: str):
+    """删除上传"""
+    resumable_uploads.get(upload_id)
+    await run_in_threadpool(resumable_uploads.remove, upload_id)
+    return {"upload_id": upload_id, "deleted": True}
+
+# ==================== 性能分析 API ====================
+
+@app.get("/api/profiles")
+async def api_list_profiles():
+    """性能分析设置与已保存的分析结果（最新的在前）"""
+    profiles = await run_in_threadpool(profiler.list)
+    return {"config": profiler.status(), "profiles": profiles}
+
+@app.post("/api/profiles/arm")
+async def api_arm_profiling(path: str = Form("/api/"), count: int = Form(1), mode: str = Form("cpu")):
+    """
+    对之后 count 个路径以 path 开头的请求做性能分析
+
+    mode 为 cpu（采样调用栈）、memory（tracemalloc 分配峰值）或 all。
+    """
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的分析模式: {mode}")
+    if not 1 <= count <= 100:
+        raise HTTPException(status_code=400, detail="count 需在 1 到 100 之间")
+    return await run_in_threadpool(profiler.arm, path, count, mode)
+
+@app.delete("/api/profiles/arm")
+async def api_disarm_profiling():
+    """取消尚未用完的 arm"""
+    return await run_in_threadpool(profiler.disarm)
+
+@app.get("/api/profiles/{profile_id}")
+async def api_get_profile(profile_id: str):
+    """分析结果的元数据：耗时、自身耗时最多的函数、内存峰值与分配最多的位置"""
+    meta = profiler.get(profile_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在或已删除")
+    return meta
+
+@app.get("/api/profiles/{profile_id}/{kind}")
+async def api_download_profile(profile_id: str, kind: str):
+    """
+    下载分析文件
+
+    kind 为 speedscope（可拖入 https://www.speedscope.app 查看）、pstats（python -m pstats 或
+    snakeviz 打开）或 tracemalloc（tracemalloc.Snapshot.load 读取）。
+    """
+    if kind not in PROFILE_FILE_KINDS:
+        raise HTTPException(status_code=404, detail="不支持的文件类型")
+    path = profiler.file_path(profile_id, kind)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="分析结果不存在或已删除")
+    suffix, media_type = PROFILE_FILE_KINDS[kind]
+    return FileResponse(path, media_type=media_type, filename=f"profile_{profile_id}{suffix}")
+
+@app.delete("/api/profiles/{profile_id}")
+async def api_delete_profile(profile_id: str):
+    """删除分析结果"""
+    if profiler.get(profile_id) is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在或已删除")
+    await run_in_threadpool(profiler.remove, profile_id)
+    return {"profile_id": profile_id, "deleted": True}
+
 # ==================== 系统 API ====================
 
+# 定期清扫：过期工作文件、过期结果、过期 HLS 任务与上传，并将用量压回配额以内
+temp_store.add_sweep_hook(cleanup_old_temp_files)
+temp_store.add_sweep_hook(cleanup_orphaned_temp_files)
+temp_store.add_sweep_hook(result_store.prune)
+temp_store.add_sweep_hook(lambda: hls_jobs.prune_jobs(HLS_DIR))
+temp_store.add_sweep_hook(resumable_uploads.prune)
+
+# 多 worker 模式下只有持有该锁的 worker 执行清扫，持有者退出后由其他 worker 接替
+sweeper_lock = LeaderLock(os.path.join(STATE_DIR, "sweeper.lock"))
+
+async def run_sweeper_when_leader():
+    while not sweeper_lock.try_acquire():
+        await asyncio.sleep(SWEEP_INTERVAL)
+    await temp_store.run_sweeper()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """启动后台清扫任务（立即清扫一次）与功能预热，都不阻塞启动"""
+    app.state.temp_sweeper = asyncio.ensure_future(run_sweeper_when_leader())
+    threading.Thread(target=features.warmup, args=(warmup_list(),), name="feature-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def stop_temp_sweeper():
+    sweeper = getattr(app.state, "temp_sweeper", None)
+    if sweeper:
+        sweeper.cancel()
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
@@ -849,26 +2101,104 @@ async def health_check():
         "status": "ok",
         "version": "1.0.0",
         "features": {
-            "pdf": PDF_AVAILABLE,
-            "photo": REMBG_AVAILABLE,
-            "audio": AUDIO_AVAILABLE,
+            "pdf": features["pdf"].available(),
+            "photo": features["photo"].available(),
+            "audio": features["audio"].available(),
             "video": False
         }
     }
 
+@app.get("/api/ready")
+async def api_ready():
+    """
+    就绪检查：分别报告每个功能的加载状态
+
+    health 在服务启动后立即可用；后台预热结束前本接口返回 503，
+    各功能状态为 pending（按需加载）/ loading / ready / unavailable（未安装）/ error。
+    """
+    ready = features.ready()
+    body = {
+        "ready": ready,
+        "features": features.status(),
+        "ffmpeg": FFMPEG_AVAILABLE,
+        "ffprobe": FFPROBE_AVAILABLE,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def collect_service_metrics():
+    """抓取时采集的服务指标：临时空间、结果缓存、准入控制、ffmpeg 槽位与排队、HLS 任务"""
+    status = temp_store.status()
+    yield "yunran_temp_store_bytes", "gauge", "临时目录各区域用量（字节）", [
+        ({"area": area}, size) for area, size in sorted(status["areas"].items())
+    ]
+    yield "yunran_temp_store_reserved_bytes", "gauge", "已预留的临时空间（字节）", [({}, status["reserved_bytes"])]
+    yield "yunran_temp_store_quota_bytes", "gauge", "临时空间配额（字节）", [({}, status["quota_bytes"])]
+    yield "yunran_temp_store_evicted_bytes_total", "counter", "累计淘汰的缓存与结果（字节）", [
+        ({}, status["evicted_bytes"])
+    ]
+    yield "yunran_temp_disk_free_bytes", "gauge", "临时目录所在磁盘的可用空间（字节）", [({}, status["disk_free_bytes"])]
+    
+    cache_status = result_cache.status()
+    yield "yunran_result_cache_bytes", "gauge", "结果缓存占用（字节）", [({}, cache_status["bytes"])]
+    yield "yunran_result_cache_entries", "gauge", "结果缓存条目数", [({}, cache_status["entries"])]
+    
+    gates = sorted(admission.status()["features"].items())
+    yield "yunran_admission_running", "gauge", "各功能正在处理的重负载请求数", [
+        ({"feature": feature}, gate["running"]) for feature, gate in gates
+    ]
+    yield "yunran_admission_queued", "gauge", "各功能排队等待准入的请求数", [
+        ({"feature": feature}, gate["queued"]) for feature, gate in gates
+    ]
+    yield "yunran_admission_rejected_total", "counter", "各功能因超出处理能力返回 429 的请求数", [
+        ({"feature": feature}, gate["rejected"]) for feature, gate in gates
+    ]
+    yield "yunran_admission_memory_bytes", "gauge", "已准入请求的估算内存占用（字节）", [({}, admission.memory_in_use)]
+    
+    slots = sorted(slot_usage().items())
+    yield "yunran_ffmpeg_slots", "gauge", "各功能的 ffmpeg 并发上限", [
+        ({"feature": feature}, usage["limit"]) for feature, usage in slots
+    ]
+    yield "yunran_ffmpeg_running", "gauge", "各功能正在运行的 ffmpeg 任务数", [
+        ({"feature": feature}, usage["running"]) for feature, usage in slots
+    ]
+    yield "yunran_ffmpeg_queued", "gauge", "各功能排队等待的 ffmpeg 任务数", [
+        ({"feature": feature}, usage["queued"]) for feature, usage in slots
+    ]
+    
+    job_counts = {}
+    for job in hls_jobs.list_jobs():
+        job_counts[job["status"]] = job_counts.get(job["status"], 0) + 1
+    yield "yunran_hls_jobs", "gauge", "按状态统计的 HLS 任务数", [
+        ({"status": status}, count) for status, count in sorted(job_counts.items())
+    ]
+
+METRICS_REGISTRY.add_collector(collect_service_metrics)
+
+@app.get("/api/metrics")
+async def api_metrics():
+    """运行指标（Prometheus 文本格式）"""
+    # 临时空间用量统计需要遍历目录，放到线程池中执行
+    body = await run_in_threadpool(METRICS_REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.get("/api/status")
 async def api_status():
     """获取服务状态"""
+    rembg_model_available, rembg_model_path = check_rembg_model()
     return {
         "status": "running",
         "version": "1.0.0",
         "temp_dir": TEMP_DIR,
-        "temp_files_count": len(temp_files_registry),
+        "temp_files_count": await run_in_threadpool(len, temp_files_registry),
+        "temp_store": await run_in_threadpool(temp_store.status),
+        "admission": admission.status(),
+        "result_cache": await run_in_threadpool(result_cache.status),
+        "worker": {"pid": os.getpid(), "workers": WORKER_COUNT, "sweeper": sweeper_lock.held},
         "features": {
             "idcard": True,
-            "pdf": PDF_AVAILABLE,
-            "photo": REMBG_AVAILABLE,
-            "audio": AUDIO_AVAILABLE,
+            "pdf": features["pdf"].available(),
+            "photo": features["photo"].available(),
+            "audio": features["audio"].available(),
             "video": False
         },
         "dependencies": {
@@ -877,18 +2207,35 @@ async def api_status():
                 "message": "已安装" if FFMPEG_AVAILABLE else "未安装，音频转换功能需要 ffmpeg"
             },
             "rembg_model": {
-                "available": REMBG_MODEL_AVAILABLE,
-                "path": REMBG_MODEL_PATH,
-                "message": "模型已下载" if REMBG_MODEL_AVAILABLE else "模型未下载，首次使用时会自动下载"
+                "available": rembg_model_available,
+                "path": rembg_model_path,
+                "message": "模型已下载" if rembg_model_available else "模型未下载，首次使用时会自动下载"
             }
         }
     }
 
+@app.get("/api/tasks")
+async def api_tasks():
+    """获取正在运行的 ffmpeg 任务及进度"""
+    return {"tasks": active_runs()}
+
+@app.api_route("/api/results/{result_id}", methods=["GET", "HEAD"])
+async def api_get_result(request: Request, result_id: str):
+    """
+    重新下载转换结果
+
+    支持 Range / If-Range 断点续传，结果在保留期内有效。
+    """
+    result = result_store.get(result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="结果不存在或已过期")
+    return result_store.response(result, request)
+
 @app.post("/api/cleanup")
 async def api_cleanup():
     """手动触发临时文件清理"""
     try:
-        cleanup_all_temp_files()
+        await run_in_threadpool(cleanup_all_temp_files)
         return {"status": "ok", "message": "临时文件已清理"}
     except Exception as e:
         logger.error(f"Error during cleanup: {e}")
@@ -905,4 +2252,10 @@ async def root():
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000, log_level="info")
+    # 打包后的可执行文件由 Electron 通过环境变量指定监听方式：YUNRAN_UDS 为 Unix 域套接字路径，
+    # 未设置时监听 127.0.0.1:YUNRAN_PORT（默认 8000）
+    uds = os.environ.get("YUNRAN_UDS")
+    if uds:
+        uvicorn.run(app, uds=uds, log_level="info")
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("YUNRAN_PORT", "8000")), log_level="info")
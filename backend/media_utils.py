@@ -0,0 +1,650 @@
+"""
+音视频处理辅助函数
+
+集中维护 ffmpeg 编码参数、MIME 类型以及命令构建逻辑，供 main.py 中的音视频接口复用。
+"""
+import json
+import re
+import struct
+from typing import List, Optional, Tuple
+
+# 音频输出格式 -> ffmpeg 编码参数
+AUDIO_ENCODERS = {
+    'mp3': ['-c:a', 'libmp3lame'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'aac': ['-c:a', 'aac'],
+    'flac': ['-c:a', 'flac'],
+    'ogg': ['-c:a', 'libvorbis'],
+    'm4a': ['-c:a', 'aac'],
+    'wma': ['-c:a', 'wmav2'],
+}
+
+# 有损格式才需要比特率参数
+AUDIO_BITRATE_FORMATS = {'mp3', 'aac', 'ogg', 'm4a', 'wma'}
+
+AUDIO_MIME_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'aac': 'audio/aac',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+    'm4a': 'audio/mp4',
+    'wma': 'audio/x-ms-wma',
+}
+
+# 单次扇出最多输出数量
+MAX_AUDIO_TARGETS = 8
+
+
+def normalize_bitrate(bitrate: str, default: str = '192k') -> str:
+    """规范化比特率写法，如 192 -> 192k"""
+    bitrate = (bitrate or '').strip().lower()
+    if not bitrate:
+        return default
+    if not bitrate.endswith('k'):
+        bitrate = bitrate + 'k'
+    if not re.match(r'^\d{2,4}k$', bitrate):
+        raise ValueError(f"无效的比特率: {bitrate}")
+    return bitrate
+
+
+def parse_audio_targets(spec: str, default_bitrate: str = '192k') -> List[Tuple[str, str]]:
+    """
+    解析扇出目标列表
+
+    格式为逗号分隔的 "格式[:比特率]"，如 "mp3:192k,m4a:256k,flac"。
+    无损格式忽略比特率。返回 [(format, bitrate), ...]，重复项会被去除。
+    """
+    targets = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        fmt, _, bitrate = item.partition(':')
+        fmt = fmt.strip().lower()
+        if fmt not in AUDIO_ENCODERS:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        if fmt in AUDIO_BITRATE_FORMATS:
+            bitrate = normalize_bitrate(bitrate, default_bitrate)
+        else:
+            bitrate = ''
+        if (fmt, bitrate) not in targets:
+            targets.append((fmt, bitrate))
+
+    if not targets:
+        raise ValueError("至少需要指定一个输出格式")
+    if len(targets) > MAX_AUDIO_TARGETS:
+        raise ValueError(f"最多支持同时输出{MAX_AUDIO_TARGETS}种格式")
+    return targets
+
+
+def audio_output_name(fmt: str, bitrate: str) -> str:
+    """扇出结果在压缩包中的文件名"""
+    if bitrate:
+        return f"converted_{bitrate}.{fmt}"
+    return f"converted.{fmt}"
+
+
+def build_audio_fanout_cmd(input_path: str, outputs: List[Tuple[str, str, str]],
+                           audio_filter: Optional[str] = None) -> List[str]:
+    """
+    构建一次解码、多路编码的 ffmpeg 命令
+
+    outputs 为 [(format, bitrate, output_path), ...]。ffmpeg 对同一输入流只解码一次，
+    解码后的帧分发给每个输出的编码器（ffmpeg 6.1+ 中各编码器在独立线程中并行运行）。
+    指定 audio_filter 时滤镜只运行一次，再由 asplit 分发给各输出。
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", input_path]
+    if audio_filter:
+        labels = [f"[out{idx}]" for idx in range(len(outputs))]
+        cmd.extend(["-filter_complex",
+                    f"[0:a:0]{audio_filter},asplit={len(outputs)}{''.join(labels)}"])
+    for idx, (fmt, bitrate, output_path) in enumerate(outputs):
+        if audio_filter:
+            cmd.extend(["-map", f"[out{idx}]"])
+        else:
+            cmd.extend(["-map", "0:a:0", "-vn"])
+        cmd.extend(AUDIO_ENCODERS[fmt])
+        if bitrate:
+            cmd.extend(["-b:a", bitrate])
+        cmd.append(output_path)
+    return cmd
+
+
+# ==================== 流复制规划 ====================
+
+# 视频容器可直接封装（无需转码）的编码，None 表示不限制
+VIDEO_CONTAINER_CODECS = {
+    'mp4': {'video': {'h264', 'hevc', 'mpeg4', 'av1'}, 'audio': {'aac', 'mp3', 'alac', 'ac3', 'opus'}},
+    'mov': {'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+            'audio': {'aac', 'mp3', 'alac', 'pcm_s16le', 'pcm_s24le'}},
+    'mkv': {'video': None, 'audio': None},
+    'webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'opus', 'vorbis'}},
+    'avi': {'video': {'mpeg4', 'h264', 'mjpeg', 'msmpeg4v2', 'msmpeg4v3'}, 'audio': {'mp3', 'ac3', 'pcm_s16le'}},
+    'flv': {'video': {'h264', 'flv1'}, 'audio': {'aac', 'mp3'}},
+    'wmv': {'video': {'wmv1', 'wmv2', 'msmpeg4v3'}, 'audio': {'wmav1', 'wmav2'}},
+}
+
+# 视频容器需要转码时使用的编码参数 (视频, 音频)
+VIDEO_TRANSCODE_ARGS = {
+    'mp4': (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'], ['-c:a', 'aac', '-b:a', '192k']),
+    'webm': (['-c:v', 'libvpx-vp9', '-crf', '30', '-b:v', '0'], ['-c:a', 'libopus', '-b:a', '128k']),
+    'avi': (['-c:v', 'mpeg4', '-q:v', '3'], ['-c:a', 'libmp3lame', '-q:a', '4']),
+    'mkv': (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'], ['-c:a', 'aac', '-b:a', '192k']),
+    'mov': (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'], ['-c:a', 'aac', '-b:a', '192k']),
+    'flv': (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'], ['-c:a', 'aac', '-b:a', '192k']),
+    'wmv': (['-c:v', 'wmv2', '-q:v', '3'], ['-c:a', 'wmav2', '-b:a', '192k']),
+}
+
+# 音频输出格式可直接封装的编码
+AUDIO_CONTAINER_CODECS = {
+    'mp3': {'mp3'},
+    'aac': {'aac'},
+    'm4a': {'aac', 'alac'},
+    'flac': {'flac'},
+    'ogg': {'vorbis', 'opus', 'flac'},
+    'wav': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'},
+    'wma': {'wmav1', 'wmav2'},
+}
+
+# 源码率超过目标码率的比例在此范围内仍视为可直接复制
+BITRATE_COPY_TOLERANCE = 1.05
+
+
+def build_probe_cmd(input_path: str) -> List[str]:
+    """构建 ffprobe 探测命令"""
+    return [
+        "ffprobe", "-v", "error", "-show_streams", "-show_format",
+        "-of", "json", input_path
+    ]
+
+
+def select_streams(probe: dict) -> dict:
+    """从探测结果中选出主视频流（忽略封面图）和主音频流"""
+    selected = {}
+    for stream in probe.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type not in ('video', 'audio') or codec_type in selected:
+            continue
+        if codec_type == 'video' and stream.get('disposition', {}).get('attached_pic'):
+            continue
+        selected[codec_type] = stream
+    return selected
+
+
+def probe_duration(probe: Optional[dict]) -> Optional[float]:
+    """从探测结果中获取时长（秒）"""
+    if not probe:
+        return None
+    try:
+        return float(probe.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ffmpeg_duration(stderr: str) -> Optional[float]:
+    """从 ffmpeg 输出的 "Duration: 00:01:02.50" 中解析时长（秒），ffprobe 不可用时使用"""
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', stderr)
+    if not match:
+        return None
+    h, m, sec = match.groups()
+    return int(h) * 3600 + int(m) * 60 + float(sec)
+
+
+def _stream_bitrate(stream: dict, probe: dict) -> Optional[int]:
+    """获取流码率，流上缺失时退回容器码率"""
+    for value in (stream.get('bit_rate'), probe.get('format', {}).get('bit_rate')):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def plan_video_conversion(probe: Optional[dict], target: str, scale_filter: str = '',
+                          force_transcode: bool = False, video_args: Optional[List[str]] = None) -> dict:
+    """
+    规划视频转换：逐流决定复制还是转码
+
+    返回 {"mode": "remux" | "copy" | "transcode", "streams": [...], "args": [...]}。
+    remux 表示全部流直接复制（仅换容器），copy 表示部分流复制，transcode 表示全部转码。
+    probe 为 None（ffprobe 不可用）时沿用旧逻辑：mp4/webm/avi 转码，其余格式直接复制。
+    video_args 用于替换默认的视频编码参数（如时间预算模式选出的预设）。
+    """
+    default_video_args, audio_args = VIDEO_TRANSCODE_ARGS[target]
+    video_args = video_args or default_video_args
+    scale_args = ["-vf", scale_filter] if scale_filter else []
+
+    if probe is None:
+        if target in ('mp4', 'webm', 'avi'):
+            return {"mode": "transcode", "streams": [], "args": scale_args + video_args + audio_args}
+        return {"mode": "remux", "streams": [], "args": scale_args + ["-c:v", "copy", "-c:a", "copy"]}
+
+    allowed = VIDEO_CONTAINER_CODECS[target]
+    selected = select_streams(probe)
+    if 'video' not in selected and 'audio' not in selected:
+        raise ValueError("输入文件中没有可用的音视频流")
+
+    args, streams = [], []
+    for codec_type in ('video', 'audio'):
+        stream = selected.get(codec_type)
+        if stream is None:
+            continue
+        codec = stream.get('codec_name', '')
+        codec_allowed = allowed[codec_type] is None or codec in allowed[codec_type]
+        copy = codec_allowed and not force_transcode and not (codec_type == 'video' and scale_filter)
+        args.extend(["-map", f"0:{stream['index']}"])
+        if copy:
+            args.extend([f"-c:{codec_type[0]}", "copy"])
+        elif codec_type == 'video':
+            args.extend(scale_args + video_args)
+        else:
+            args.extend(audio_args)
+        streams.append({
+            "index": stream['index'],
+            "type": codec_type,
+            "codec": codec,
+            "action": "copy" if copy else "transcode",
+        })
+
+    actions = {s['action'] for s in streams}
+    if actions == {'copy'}:
+        mode = 'remux'
+    elif actions == {'transcode'}:
+        mode = 'transcode'
+    else:
+        mode = 'copy'
+    return {"mode": mode, "streams": streams, "args": args}
+
+
+def plan_audio_conversion(probe: Optional[dict], target: str, bitrate: str = '',
+                          force_transcode: bool = False) -> dict:
+    """
+    规划音频转换：源编码与目标格式一致且码率不高于目标时直接复制
+
+    返回 {"mode": "remux" | "transcode", "codec": ..., "args": [...]}，
+    args 只在 remux 时有效（transcode 由调用方按原有流程处理）。
+    """
+    if probe is None or force_transcode:
+        return {"mode": "transcode", "codec": None, "args": []}
+
+    stream = select_streams(probe).get('audio')
+    if stream is None:
+        raise ValueError("输入文件中没有音频流")
+
+    codec = stream.get('codec_name', '')
+    copy = codec in AUDIO_CONTAINER_CODECS.get(target, set())
+    if copy and target in AUDIO_BITRATE_FORMATS and bitrate:
+        source_bitrate = _stream_bitrate(stream, probe)
+        target_bitrate = int(bitrate.rstrip('k')) * 1000
+        copy = source_bitrate is not None and source_bitrate <= target_bitrate * BITRATE_COPY_TOLERANCE
+
+    if not copy:
+        return {"mode": "transcode", "codec": codec, "args": []}
+    return {
+        "mode": "remux",
+        "codec": codec,
+        "args": ["-map", f"0:{stream['index']}", "-vn", "-c:a", "copy"],
+    }
+
+
+# ==================== 响度标准化 ====================
+
+# EBU R128 标准化参数
+LOUDNORM_TRUE_PEAK = -1.5
+LOUDNORM_LRA = 11.0
+LOUDNORM_TARGET_RANGE = (-70.0, -5.0)
+
+
+def parse_loudness_target(value: str) -> Optional[float]:
+    """解析目标响度（LUFS），为空表示不做标准化"""
+    value = (value or '').strip().lower()
+    if not value or value in ('none', 'off', 'false', '0'):
+        return None
+    if value in ('ebu', 'r128'):
+        return -23.0
+    try:
+        target = float(value.replace('lufs', '').strip())
+    except ValueError:
+        raise ValueError(f"无效的目标响度: {value}")
+    low, high = LOUDNORM_TARGET_RANGE
+    if not low <= target <= high:
+        raise ValueError(f"目标响度必须在{low:g}到{high:g} LUFS之间")
+    return target
+
+
+def build_loudness_measure_cmd(input_path: str, pre_filter: str = '') -> List[str]:
+    """
+    构建响度测量命令（流式解码到 null 输出，结果以 JSON 打印在 stderr）
+
+    pre_filter 为测量前先应用的滤镜（如流水线中标准化之前的裁剪、音量调整）。
+    """
+    measure = f"loudnorm=TP={LOUDNORM_TRUE_PEAK}:LRA={LOUDNORM_LRA}:print_format=json"
+    return [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", input_path,
+        "-map", "0:a:0", "-vn",
+        "-af", f"{pre_filter},{measure}" if pre_filter else measure,
+        "-f", "null", "-"
+    ]
+
+
+def parse_loudness_stats(stderr: str) -> dict:
+    """
+    从测量命令的 stderr 中提取响度统计
+
+    只保留与目标无关的输入测量值，同时记录输入采样率，便于在标准化后恢复
+    （loudnorm 内部会上采样到 192kHz）。
+    """
+    start = stderr.rfind('{')
+    end = stderr.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError("未能获取响度测量结果")
+    data = json.loads(stderr[start:end + 1])
+    stats = {key: float(data[key]) for key in ('input_i', 'input_tp', 'input_lra', 'input_thresh')}
+
+    match = re.search(r'Audio:.*?(\d+) Hz', stderr)
+    stats['sample_rate'] = int(match.group(1)) if match else 48000
+    return stats
+
+
+def build_loudnorm_filter(stats: dict, target: float) -> str:
+    """根据缓存的测量值构建第二遍（实际标准化）滤镜"""
+    return (
+        f"loudnorm=I={target:g}:TP={LOUDNORM_TRUE_PEAK}:LRA={LOUDNORM_LRA}"
+        f":measured_I={stats['input_i']}:measured_TP={stats['input_tp']}"
+        f":measured_LRA={stats['input_lra']}:measured_thresh={stats['input_thresh']}"
+        f":linear=true,aresample={stats['sample_rate']}"
+    )
+
+
+# ==================== 波形峰值 ====================
+
+# 波形解码参数：单声道 8kHz 足够绘制预览，且解码/传输数据量小
+WAVEFORM_SAMPLE_RATE = 8000
+# 最精细一级中每个峰值覆盖的采样数
+WAVEFORM_BASE_SAMPLES_PER_PEAK = 256
+# 最粗一级的峰值数量上限
+WAVEFORM_MIN_LEVEL_LENGTH = 512
+# 二进制格式标识
+WAVEFORM_MAGIC = b'YRWF'
+WAVEFORM_VERSION = 1
+
+
+def build_pcm_decode_cmd(input_path: str, sample_rate: int = WAVEFORM_SAMPLE_RATE) -> List[str]:
+    """构建将输入解码为单声道 s16le PCM 并写到 stdout 的 ffmpeg 命令"""
+    return [
+        "ffmpeg", "-hide_banner", "-v", "error", "-i", input_path,
+        "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "s16le", "-"
+    ]
+
+
+class WaveformAccumulator:
+    """
+    流式计算多分辨率 min/max 峰值
+
+    依次 feed() s16le 单声道 PCM 数据（如 ffmpeg 写到 stdout 的数据块），每块用 NumPy
+    计算最精细一级的峰值；finish() 时再由相邻两点合并逐级生成更粗的层级（mipmap）。
+    """
+
+    def __init__(self, samples_per_peak: int = WAVEFORM_BASE_SAMPLES_PER_PEAK,
+                 min_level_length: int = WAVEFORM_MIN_LEVEL_LENGTH):
+        self.samples_per_peak = samples_per_peak
+        self.min_level_length = min_level_length
+        self.total_samples = 0
+        self._carry = b''
+        self._mins = []
+        self._maxs = []
+
+    def feed(self, data: bytes) -> None:
+        import numpy as np
+
+        data = self._carry + data
+        usable = len(data) - len(data) % (self.samples_per_peak * 2)
+        self._carry = data[usable:]
+        if usable:
+            samples = np.frombuffer(data[:usable], dtype='<i2').reshape(-1, self.samples_per_peak)
+            self._mins.append(samples.min(axis=1))
+            self._maxs.append(samples.max(axis=1))
+            self.total_samples += samples.size
+
+    def finish(self):
+        """
+        返回 (levels, total_samples)，levels 为 [(samples_per_peak, mins, maxs), ...]，
+        mins/maxs 为 int8 数组（按 16 位采样的高 8 位量化）。
+        """
+        import numpy as np
+
+        # 末尾不足一个峰值宽度的采样
+        tail_len = len(self._carry) - len(self._carry) % 2
+        if tail_len:
+            tail = np.frombuffer(self._carry[:tail_len], dtype='<i2')
+            self._mins.append(tail.min(keepdims=True))
+            self._maxs.append(tail.max(keepdims=True))
+            self.total_samples += tail.size
+            self._carry = b''
+
+        if self._mins:
+            level_min = (np.concatenate(self._mins) >> 8).astype(np.int8)
+            level_max = (np.concatenate(self._maxs) >> 8).astype(np.int8)
+        else:
+            level_min = np.zeros(0, dtype=np.int8)
+            level_max = np.zeros(0, dtype=np.int8)
+
+        samples_per_peak = self.samples_per_peak
+        levels = [(samples_per_peak, level_min, level_max)]
+        while len(level_min) > self.min_level_length:
+            if len(level_min) % 2:
+                level_min = np.append(level_min, level_min[-1])
+                level_max = np.append(level_max, level_max[-1])
+            level_min = level_min.reshape(-1, 2).min(axis=1)
+            level_max = level_max.reshape(-1, 2).max(axis=1)
+            samples_per_peak *= 2
+            levels.append((samples_per_peak, level_min, level_max))
+
+        return levels, self.total_samples
+
+
+def pack_waveform(levels, total_samples: int, sample_rate: int = WAVEFORM_SAMPLE_RATE) -> bytes:
+    """
+    打包波形数据为紧凑二进制格式（小端）
+
+    头部: magic(4s) version(u16) level_count(u16) sample_rate(u32) total_samples(u32)
+    每级: samples_per_peak(u32) length(u32)，随后依次为各级 min/max 交错的 int8 数据
+    """
+    import numpy as np
+
+    parts = [struct.pack('<4sHHII', WAVEFORM_MAGIC, WAVEFORM_VERSION, len(levels),
+                         sample_rate, total_samples)]
+    for samples_per_peak, level_min, _ in levels:
+        parts.append(struct.pack('<II', samples_per_peak, len(level_min)))
+    for _, level_min, level_max in levels:
+        parts.append(np.column_stack((level_min, level_max)).astype(np.int8).tobytes())
+    return b''.join(parts)
+
+
+def unpack_waveform(blob: bytes) -> dict:
+    """将二进制波形数据解析为 JSON 友好的字典"""
+    import numpy as np
+
+    magic, version, level_count, sample_rate, total_samples = struct.unpack_from('<4sHHII', blob, 0)
+    if magic != WAVEFORM_MAGIC or version != WAVEFORM_VERSION:
+        raise ValueError("无效的波形数据")
+    offset = struct.calcsize('<4sHHII')
+    headers = []
+    for _ in range(level_count):
+        headers.append(struct.unpack_from('<II', blob, offset))
+        offset += 8
+
+    levels = []
+    for samples_per_peak, length in headers:
+        data = np.frombuffer(blob, dtype=np.int8, count=length * 2, offset=offset)
+        offset += length * 2
+        levels.append({
+            "samples_per_peak": samples_per_peak,
+            "length": length,
+            "peaks": data.tolist(),
+        })
+
+    return {
+        "sample_rate": sample_rate,
+        "total_samples": total_samples,
+        "duration": round(total_samples / sample_rate, 3) if sample_rate else 0,
+        "levels": levels,
+    }
+
+
+# ==================== 关键帧缩略图 ====================
+
+THUMBNAIL_MAX_COUNT = 100
+THUMBNAIL_MIN_WIDTH = 32
+THUMBNAIL_MAX_WIDTH = 480
+
+_SHOWINFO_RE = re.compile(r'showinfo@t(\d+) @ [^\]]*\] n:\s*0 .*?pts_time:(-?[\d.]+)')
+
+
+def thumbnail_times(duration: float, count: int) -> List[float]:
+    """均匀分布的采样时间点（取各区间中点，避开片头片尾）"""
+    return [round((i + 0.5) * duration / count, 3) for i in range(count)]
+
+
+def thumbnail_cell_size(probe: Optional[dict], width: int) -> Tuple[int, int]:
+    """按视频宽高比计算单格尺寸，宽高取偶数；无法探测时按 16:9"""
+    stream = select_streams(probe).get('video') if probe else None
+    src_w, src_h = (stream or {}).get('width'), (stream or {}).get('height')
+    if src_w and src_h:
+        height = width * src_h / src_w
+    else:
+        height = width * 9 / 16
+    return width, max(2, int(round(height / 2)) * 2)
+
+
+def build_thumbnail_sprite_cmd(input_path: str, times: List[float], cell_width: int, cell_height: int,
+                               columns: int, output_path: str) -> List[str]:
+    """
+    构建关键帧缩略图精灵图命令
+
+    每个时间点作为一路输入单独定位（-skip_frame nokey 只解码关键帧，-noaccurate_seek
+    取定位点之前最近的关键帧），各取一帧缩放后由 tile 滤镜拼成一张图。
+    showinfo@tN 输出每格实际关键帧的时间戳（-copyts 保留原始时间）。
+    """
+    rows = -(-len(times) // columns)
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-copyts"]
+    for t in times:
+        cmd.extend(["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{t:.3f}", "-i", input_path])
+
+    chains = []
+    for i in range(len(times)):
+        chains.append(
+            f"[{i}:v:0]trim=end_frame=1,showinfo@t{i},setpts=PTS-STARTPTS,"
+            f"scale={cell_width}:{cell_height}:force_original_aspect_ratio=decrease,"
+            f"pad={cell_width}:{cell_height}:-1:-1,setsar=1[v{i}]"
+        )
+    labels = "".join(f"[v{i}]" for i in range(len(times)))
+    chains.append(f"{labels}concat=n={len(times)}:v=1:a=0,tile={columns}x{rows}[sprite]")
+
+    cmd.extend([
+        "-filter_complex", ";".join(chains),
+        "-map", "[sprite]", "-frames:v", "1", "-q:v", "4", output_path
+    ])
+    return cmd
+
+
+def parse_thumbnail_times(stderr: str, count: int) -> List[Optional[float]]:
+    """从 showinfo 输出中解析每格实际关键帧时间，缺失的项为 None"""
+    frame_times: List[Optional[float]] = [None] * count
+    for match in _SHOWINFO_RE.finditer(stderr):
+        index = int(match.group(1))
+        if index < count and frame_times[index] is None:
+            frame_times[index] = round(float(match.group(2)), 3)
+    return frame_times
+
+
+# ==================== HLS 分段输出 ====================
+
+# 清晰度 -> (高度, 最大码率)
+HLS_RENDITIONS = {
+    '1080p': (1080, '5000k'),
+    '720p': (720, '2800k'),
+    '480p': (480, '1400k'),
+    '360p': (360, '800k'),
+}
+# 分段类型 -> 分段文件扩展名
+HLS_SEGMENT_TYPES = {'fmp4': 'm4s', 'ts': 'ts'}
+HLS_MASTER_PLAYLIST = 'master.m3u8'
+MAX_HLS_RENDITIONS = 4
+
+
+def parse_hls_renditions(spec: str) -> List[str]:
+    """
+    解析清晰度列表，如 "720p,360p"；为空或 original 表示仅输出原始分辨率
+
+    抛出 ValueError 表示参数无效。
+    """
+    renditions = []
+    for item in (spec or 'original').split(','):
+        name = item.strip().lower()
+        if not name:
+            continue
+        if name != 'original' and name not in HLS_RENDITIONS:
+            raise ValueError(f"不支持的清晰度: {item}")
+        if name not in renditions:
+            renditions.append(name)
+    if not renditions:
+        renditions = ['original']
+    if len(renditions) > MAX_HLS_RENDITIONS:
+        raise ValueError(f"最多支持 {MAX_HLS_RENDITIONS} 种清晰度")
+    return renditions
+
+
+def build_hls_cmd(input_path: str, job_dir: str, renditions: List[str], has_audio: bool,
+                  segment_type: str = 'fmp4', segment_seconds: int = 4) -> List[str]:
+    """
+    构建 HLS 输出命令：一次解码，split 出各清晰度分别编码
+
+    输出 master.m3u8 与 stream_N/index.m3u8、stream_N/seg_XXXXX.(m4s|ts)。
+    播放列表类型为 event，编码过程中即可按已生成的分段播放；强制按分段时长插入关键帧，
+    各清晰度的分段边界对齐，便于自适应切换。
+    """
+    count = len(renditions)
+    chains = [f"[0:v:0]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    for i, name in enumerate(renditions):
+        scale = f"scale=-2:{HLS_RENDITIONS[name][0]}" if name in HLS_RENDITIONS else "null"
+        chains.append(f"[s{i}]{scale}[v{i}]")
+
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", input_path, "-filter_complex", ";".join(chains)]
+    stream_map = []
+    for i, name in enumerate(renditions):
+        cmd.extend(["-map", f"[v{i}]"])
+        if has_audio:
+            cmd.extend(["-map", "0:a:0"])
+            stream_map.append(f"v:{i},a:{i}")
+        else:
+            stream_map.append(f"v:{i}")
+        if name in HLS_RENDITIONS:
+            maxrate = HLS_RENDITIONS[name][1]
+            bufsize = f"{int(maxrate[:-1]) * 2}k"
+            cmd.extend([f"-maxrate:v:{i}", maxrate, f"-bufsize:v:{i}", bufsize])
+
+    cmd.extend([
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-sc_threshold", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+    ])
+    if has_audio:
+        cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+
+    ext = HLS_SEGMENT_TYPES[segment_type]
+    cmd.extend([
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "event",
+        "-hls_flags", "independent_segments+temp_file",
+        "-hls_segment_type", "fmp4" if segment_type == 'fmp4' else "mpegts",
+    ])
+    if segment_type == 'fmp4':
+        cmd.extend(["-hls_fmp4_init_filename", "init.mp4"])
+    cmd.extend([
+        "-hls_segment_filename", f"{job_dir}/stream_%v/seg_%05d.{ext}",
+        "-master_pl_name", HLS_MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        f"{job_dir}/stream_%v/index.m3u8",
+    ])
+    return cmd
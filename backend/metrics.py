@@ -0,0 +1,298 @@
+"""
+运行指标（Prometheus 文本格式）
+
+不依赖 prometheus_client，只实现用到的计数器、仪表与直方图：
+- MetricsMiddleware：按路由模板记录请求数、耗时直方图与进行中请求数
+- stage()：在处理流程内部记录各阶段耗时（上传读取、解析、推理、编码、ffmpeg 执行等），
+  流程名取自当前请求的路由，后台任务与线程池中同样有效（基于 contextvars）
+- 采集时回调：临时空间用量、ffmpeg 排队数、进程内存等在抓取时才计算，平时无开销
+"""
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块
+    resource = None
+
+# 耗时直方图的桶（秒），覆盖从毫秒级接口到数分钟的转换
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_current_pipeline: contextvars.ContextVar[str] = contextvars.ContextVar('pipeline', default='none')
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """固定桶直方图，observe 只做一次二分查找与两次累加"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各桶计数（非累积，最后一个为 +Inf）, 总和]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    """指标注册表；collector 为抓取时调用的回调，返回 (名称, 类型, 说明, [(标签字典, 值)])"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    label_text = _format_labels(list(labels), list(labels.values()))
+                    lines.append(f"{name}{label_text} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'yunran_http_requests_total', '按路由与状态码统计的请求数', ('method', 'route', 'status')))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'yunran_http_request_duration_seconds', '按路由统计的请求耗时（秒）', ('method', 'route')))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'yunran_http_requests_in_flight', '正在处理的请求数', ('route',)))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'yunran_stage_duration_seconds', '处理流程内各阶段耗时（秒）', ('pipeline', 'stage')))
+
+
+class stage:
+    """
+    记录一个处理阶段的耗时，pipeline 默认为当前请求的路由
+
+    同时支持 with 与 async with。
+    """
+
+    __slots__ = ('name', 'pipeline', 'start')
+
+    def __init__(self, name: str, pipeline: Optional[str] = None):
+        self.name = name
+        self.pipeline = pipeline
+        self.start = 0.0
+
+    def __enter__(self) -> 'stage':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        STAGE_DURATION.observe((self.pipeline or _current_pipeline.get(), self.name),
+                               time.perf_counter() - self.start)
+
+    async def __aenter__(self) -> 'stage':
+        return self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
+
+
+# ---------- 进程指标 ----------
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_START_TIME = time.time()
+
+
+def _process_samples() -> Iterable[tuple]:
+    yield 'process_start_time_seconds', 'gauge', '进程启动时间（Unix 时间戳）', [({}, _START_TIME)]
+    times = os.times()
+    yield 'process_cpu_seconds_total', 'counter', '进程 CPU 时间（秒）', [({}, times.user + times.system)]
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            rss_pages = int(f.read().split()[1])
+        yield 'process_resident_memory_bytes', 'gauge', '进程常驻内存（字节）', [({}, rss_pages * _PAGE_SIZE)]
+        yield 'process_open_fds', 'gauge', '打开的文件描述符数', [({}, len(os.listdir('/proc/self/fd')))]
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss 在 Linux 上单位为 KB，macOS 上为字节
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            max_rss *= 1024
+        yield 'process_max_resident_memory_bytes', 'gauge', '进程常驻内存峰值（字节）', [({}, max_rss)]
+
+
+REGISTRY.add_collector(_process_samples)
+
+
+# ---------- 请求中间件 ----------
+
+def _route_template(routes: Sequence, scope) -> str:
+    """按路由表匹配出路由模板（如 /api/results/{result_id}），避免按实际路径产生过多标签"""
+    from starlette.routing import Match
+
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'path', 'unmatched')
+        if match == Match.PARTIAL and partial is None:
+            # 路径匹配但方法不符（405）
+            partial = getattr(route, 'path', None)
+    return partial or 'unmatched'
+
+
+class MetricsMiddleware:
+    """记录每个请求的路由、状态码、耗时与进行中请求数的 ASGI 中间件"""
+
+    def __init__(self, app, routes: Sequence):
+        self.app = app
+        self.routes = routes
+        # 不含路径参数的路由按路径缓存匹配结果，数量以路由表为上限
+        self._static_routes: Dict[Tuple[str, str], str] = {}
+
+    def _resolve(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        route = self._static_routes.get(key)
+        if route is None:
+            route = _route_template(self.routes, scope)
+            if '{' not in route and route != 'unmatched':
+                self._static_routes[key] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve(scope)
+        method = scope["method"]
+        status = 500
+        token = _current_pipeline.set(route)
+
+        async def tracking_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc((route,))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec((route,))
+            REQUESTS.inc((method, route, str(status)))
+            REQUEST_DURATION.observe((method, route), elapsed)
+            _current_pipeline.reset(token)
@@ -0,0 +1,447 @@
+"""
+多步处理流水线
+
+一次上传、按顺序执行多个步骤、只在最后编码一次，避免"抠图 -> 下载 PNG -> 重新上传换底色 -> 下载 JPEG"
+这样每一步都重新编码、重新上传：
+- image：步骤之间传递解码后的 PIL 图像（remove-bg、change-bg、resize、crop），最后 encode
+- pdf：步骤之间传递内存中的文档（merge、rotate、optimize、split），最后写出一次，拆分结果打包为 zip
+- audio：各步骤（trim、fade、volume、normalize）编译为一条滤镜链，由 ffmpeg 一次解码、一次编码，
+  不把整段音频解码到内存
+步骤以 JSON 数组描述，如 [{"op": "remove-bg"}, {"op": "change-bg", "color": "#438edb"},
+{"op": "resize", "width": 295, "height": 413, "mode": "fill"}, {"op": "encode", "format": "jpeg"}]。
+参数错误抛出 ValueError（消息可直接返回给前端）。
+"""
+import contextlib
+import io
+import json
+import math
+import re
+import time
+import zipfile
+from typing import Callable, List, Optional, Tuple
+
+from media_utils import AUDIO_ENCODERS, AUDIO_BITRATE_FORMATS, normalize_bitrate, parse_loudness_target
+from metrics import stage
+
+# 单个流水线最多步骤数（含 encode）
+MAX_STEPS = 16
+# 图像边长上限（像素）
+MAX_IMAGE_SIDE = 10000
+
+IMAGE_FORMATS = {'png': ('PNG', 'image/png'), 'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+RESIZE_MODES = ('fit', 'fill', 'stretch')
+
+# 各类型支持的步骤（encode 只能是最后一步，省略时使用默认参数）
+PIPELINE_OPS = {
+    'image': ('remove-bg', 'change-bg', 'resize', 'crop', 'encode'),
+    'pdf': ('merge', 'rotate', 'optimize', 'split', 'encode'),
+    'audio': ('trim', 'fade', 'volume', 'normalize', 'encode'),
+}
+
+
+class Timings:
+    """记录各步骤耗时（同时计入 yunran_stage_duration_seconds），用于 X-Pipeline-Timings 响应头"""
+
+    def __init__(self):
+        self.steps: List[dict] = []
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        with stage(name):
+            yield
+        self.steps.append({"step": name, "ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    def header(self) -> str:
+        return json.dumps(self.steps, separators=(',', ':'))
+
+
+# ==================== 参数解析 ====================
+
+def _int_param(step: dict, name: str, low: int, high: int, default: Optional[int] = None) -> Optional[int]:
+    value = step.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or int(value) != value:
+        raise ValueError(f"{step['op']}: {name} 必须为整数")
+    if not low <= value <= high:
+        raise ValueError(f"{step['op']}: {name} 必须在{low}到{high}之间")
+    return int(value)
+
+
+def _float_param(step: dict, name: str, low: float, high: float,
+                 default: Optional[float] = None) -> Optional[float]:
+    value = step.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{step['op']}: {name} 必须为数字")
+    if not low <= value <= high:
+        raise ValueError(f"{step['op']}: {name} 必须在{low:g}到{high:g}之间")
+    return float(value)
+
+
+def _choice_param(step: dict, name: str, choices, default: str) -> str:
+    value = str(step.get(name, default)).lower()
+    if value not in choices:
+        raise ValueError(f"{step['op']}: 不支持的 {name}: {value}")
+    return value
+
+
+def parse_color(value: str) -> Tuple[int, int, int]:
+    """解析 #rgb / #rrggbb 颜色"""
+    color = (value or '').lstrip('#')
+    if len(color) == 3:
+        color = ''.join(c * 2 for c in color)
+    if not re.match(r'^[0-9A-Fa-f]{6}$', color):
+        raise ValueError("无效的颜色格式")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def parse_page_ranges(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """解析页码范围 "1-3,5,8-"（从 1 开始，结束页包含在内，省略表示到最后一页）"""
+    ranges = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        match = re.match(r'^(\d+)(?:-(\d*))?$', item)
+        if not match:
+            raise ValueError(f"无效的页码范围: {item}")
+        start = int(match.group(1))
+        if match.group(2) is None:
+            end = start
+        else:
+            end = int(match.group(2)) if match.group(2) else None
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"无效的页码范围: {item}")
+        ranges.append((start, end))
+    return ranges
+
+
+def _normalize_step(kind: str, step: dict) -> dict:
+    """校验单个步骤并补全默认参数，返回规范化后的步骤（同时用作结果缓存键）"""
+    op = step['op']
+    if op == 'change-bg':
+        color = str(step.get('color', '#ffffff'))
+        parse_color(color)
+        return {'op': op, 'color': color.lower()}
+    if op == 'resize':
+        width = _int_param(step, 'width', 1, MAX_IMAGE_SIDE)
+        height = _int_param(step, 'height', 1, MAX_IMAGE_SIDE)
+        if width is None and height is None:
+            raise ValueError("resize: 至少需要 width 或 height")
+        mode = _choice_param(step, 'mode', RESIZE_MODES, 'fit')
+        if mode != 'fit' and (width is None or height is None):
+            raise ValueError(f"resize: {mode} 模式需要同时指定 width 和 height")
+        return {'op': op, 'width': width, 'height': height, 'mode': mode}
+    if op == 'crop':
+        return {
+            'op': op,
+            'left': _int_param(step, 'left', 0, MAX_IMAGE_SIDE, 0),
+            'top': _int_param(step, 'top', 0, MAX_IMAGE_SIDE, 0),
+            'width': _int_param(step, 'width', 1, MAX_IMAGE_SIDE),
+            'height': _int_param(step, 'height', 1, MAX_IMAGE_SIDE),
+        }
+    if op == 'rotate':
+        degrees = _int_param(step, 'degrees', -270, 270, 90)
+        if degrees % 90:
+            raise ValueError("rotate: degrees 必须为 90 的倍数")
+        pages = str(step.get('pages', '') or '')
+        if pages:
+            parse_page_ranges(pages)
+        return {'op': op, 'degrees': degrees % 360, 'pages': pages}
+    if op == 'optimize':
+        return {'op': op, 'image_quality': _int_param(step, 'image_quality', 1, 95)}
+    if op == 'split':
+        every = _int_param(step, 'every', 1, 10000)
+        ranges = str(step.get('ranges', '') or '')
+        if (every is None) == (not ranges):
+            raise ValueError("split: 需要指定 ranges 或 every 之一")
+        if ranges:
+            parse_page_ranges(ranges)
+        return {'op': op, 'every': every, 'ranges': ranges}
+    if op == 'trim':
+        start = _float_param(step, 'start', 0, 86400, 0.0)
+        end = _float_param(step, 'end', 0, 86400)
+        if end is not None and end <= start:
+            raise ValueError("trim: end 必须大于 start")
+        return {'op': op, 'start': start, 'end': end}
+    if op == 'fade':
+        fade_in = _float_param(step, 'in', 0, 3600, 0.0)
+        fade_out = _float_param(step, 'out', 0, 3600, 0.0)
+        if not fade_in and not fade_out:
+            raise ValueError("fade: 至少需要 in 或 out")
+        return {'op': op, 'in': fade_in, 'out': fade_out}
+    if op == 'volume':
+        return {'op': op, 'gain_db': _float_param(step, 'gain_db', -60, 60, 0.0)}
+    if op == 'normalize':
+        target = parse_loudness_target(str(step.get('target', '-16')))
+        if target is None:
+            raise ValueError("normalize: 需要目标响度")
+        return {'op': op, 'target': target}
+    if op == 'encode':
+        if kind == 'image':
+            if str(step.get('format', '')).lower() == 'jpg':
+                step = dict(step, format='jpeg')
+            return {
+                'op': op,
+                'format': _choice_param(step, 'format', IMAGE_FORMATS, 'png'),
+                'quality': _int_param(step, 'quality', 1, 100, 95),
+                'dpi': _int_param(step, 'dpi', 1, 1200),
+            }
+        if kind == 'audio':
+            fmt = _choice_param(step, 'format', AUDIO_ENCODERS, 'mp3')
+            bitrate = normalize_bitrate(str(step.get('bitrate', ''))) if fmt in AUDIO_BITRATE_FORMATS else ''
+            return {'op': op, 'format': fmt, 'bitrate': bitrate}
+        return {'op': op}
+    # 无参数的步骤：remove-bg、merge
+    return {'op': op}
+
+
+def parse_steps(kind: str, spec: str) -> List[dict]:
+    """解析并校验步骤列表，返回规范化后的步骤，最后一步总是 encode"""
+    if kind not in PIPELINE_OPS:
+        raise ValueError(f"不支持的流水线类型: {kind}")
+    try:
+        raw_steps = json.loads(spec or '[]')
+    except ValueError:
+        raise ValueError("steps 必须是 JSON 数组")
+    if not isinstance(raw_steps, list) or not all(isinstance(s, dict) for s in raw_steps):
+        raise ValueError("steps 必须是 JSON 数组，每个步骤为对象")
+    if len(raw_steps) > MAX_STEPS:
+        raise ValueError(f"最多支持{MAX_STEPS}个步骤")
+
+    steps = []
+    for idx, raw in enumerate(raw_steps):
+        op = str(raw.get('op', '')).lower()
+        if op not in PIPELINE_OPS[kind]:
+            raise ValueError(f"第{idx + 1}步: 不支持的操作: {op or '(空)'}")
+        if op == 'encode' and idx != len(raw_steps) - 1:
+            raise ValueError("encode 只能是最后一步")
+        steps.append(_normalize_step(kind, dict(raw, op=op)))
+    if not steps or steps[-1]['op'] != 'encode':
+        steps.append(_normalize_step(kind, {'op': 'encode'}))
+    if kind == 'audio' and sum(s['op'] == 'normalize' for s in steps) > 1:
+        raise ValueError("normalize 只能出现一次")
+    return steps
+
+
+# ==================== 图像 ====================
+
+def _flatten(Image, image, rgb: Tuple[int, int, int]):
+    """将透明图像合成到纯色背景上，返回 RGB 图像"""
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    background = Image.new('RGBA', image.size, rgb + (255,))
+    background.paste(image, (0, 0), image)
+    return background.convert('RGB')
+
+
+def _resize(Image, image, step: dict):
+    width, height, mode = step['width'], step['height'], step['mode']
+    if mode == 'stretch':
+        return image.resize((width, height), Image.LANCZOS)
+    if mode == 'fill':
+        # 按比例缩放到覆盖目标尺寸后居中裁剪（证件照尺寸）
+        from PIL import ImageOps
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    # fit：按比例缩放到目标框内，只指定一边时另一边按比例计算
+    scale = min(width / image.width if width else math.inf, height / image.height if height else math.inf)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def _crop(image, step: dict):
+    left, top = step['left'], step['top']
+    right = image.width if step['width'] is None else left + step['width']
+    bottom = image.height if step['height'] is None else top + step['height']
+    if right > image.width or bottom > image.height or left >= right or top >= bottom:
+        raise ValueError(f"crop: 裁剪区域超出图像范围 ({image.width}x{image.height})")
+    return image.crop((left, top, right, bottom))
+
+
+def run_image_pipeline(Image, source, steps: List[dict], output_path: str, timings: Timings,
+                       remove_background: Callable) -> str:
+    """
+    执行图像流水线，结果编码后写入 output_path，返回 MIME 类型
+
+    remove_background(image) -> RGBA 图像，由调用方提供（rembg 会话与缓存在调用方管理）。
+    """
+    with timings.step("decode"):
+        image = Image.open(source)
+        image.load()
+
+    for step in steps[:-1]:
+        op = step['op']
+        with timings.step(op):
+            if op == 'remove-bg':
+                image = remove_background(image)
+            elif op == 'change-bg':
+                image = _flatten(Image, image, parse_color(step['color']))
+            elif op == 'resize':
+                image = _resize(Image, image, step)
+            elif op == 'crop':
+                image = _crop(image, step)
+
+    encode = steps[-1]
+    pil_format, media_type = IMAGE_FORMATS[encode['format']]
+    with timings.step("encode"):
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            # JPEG 不支持透明，透明区域按白色处理
+            image = _flatten(Image, image, (255, 255, 255)) if 'A' in image.getbands() else image.convert('RGB')
+        options = {'quality': encode['quality']} if pil_format != 'PNG' else {}
+        if encode['dpi']:
+            options['dpi'] = (encode['dpi'], encode['dpi'])
+        image.save(output_path, format=pil_format, **options)
+    return media_type
+
+
+# ==================== PDF ====================
+
+def _page_indexes(ranges: List[Tuple[int, Optional[int]]], page_count: int) -> List[List[int]]:
+    """页码范围 -> 每组的页面下标（从 0 开始）"""
+    groups = []
+    for start, end in ranges:
+        end = page_count if end is None else end
+        if start > page_count or end > page_count:
+            raise ValueError(f"页码超出范围（共{page_count}页）: {start}-{end}")
+        groups.append(list(range(start - 1, end)))
+    return groups
+
+
+def _to_writer(pdf, document):
+    """将读取的文档复制为可修改的 PdfWriter（已是 PdfWriter 时直接返回）"""
+    if isinstance(document, pdf.PdfWriter):
+        return document
+    writer = pdf.PdfWriter()
+    for page in document.pages:
+        writer.add_page(page)
+    return writer
+
+
+def _optimize(writer, image_quality: Optional[int]) -> None:
+    """压缩页面内容流；指定 image_quality 时将图片重新压缩为该质量的 JPEG"""
+    recompressed = set()
+    for page in writer.pages:
+        page.compress_content_streams()
+        if image_quality is None:
+            continue
+        for image_file in page.images:
+            ref = image_file.indirect_reference
+            # 多页共用的图片只处理一次；带透明通道、调色板等不适合 JPEG 的图片保持不变
+            if ref is None or ref.idnum in recompressed or image_file.image.mode not in ('RGB', 'L'):
+                continue
+            image_file.replace(image_file.image, quality=image_quality)
+            recompressed.add(ref.idnum)
+
+
+def run_pdf_pipeline(pdf, sources: list, steps: List[dict], timings: Timings) -> List:
+    """
+    执行 PDF 流水线，返回最终的文档列表（PdfReader 或 PdfWriter）
+
+    sources 为 [(文件名, 可读的文件对象)]，文件需在写出之前保持打开；
+    不含 merge/split 时每个输入各自处理、各自输出。
+    """
+    with timings.step("parse"):
+        documents = []
+        for filename, source in sources:
+            try:
+                documents.append(pdf.PdfReader(source))
+            except Exception:
+                raise ValueError(f"无效的PDF文件: {filename}")
+
+    for step in steps[:-1]:
+        op = step['op']
+        with timings.step(op):
+            if op == 'merge':
+                merged = pdf.PdfWriter()
+                for document in documents:
+                    for page in document.pages:
+                        merged.add_page(page)
+                documents = [merged]
+            elif op == 'rotate':
+                documents = [_to_writer(pdf, document) for document in documents]
+                for writer in documents:
+                    if step['pages']:
+                        groups = _page_indexes(parse_page_ranges(step['pages']), len(writer.pages))
+                        indexes = sorted({idx for group in groups for idx in group})
+                    else:
+                        indexes = range(len(writer.pages))
+                    for idx in indexes:
+                        writer.pages[idx].rotate(step['degrees'])
+            elif op == 'optimize':
+                documents = [_to_writer(pdf, document) for document in documents]
+                for writer in documents:
+                    _optimize(writer, step['image_quality'])
+            elif op == 'split':
+                parts = []
+                for document in documents:
+                    page_count = len(document.pages)
+                    if step['every']:
+                        groups = [list(range(i, min(i + step['every'], page_count)))
+                                  for i in range(0, page_count, step['every'])]
+                    else:
+                        groups = _page_indexes(parse_page_ranges(step['ranges']), page_count)
+                    for group in groups:
+                        part = pdf.PdfWriter()
+                        for idx in group:
+                            part.add_page(document.pages[idx])
+                        parts.append(part)
+                documents = parts
+    return documents
+
+
+def write_pdf_documents(pdf, documents: List, output_path: str, timings: Timings) -> Tuple[str, str]:
+    """写出 PDF 流水线的结果：单个文档为 PDF，多个文档打包为 zip，返回 (MIME 类型, 文件名)"""
+    with timings.step("encode"):
+        writers = [_to_writer(pdf, document) for document in documents]
+        if len(writers) == 1:
+            with open(output_path, "wb") as f:
+                writers[0].write(f)
+            return "application/pdf", "processed.pdf"
+        # PDF 本身已压缩，zip 只做存储
+        with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            for idx, writer in enumerate(writers, 1):
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                zf.writestr(f"part_{idx}.pdf", buffer.getvalue())
+        return "application/zip", "processed.zip"
+
+
+# ==================== 音频 ====================
+
+def audio_needs_duration(steps: List[dict]) -> bool:
+    """淡出需要知道片段时长"""
+    return any(s['op'] == 'fade' and s['out'] for s in steps)
+
+
+def build_audio_filters(steps: List[dict], duration: Optional[float]) -> List[Tuple[str, str]]:
+    """
+    将步骤编译为滤镜链，返回 [(步骤名, 滤镜), ...]
+
+    normalize 的滤镜依赖之前各步骤输出的响度测量值，这里以空字符串占位，由调用方测量后填入。
+    duration 为输入时长（秒），只在淡出时需要。
+    """
+    filters = []
+    for step in steps[:-1]:
+        op = step['op']
+        if op == 'trim':
+            start, end = step['start'], step['end']
+            bounds = f"start={start:g}" + (f":end={end:g}" if end is not None else '')
+            filters.append((op, f"atrim={bounds},asetpts=PTS-STARTPTS"))
+            if duration is not None:
+                duration = max(0.0, min(duration, end if end is not None else duration) - start)
+        elif op == 'fade':
+            parts = []
+            if step['in']:
+                parts.append(f"afade=t=in:st=0:d={step['in']:g}")
+            if step['out']:
+                if duration is None:
+                    raise ValueError("无法获取音频时长，不能淡出")
+                fade_out = min(step['out'], duration)
+                parts.append(f"afade=t=out:st={duration - fade_out:g}:d={fade_out:g}")
+            filters.append((op, ','.join(parts)))
+        elif op == 'volume':
+            filters.append((op, f"volume={step['gain_db']:g}dB"))
+        elif op == 'normalize':
+            filters.append((op, ''))
+    return filters
@@ -0,0 +1,486 @@
+"""
+按需性能分析
+
+排查个别文件处理异常缓慢或内存暴涨时使用，默认关闭，关闭时每个请求只多一次请求头检查：
+- 请求头 X-Profile: cpu / memory / all 对该请求采样分析；或通过 /api/profiles/arm 为之后 N 个
+  匹配路径前缀的请求开启（前端发出的请求无法加请求头时使用）
+- CPU：后台线程按固定间隔采样所有线程的调用栈（不含空闲等待的线程），生成 speedscope 与 pstats 文件
+- 内存：开启 tracemalloc，记录请求期间的分配峰值，并在已分配内存创新高时保存快照
+- 结果保存在 temp/profiles，按数量与总大小上限删除最旧的，可通过 /api/profiles 查看与下载
+
+采样覆盖整个进程：同时处理的其他请求也会出现在结果中，排查时最好单独重放该请求。
+同一进程同时只分析一个请求，其余请求照常处理、不做分析。
+"""
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Dict, List, Optional
+
+from shared_state import FileLock
+
+logger = logging.getLogger(__name__)
+
+# 采样间隔（毫秒）
+SAMPLE_INTERVAL_MS = float(os.environ.get('YUNRAN_PROFILE_INTERVAL_MS', '5'))
+# 保留的分析结果数与总大小上限
+MAX_PROFILES = int(os.environ.get('YUNRAN_PROFILE_MAX', '20'))
+MAX_PROFILE_BYTES = int(os.environ.get('YUNRAN_PROFILE_MAX_MB', '200')) * 1024 * 1024
+# 是否接受 X-Profile 请求头（设为 0 时只能通过 arm 开启）
+HEADER_ENABLED = os.environ.get('YUNRAN_PROFILE_HEADER', '1') != '0'
+# tracemalloc 记录的调用栈深度
+TRACEMALLOC_FRAMES = 10
+# 内存快照的检查间隔（秒）；已分配内存比上次快照增长超过 10% 时重新保存
+MEMORY_CHECK_INTERVAL = 0.1
+# 内存分析结果中列出的分配位置数
+TOP_ALLOCATIONS = 20
+# arm 状态文件的重新读取间隔（秒），多 worker 模式下各进程共享
+ARM_REFRESH_SECONDS = 1.0
+
+MODES = ('cpu', 'memory', 'all')
+FILE_KINDS = {
+    'speedscope': ('.speedscope.json', 'application/json'),
+    'pstats': ('.pstats', 'application/octet-stream'),
+    'tracemalloc': ('.tracemalloc', 'application/octet-stream'),
+}
+
+# 叶子帧为这些函数的线程视为空闲（事件循环等待、线程池等待任务）；
+# 等待锁、子进程等其他阻塞仍计入采样，便于发现请求在等什么
+_IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    # concurrent.futures 线程池在 C 实现的 SimpleQueue.get 中等待
+    ('thread.py', '_worker'),
+}
+
+
+def _parse_mode(value: str) -> Optional[str]:
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return 'cpu'
+    return value if value in MODES else None
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+class _Sampler(threading.Thread):
+    """采样线程：记录各线程的调用栈，按需跟踪内存峰值快照"""
+
+    def __init__(self, interval: float, memory: bool):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.memory = memory
+        self.frames: List[dict] = []
+        self._frame_index: Dict[object, int] = {}
+        # 线程 ID -> (调用栈列表（根在前的帧序号）, 权重（秒）)
+        self.samples: Dict[int, tuple] = {}
+        self.thread_names: Dict[int, str] = {}
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_traced = 0
+        self._stopped = threading.Event()
+
+    def _index(self, code) -> int:
+        index = self._frame_index.get(code)
+        if index is None:
+            index = self._frame_index[code] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def take_snapshot(self) -> None:
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.snapshot_traced * 1.1:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_traced = current
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        last = time.perf_counter()
+        next_memory_check = last
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            for ident, frame in sys._current_frames().items():
+                if ident == own or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._index(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks, weights = self.samples.setdefault(ident, ([], []))
+                stacks.append(stack)
+                weights.append(weight)
+            if self.memory and now >= next_memory_check:
+                self.take_snapshot()
+                next_memory_check = now + MEMORY_CHECK_INTERVAL
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self.thread_names = {ident: names.get(ident, str(ident)) for ident in self.samples}
+
+
+class ProfileSession:
+    """一次请求的分析：start() 开始采样，stop() 结束采样后由 Profiler.finish 写出结果"""
+
+    def __init__(self, mode: str, interval: float = SAMPLE_INTERVAL_MS / 1000):
+        self.mode = mode
+        self.cpu = mode in ('cpu', 'all')
+        self.memory = mode in ('memory', 'all')
+        # 只分析内存时也保留低频采样，便于对照分配发生在哪个阶段
+        self.sampler = _Sampler(interval if self.cpu else max(interval, MEMORY_CHECK_INTERVAL), self.memory)
+        self._started_tracemalloc = False
+        self.start_time = 0.0
+        self.duration = 0.0
+        self.peak_bytes = 0
+
+    def start(self) -> None:
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.duration = time.perf_counter() - self.start_time
+        self.sampler.stop()
+        if self.memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self.sampler.snapshot is None:
+                self.sampler.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    # ---------- 输出 ----------
+
+    def speedscope(self, name: str) -> dict:
+        """speedscope 文件格式（https://www.speedscope.app/file-format-schema.json），每个线程一个 profile"""
+        profiles = []
+        for ident, (stacks, weights) in sorted(self.sampler.samples.items(), key=lambda item: -sum(item[1][1])):
+            profiles.append({
+                "type": "sampled",
+                "name": self.sampler.thread_names.get(ident, str(ident)),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "yunran-utils",
+            "shared": {"frames": self.sampler.frames},
+            "profiles": profiles,
+        }
+
+    def function_stats(self) -> dict:
+        """
+        按函数汇总采样：{(文件, 行号, 函数名): [样本数, 样本数, 自身耗时, 累计耗时, {调用方: [...]}]}
+
+        与 pstats 的统计格式一致，调用次数一栏为采样次数。
+        """
+        frames = self.sampler.frames
+        keys = [(f["file"], f["line"], f["name"]) for f in frames]
+        stats: Dict[tuple, list] = {}
+        for stacks, weights in self.sampler.samples.values():
+            for stack, weight in zip(stacks, weights):
+                seen = set()
+                caller = None
+                for depth, index in enumerate(stack):
+                    key = keys[index]
+                    entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                    if depth == len(stack) - 1:
+                        entry[2] += weight
+                    if key not in seen:
+                        # 递归调用只计一次累计耗时
+                        seen.add(key)
+                        entry[0] += 1
+                        entry[1] += 1
+                        entry[3] += weight
+                        if caller is not None:
+                            edge = entry[4].setdefault(caller, [0, 0, 0.0, 0.0])
+                            edge[0] += 1
+                            edge[1] += 1
+                            edge[3] += weight
+                    caller = key
+        return stats
+
+    def write_pstats(self, path: str) -> None:
+        """写入可用 pstats.Stats(path) 或 snakeviz 等工具打开的统计文件"""
+        stats = {
+            key: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+            for key, (cc, nc, tt, ct, callers) in self.function_stats().items()
+        }
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def top_functions(self, limit: int = 15) -> List[dict]:
+        items = sorted(self.function_stats().items(), key=lambda item: -item[1][2])[:limit]
+        return [
+            {"function": name, "file": f"{file}:{line}",
+             "self_seconds": round(tt, 4), "total_seconds": round(ct, 4)}
+            for (file, line, name), (_, _, tt, ct, _) in items
+        ]
+
+    def top_allocations(self, limit: int = TOP_ALLOCATIONS) -> List[dict]:
+        snapshot = self.sampler.snapshot
+        if snapshot is None:
+            return []
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        return [
+            {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+
+
+class Profiler:
+    """分析结果的存储、arm 状态与并发控制"""
+
+    def __init__(self, root: str, max_profiles: int = MAX_PROFILES, max_bytes: int = MAX_PROFILE_BYTES,
+                 header_enabled: bool = HEADER_ENABLED):
+        self.root = root
+        self.max_profiles = max_profiles
+        self.max_bytes = max_bytes
+        self.header_enabled = header_enabled
+        os.makedirs(root, exist_ok=True)
+        self._arm_path = os.path.join(root, "arm.json")
+        self._arm_lock_path = os.path.join(root, "arm.lock")
+        self._arm: Optional[dict] = None
+        self._arm_checked = 0.0
+        self._busy = threading.Lock()
+
+    # ---------- arm ----------
+
+    def _read_arm(self) -> Optional[dict]:
+        try:
+            with open(self._arm_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_arm(self, arm: Optional[dict]) -> None:
+        if arm is None or arm["remaining"] <= 0:
+            try:
+                os.remove(self._arm_path)
+            except FileNotFoundError:
+                pass
+            arm = None
+        else:
+            tmp_path = f"{self._arm_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(arm, f)
+            os.replace(tmp_path, self._arm_path)
+        self._arm, self._arm_checked = arm, time.monotonic()
+
+    def armed(self) -> Optional[dict]:
+        """当前 arm 状态，最多每秒读取一次状态文件"""
+        now = time.monotonic()
+        if now - self._arm_checked >= ARM_REFRESH_SECONDS:
+            self._arm, self._arm_checked = self._read_arm(), now
+        return self._arm
+
+    def arm(self, path_prefix: str, count: int, mode: str) -> dict:
+        with FileLock(self._arm_lock_path):
+            self._write_arm({"path": path_prefix, "remaining": count, "mode": mode})
+        return self.status()
+
+    def disarm(self) -> dict:
+        with FileLock(self._arm_lock_path):
+            self._write_arm(None)
+        return self.status()
+
+    def _claim_arm(self, path: str) -> Optional[str]:
+        """匹配的请求领取一次 arm 名额，返回分析模式"""
+        with FileLock(self._arm_lock_path):
+            arm = self._read_arm()
+            if arm is None or not path.startswith(arm["path"]) or arm["remaining"] <= 0:
+                self._arm, self._arm_checked = arm, time.monotonic()
+                return None
+            arm["remaining"] -= 1
+            self._write_arm(arm)
+            return arm["mode"]
+
+    # ---------- 请求 ----------
+
+    def requested_mode(self, scope) -> Optional[str]:
+        """请求是否要求分析（请求头或 arm），未要求时返回 None"""
+        if self.header_enabled:
+            for name, value in scope.get("headers", []):
+                if name == b"x-profile":
+                    return _parse_mode(value.decode('latin-1'))
+        arm = self.armed()
+        if arm is not None and scope["path"].startswith(arm["path"]):
+            return 'arm'
+        return None
+
+    def begin(self, mode: str, path: str) -> Optional[ProfileSession]:
+        """开始分析；已有请求在分析或 arm 名额已用完时返回 None"""
+        if not self._busy.acquire(blocking=False):
+            logger.info(f"Profiler busy, not profiling {path}")
+            return None
+        if mode == 'arm':
+            mode = self._claim_arm(path)
+            if mode is None:
+                self._busy.release()
+                return None
+        session = ProfileSession(mode)
+        session.start()
+        return session
+
+    def finish(self, session: ProfileSession, profile_id: str, method: str, path: str, status: int) -> dict:
+        """结束分析并写入结果文件，返回元数据"""
+        try:
+            session.stop()
+        finally:
+            self._busy.release()
+        name = f"{method} {path}"
+        meta = {
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "status": status,
+            "mode": session.mode,
+            "pid": os.getpid(),
+            "created": time.time(),
+            "duration_seconds": round(session.duration, 4),
+            "samples": sum(len(weights) for _, weights in session.sampler.samples.values()),
+            "files": [],
+        }
+        base = os.path.join(self.root, profile_id)
+        if session.cpu:
+            with open(base + FILE_KINDS['speedscope'][0], 'w', encoding='utf-8') as f:
+                json.dump(session.speedscope(name), f)
+            session.write_pstats(base + FILE_KINDS['pstats'][0])
+            meta["files"] += ['speedscope', 'pstats']
+            meta["top_functions"] = session.top_functions()
+        if session.memory:
+            meta["peak_traced_bytes"] = session.peak_bytes
+            if session.sampler.snapshot is not None:
+                session.sampler.snapshot.dump(base + FILE_KINDS['tracemalloc'][0])
+                meta["files"].append('tracemalloc')
+                meta["snapshot_traced_bytes"] = session.sampler.snapshot_traced
+                meta["top_allocations"] = session.top_allocations()
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        logger.info(f"Saved profile {profile_id} for {name} ({session.mode}, {session.duration:.2f}s)")
+        self.prune()
+        return meta
+
+    # ---------- 存储 ----------
+
+    def _files(self, profile_id: str) -> List[str]:
+        base = os.path.join(self.root, profile_id)
+        return [base + '.json'] + [base + suffix for suffix, _ in FILE_KINDS.values()]
+
+    def list(self) -> List[dict]:
+        """全部分析结果的元数据，最新的在前"""
+        profiles = []
+        for name in os.listdir(self.root):
+            if name.endswith('.json') and not name.endswith('.speedscope.json') and name != 'arm.json':
+                meta = self.get(name[:-len('.json')])
+                if meta is not None:
+                    profiles.append(meta)
+        profiles.sort(key=lambda meta: meta["created"], reverse=True)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        try:
+            uuid.UUID(hex=profile_id)
+        except ValueError:
+            return None
+        try:
+            with open(os.path.join(self.root, profile_id + '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def file_path(self, profile_id: str, kind: str) -> Optional[str]:
+        meta = self.get(profile_id)
+        if meta is None or kind not in meta["files"]:
+            return None
+        return os.path.join(self.root, profile_id + FILE_KINDS[kind][0])
+
+    def remove(self, profile_id: str) -> None:
+        for path in self._files(profile_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> None:
+        """超出数量或总大小上限时删除最旧的结果"""
+        profiles = self.list()
+        total = 0
+        for index, meta in enumerate(profiles):
+            size = sum(os.path.getsize(path) for path in self._files(meta["id"]) if os.path.exists(path))
+            total += size
+            if index >= self.max_profiles or (index > 0 and total > self.max_bytes):
+                self.remove(meta["id"])
+
+    def status(self) -> dict:
+        arm = self.armed()
+        return {
+            "header_enabled": self.header_enabled,
+            "armed": arm,
+            "busy": self._busy.locked(),
+            "max_profiles": self.max_profiles,
+            "interval_ms": SAMPLE_INTERVAL_MS,
+        }
+
+
+class ProfilingMiddleware:
+    """按请求头或 arm 状态对请求做性能分析的 ASGI 中间件，响应头 X-Profile-Id 为结果 ID"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/api/profiles"):
+            await self.app(scope, receive, send)
+            return
+        mode = self.profiler.requested_mode(scope)
+        session = self.profiler.begin(mode, scope["path"]) if mode else None
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.concurrency import run_in_threadpool
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def profiled_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            try:
+                await run_in_threadpool(self.profiler.finish, session, profile_id,
+                                        scope["method"], scope["path"], status)
+            except Exception as e:
+                logger.error(f"Failed to save profile {profile_id}: {e}")
@@ -0,0 +1,169 @@
+"""
+转换结果缓存
+
+同一内容以相同参数重复转换（关闭对话框后重新转换、重新合并同一组 PDF）时直接返回上次的产物：
+- 键为操作名、规范化后的参数与各输入内容 sha256 的哈希，与文件名、上传方式无关
+- 产物存放在 cache/result/ 下（与其他内容缓存一样参与临时空间配额的 LRU 淘汰），
+  另有独立的大小上限，超出时按最近使用时间淘汰
+- 命中时以硬链接放入结果目录，与新转换的结果一样支持 Range 与 X-Result-Id
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+# 结果缓存的大小上限（字节），为 0 时不缓存
+RESULT_CACHE_BYTES = int(os.environ.get('YUNRAN_RESULT_CACHE_MB', '2048')) * 1024 * 1024
+# 处理逻辑变化导致产物不同时递增，使旧缓存失效
+CACHE_VERSION = 1
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'yunran_result_cache_requests_total', '按操作统计的结果缓存命中与未命中次数', ('operation', 'outcome')))
+
+
+def cache_key(operation: str, params: dict, inputs: Iterable[str]) -> str:
+    """操作名 + 参数 + 输入内容哈希（有序）-> 缓存键"""
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "operation": operation, "params": params, "inputs": list(inputs)},
+        sort_keys=True, separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """硬链接，不支持时（跨文件系统等）复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """按内容寻址的转换产物缓存，元数据为同名 .json"""
+
+    def __init__(self, temp_store, budget: int = RESULT_CACHE_BYTES):
+        self.temp_store = temp_store
+        self.budget = budget
+        self.root = os.path.join(temp_store.root, 'cache', 'result')
+        os.makedirs(self.root, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def _meta_path(self, key: str) -> str:
+        return self.temp_store.content_path('result', key, 'json')
+
+    def get(self, operation: str, key: str) -> Optional[Tuple[str, dict]]:
+        """查找缓存，返回 (产物路径, 元数据)，并计入命中/未命中"""
+        if not self.enabled:
+            return None
+        meta_path = self._meta_path(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            path = self.temp_store.content_path('result', key, meta["ext"])
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            CACHE_REQUESTS.inc((operation, 'miss'))
+            return None
+        self.temp_store.touch(path)
+        self.temp_store.touch(meta_path)
+        self.hits += 1
+        CACHE_REQUESTS.inc((operation, 'hit'))
+        logger.info(f"Result cache hit for {operation}: {key}")
+        return path, meta
+
+    def _store(self, key: str, ext: str, write, media_type: str, filename: str,
+               headers: Optional[Dict[str, str]]) -> None:
+        """write(临时路径) 写入产物后原子替换，再写元数据并按上限淘汰；失败只记录日志，不影响本次转换"""
+        cached = self.temp_store.content_path('result', key, ext)
+        tmp_path = f"{cached}.{os.getpid()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, cached)
+            meta = {
+                "ext": ext,
+                "media_type": media_type,
+                "filename": filename,
+                "headers": headers or {},
+                "size": os.path.getsize(cached),
+                "created": time.time(),
+            }
+            with open(self._meta_path(key), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Failed to cache result {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def put(self, key: str, path: str, media_type: str, filename: str,
+            headers: Optional[Dict[str, str]] = None) -> None:
+        """缓存产物文件（硬链接，不复制数据）"""
+        try:
+            if not self.enabled or os.path.getsize(path) > self.budget:
+                return
+        except OSError:
+            return
+        ext = os.path.splitext(path)[1].lstrip('.') or 'bin'
+        self._store(key, ext, lambda tmp_path: link_or_copy(path, tmp_path), media_type, filename, headers)
+
+    def _entries(self) -> List[Tuple[float, int, List[str]]]:
+        """[(最近使用时间, 大小, 文件列表)]，同名的产物与元数据为一组"""
+        groups: Dict[str, list] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = groups.setdefault(name.split('.', 1)[0], [0.0, 0, []])
+                entry[0] = max(entry[0], stat.st_mtime)
+                entry[1] += stat.st_size
+                entry[2].append(path)
+        return [tuple(entry) for entry in groups.values()]
+
+    def evict(self) -> int:
+        """超出大小上限时按最近使用时间淘汰，返回释放的字节数"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, paths in entries:
+            if total - freed <= self.budget:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            freed += size
+        if freed:
+            logger.info(f"Evicted {freed} bytes from result cache")
+        return freed
+
+    def status(self) -> dict:
+        entries = self._entries()
+        return {
+            "enabled": self.enabled,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "budget_bytes": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
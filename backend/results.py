@@ -0,0 +1,241 @@
+"""
+转换结果文件服务
+
+转换产物保存在磁盘上，直接从文件返回，不读入内存：
+- 支持 Range / If-Range 断点续传与分段下载，附带 Content-Length、ETag、Last-Modified
+- ASGI 服务器支持 http.response.zerocopysend 扩展时使用零拷贝发送，否则分块读取
+- 结果按 ID 保留一段时间（而非响应后立即删除），可通过 /api/results/{id} 重新下载
+"""
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from email.utils import formatdate
+from typing import Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# 结果保留时间（秒）
+RESULT_RETENTION_SECONDS = int(os.environ.get('YUNRAN_RESULT_RETENTION', '3600'))
+# 非零拷贝发送时每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+_RESULT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_disposition(filename: str) -> str:
+    """构建 Content-Disposition 头，非 ASCII 文件名按 RFC 5987 编码"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f"attachment; filename={filename}"
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围，返回 [start, end]（含 end）
+
+    格式不支持（如多段范围）时返回 None，按完整响应处理；
+    范围无法满足时抛出 ValueError。
+    """
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N 表示最后 N 个字节
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """支持 Range 请求的文件响应"""
+
+    def __init__(self, path: str, request_headers: Mapping[str, str], media_type: str,
+                 filename: Optional[str] = None, etag: Optional[str] = None,
+                 headers: Optional[Mapping[str, str]] = None, method: str = "GET",
+                 background: Optional[BackgroundTask] = None) -> None:
+        self.path = path
+        self.media_type = media_type
+        self.background = background
+        self.send_header_only = method.upper() == "HEAD"
+        self.init_headers(headers)
+
+        stat = os.stat(path)
+        size = stat.st_size
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        etag = etag or f'"{int(stat.st_mtime_ns)}-{size}"'
+
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+        if filename:
+            self.headers.setdefault("content-disposition", content_disposition(filename))
+
+        self.status_code = 200
+        self.start, self.end = 0, size - 1
+
+        if etag in (tag.strip() for tag in request_headers.get("if-none-match", "").split(",")):
+            self.status_code = 304
+            self.start, self.end = 0, -1
+            return
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or if_range in (etag, last_modified)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                self.start, self.end = 0, -1
+                return
+            if byte_range is not None:
+                self.start, self.end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        count = self.end - self.start + 1
+        if self.send_header_only or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as f:
+                await f.seek(self.start)
+                remaining = count
+                while remaining > 0:
+                    chunk = await f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+class ResultStore:
+    """
+    转换结果存储
+
+    每个结果为 <id><扩展名> 文件及同名 .json 元数据，元数据存于磁盘以便多进程共享。
+    """
+
+    def __init__(self, base_dir: str, retention: int = RESULT_RETENTION_SECONDS):
+        self.base_dir = base_dir
+        self.retention = retention
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _meta_path(self, result_id: str) -> str:
+        return os.path.join(self.base_dir, f"{result_id}.json")
+
+    def add(self, path: str, media_type: str, filename: str) -> dict:
+        """将转换产物移入结果目录，返回元数据"""
+        self.prune()
+        result_id = uuid.uuid4().hex
+        stored = os.path.join(self.base_dir, result_id + os.path.splitext(path)[1])
+        os.replace(path, stored)
+        meta = {
+            "id": result_id,
+            "path": stored,
+            "media_type": media_type,
+            "filename": filename,
+            "size": os.path.getsize(stored),
+            "created": time.time(),
+        }
+        with open(self._meta_path(result_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return meta
+
+    def get(self, result_id: str) -> Optional[dict]:
+        """获取结果元数据，不存在或已过期时返回 None"""
+        if not _RESULT_ID_RE.match(result_id):
+            return None
+        try:
+            with open(self._meta_path(result_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(meta["path"]) or time.time() - meta["created"] > self.retention:
+            return None
+        return meta
+
+    def remove(self, result_id: str) -> None:
+        meta_path = self._meta_path(result_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                os.remove(json.load(f)["path"])
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            os.remove(meta_path)
+        except OSError:
+            pass
+
+    def prune(self) -> int:
+        """删除超过保留时间的结果，返回删除数量"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.base_dir):
+            result_id, ext = os.path.splitext(name)
+            if ext != ".json":
+                continue
+            try:
+                with open(os.path.join(self.base_dir, name), "r", encoding="utf-8") as f:
+                    created = json.load(f)["created"]
+            except (OSError, ValueError, KeyError):
+                created = 0
+            if now - created > self.retention:
+                self.remove(result_id)
+                removed += 1
+        if removed:
+            logger.info(f"Pruned {removed} expired results")
+        return removed
+
+    def response(self, meta: dict, request, headers: Optional[Mapping[str, str]] = None) -> RangeFileResponse:
+        """以文件响应返回结果，附带 X-Result-Id 供断点续传时重新请求"""
+        response_headers = {"X-Result-Id": meta["id"]}
+        response_headers.update(headers or {})
+        return RangeFileResponse(
+            meta["path"],
+            request.headers,
+            meta["media_type"],
+            filename=meta["filename"],
+            etag=f'"{meta["id"]}"',
+            headers=response_headers,
+            method=request.method,
+        )
@@ -0,0 +1,263 @@
+"""
+可续传的分块上传
+
+大文件不必放在一个 multipart 请求里：
+1. POST /api/uploads 创建上传（声明文件名与总大小），服务端在临时目录中预分配文件
+2. PUT /api/uploads/{id}?offset=N 以原始字节写入任意位置的分块，可并发、可重传
+3. GET /api/uploads/{id} 查询已接收的字节范围，中断后只补传缺失部分
+4. POST /api/uploads/{id}/complete 提交 sha256，校验通过后上传完成
+
+完成的上传可以 upload_id 代替文件字段提交给转换、合并、抠图等接口，并可重复使用
+（如先预估再转换）；未完成的上传超过保留时间后由清扫任务删除。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException
+
+from shared_state import FileLock, pid_alive
+from uploads import MB, COPY_CHUNK_SIZE, FILE_CATEGORIES, SavedUpload, sniff_type
+
+logger = logging.getLogger(__name__)
+
+# 单个上传的大小上限（与各接口中最大的上传限制一致）
+MAX_UPLOAD_BYTES = 500 * MB
+# 单个分块的大小上限，建议的分块大小
+MAX_CHUNK_BYTES = 64 * MB
+CHUNK_SIZE = 8 * MB
+# 上传保留时间（秒），从最后一次写入算起
+UPLOAD_RETENTION_SECONDS = int(os.environ.get('YUNRAN_UPLOAD_RETENTION', str(24 * 3600)))
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """将 [start, end) 并入已排序、互不相交的范围列表"""
+    merged = []
+    for r_start, r_end in sorted(ranges + [[start, end]]):
+        if merged and r_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+
+class ResumableUploads:
+    """
+    分块上传存储
+
+    每个上传为 <id>.data 数据文件及 <id>.json 元数据。数据文件创建时即截断到声明的大小，
+    分块直接写入对应偏移，不经过内存中的整体缓冲。
+    """
+
+    def __init__(self, base_dir: str, retention: int = UPLOAD_RETENTION_SECONDS):
+        self.base_dir = base_dir
+        self.retention = retention
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.base_dir, f"{upload_id}.data")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.base_dir, f"{upload_id}.json")
+
+    def _lock(self, upload_id: str) -> FileLock:
+        """元数据读改写的锁；多 worker 模式下同一上传的分块可能由不同进程接收"""
+        return FileLock(os.path.join(self.base_dir, f"{upload_id}.lock"))
+
+    def _save_meta(self, meta: dict) -> None:
+        meta_path = self._meta_path(meta["id"])
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @staticmethod
+    def describe(meta: dict) -> dict:
+        """返回给客户端的上传状态"""
+        received = sum(end - start for start, end in meta["ranges"])
+        return {
+            "upload_id": meta["id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "received": received,
+            "ranges": meta["ranges"],
+            "complete": meta["complete"],
+            "sha256": meta.get("sha256"),
+            "kind": meta.get("kind"),
+            "chunk_size": CHUNK_SIZE,
+        }
+
+    # ---------- 创建与查询 ----------
+
+    def create(self, filename: str, size: int) -> dict:
+        """创建上传并预分配数据文件"""
+        if not filename:
+            raise HTTPException(status_code=400, detail="缺少文件名")
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="文件大小必须大于0")
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"文件 {filename} 超过{MAX_UPLOAD_BYTES // MB}MB限制")
+        upload_id = uuid.uuid4().hex
+        with open(self._data_path(upload_id), "wb") as f:
+            f.truncate(size)
+        meta = {
+            "id": upload_id,
+            "filename": os.path.basename(filename),
+            "size": size,
+            "ranges": [],
+            "complete": False,
+            "created": time.time(),
+            "updated": time.time(),
+        }
+        self._save_meta(meta)
+        logger.info(f"Created resumable upload {upload_id}: {filename} ({size} bytes)")
+        return meta
+
+    def get(self, upload_id: str) -> dict:
+        """获取上传元数据，不存在时返回 404"""
+        if not _UPLOAD_ID_RE.match(upload_id):
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+
+    # ---------- 写入分块 ----------
+
+    def open_chunk(self, upload_id: str, offset: int):
+        """
+        检查并打开数据文件，定位到 offset，返回 (元数据, 文件对象, 写入者 ID)
+
+        检查与登记写入者在同一把锁内完成：complete() 在有写入者时拒绝完成，
+        已完成的上传不会再被写入。写入结束后须调用 record_chunk() 注销写入者。
+        """
+        writer = uuid.uuid4().hex
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            if meta["complete"]:
+                raise HTTPException(status_code=409, detail="上传已完成，不能再写入")
+            if not 0 <= offset < meta["size"]:
+                raise HTTPException(status_code=416, detail=f"偏移量超出文件范围: {offset}")
+            f = open(self._data_path(upload_id), "r+b")
+            f.seek(offset)
+            meta.setdefault("writers", {})[writer] = os.getpid()
+            self._save_meta(meta)
+        return meta, f, writer
+
+    def record_chunk(self, upload_id: str, start: int, end: int, writer: str) -> dict:
+        """记录已写入的范围 [start, end) 并注销写入者，返回最新元数据"""
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            meta.get("writers", {}).pop(writer, None)
+            if end > start:
+                meta["ranges"] = merge_range(meta["ranges"], start, end)
+            meta["updated"] = time.time()
+            self._save_meta(meta)
+            return meta
+
+    # ---------- 完成 ----------
+
+    def complete(self, upload_id: str, sha256: str) -> dict:
+        """校验全部字节已接收且 sha256 一致，标记完成（在线程池中调用）"""
+        sha256 = sha256.strip().lower()
+        if not _SHA256_RE.match(sha256):
+            raise HTTPException(status_code=400, detail="无效的 sha256 校验值")
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            if meta["complete"]:
+                if meta["sha256"] != sha256:
+                    raise HTTPException(status_code=400, detail="校验值不匹配")
+                return meta
+            if meta["ranges"] != [[0, meta["size"]]]:
+                raise HTTPException(status_code=409, detail="文件尚未全部上传")
+            # 写入进程已退出的写入者不会再写入，忽略
+            if any(pid_alive(pid) for pid in meta.get("writers", {}).values()):
+                raise HTTPException(status_code=409, detail="仍有分块正在上传，请稍后再完成")
+
+            digest = hashlib.sha256()
+            with open(self._data_path(upload_id), "rb") as f:
+                head = f.read(64)
+                f.seek(0)
+                while True:
+                    chunk = f.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+            if digest.hexdigest() != sha256:
+                raise HTTPException(status_code=400, detail="校验值不匹配，请重新上传")
+
+            meta.update(complete=True, sha256=sha256, kind=sniff_type(head), updated=time.time(), writers={})
+            self._save_meta(meta)
+        logger.info(f"Completed resumable upload {upload_id}")
+        return meta
+
+    def saved_upload(self, upload_id: str, max_bytes: int, categories: Optional[Iterable[str]] = None,
+                     dest_dir: Optional[str] = None, prefix: str = 'upload') -> SavedUpload:
+        """
+        以 SavedUpload 形式提供已完成的上传，检查规则与 receive_upload 相同
+
+        dest_dir 不为空时在该目录下创建硬链接（不支持时复制），调用方可像普通上传一样删除；
+        否则直接返回数据文件路径，调用方不得删除。
+        """
+        meta = self.get(upload_id)
+        if not meta["complete"]:
+            raise HTTPException(status_code=409, detail="上传尚未完成")
+        if meta["size"] > max_bytes:
+            raise HTTPException(status_code=413, detail=f"文件 {meta['filename']} 超过{max_bytes // MB}MB限制")
+        kind = meta.get("kind")
+        if categories is not None and kind is not None and FILE_CATEGORIES.get(kind) not in set(categories):
+            raise HTTPException(status_code=400, detail=f"不支持的文件类型: {meta['filename']}")
+
+        data_path = self._data_path(upload_id)
+        # 标记最近使用，延长保留时间
+        with self._lock(upload_id):
+            meta["updated"] = time.time()
+            self._save_meta(meta)
+        path = data_path
+        if dest_dir is not None:
+            ext = kind or (os.path.splitext(meta["filename"])[1][1:].lower() or 'bin')
+            path = os.path.join(dest_dir, f"{prefix}_{uuid.uuid4().hex}.{ext}")
+            try:
+                os.link(data_path, path)
+            except OSError:
+                shutil.copyfile(data_path, path)
+        return SavedUpload(meta["filename"], meta["size"], meta["sha256"], kind, path=path)
+
+    # ---------- 删除与清扫 ----------
+
+    def remove(self, upload_id: str) -> None:
+        for path in (self._data_path(upload_id), self._meta_path(upload_id),
+                     os.path.join(self.base_dir, f"{upload_id}.lock")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def prune(self) -> int:
+        """删除超过保留时间未使用的上传，返回删除数量"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.base_dir):
+            upload_id, ext = os.path.splitext(name)
+            if ext != ".data":
+                continue
+            try:
+                with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                    updated = json.load(f)["updated"]
+            except (OSError, ValueError, KeyError):
+                updated = 0
+            if now - updated > self.retention:
+                self.remove(upload_id)
+                removed += 1
+        if removed:
+            logger.info(f"Pruned {removed} expired uploads")
+        return removed
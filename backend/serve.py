@@ -0,0 +1,141 @@
+"""
+多 worker 启动入口
+
+用法（在 backend 目录下执行）:
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --uds /tmp/yunran/backend.sock
+
+与 uvicorn --workers 不同（每个 worker 单独导入应用、各自加载模型），这里先在主进程中导入
+应用并预热全部功能（含 rembg 模型），再绑定端口后 fork 出各 worker 共享同一监听 socket：
+- 模型权重在 fork 前加载，各 worker 以写时复制方式共享，不会按 worker 数成倍占用内存
+- 临时文件登记表、清扫任务、HLS 任务状态等通过 SQLite 与文件锁在 worker 间共享（见 shared_state.py）
+- worker 异常退出时由主进程重新启动；主进程收到 SIGTERM/SIGINT 时通知各 worker 优雅退出
+
+fork 仅在 Linux/macOS 可用；Windows 上或 --workers 1 时退化为单进程运行。
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Optional
+
+logger = logging.getLogger("serve")
+
+# worker 异常退出后重新启动前的等待时间（秒）
+RESPAWN_DELAY = 1.0
+
+
+def _bind(host: str, port: int, uds: Optional[str] = None) -> socket.socket:
+    if uds:
+        # 删除上次异常退出遗留的套接字文件；只允许当前用户连接
+        if os.path.exists(uds):
+            os.remove(uds)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(uds)
+        os.chmod(uds, 0o600)
+    else:
+        sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(workers: int, host: str, port: int, log_level: str = "info", uds: Optional[str] = None) -> None:
+    # 在导入应用之前设置：内存预算按 worker 平分；onnxruntime 只用调用线程推理，
+    # 否则 fork 前创建的线程池在子进程中不存在，推理会挂起
+    os.environ['YUNRAN_WORKERS'] = str(workers)
+    if workers > 1:
+        os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+    import main
+    import uvicorn
+
+    if workers <= 1 or not hasattr(os, 'fork'):
+        if workers > 1:
+            logger.warning("fork is not available on this platform, running a single worker")
+        if uds:
+            uvicorn.run(main.app, uds=uds, log_level=log_level)
+        else:
+            uvicorn.run(main.app, host=host, port=port, log_level=log_level)
+        return
+
+    start = time.perf_counter()
+    main.features.warmup(main.features.status().keys())
+    logger.info(f"Preloaded features in {time.perf_counter() - start:.2f}s: "
+                f"{ {name: s['state'] for name, s in main.features.status().items()} }")
+    # 子进程各自打开 SQLite 连接，不继承主进程的连接
+    main.temp_files_registry.close()
+
+    sock = _bind(host, port, uds)
+    children = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _run_worker(main.app, sock, log_level)
+                main.cleanup_all_temp_files()
+            finally:
+                # 不执行从主进程继承的 atexit 等退出处理
+                os._exit(0)
+        children[pid] = index
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Serving on {uds or f'http://{host}:{port}'} with {workers} workers")
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(RESPAWN_DELAY)
+        if not stopping:
+            spawn(index)
+    sock.close()
+    if uds and os.path.exists(uds):
+        os.remove(uds)
+    # 主进程退出时 main 注册的 atexit 清理会回收各 worker 遗留的临时文件
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多 worker 启动后端")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker 进程数，默认为 CPU 核数")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--uds", default=os.environ.get("YUNRAN_UDS"), help="监听 Unix 域套接字（代替 host/port）")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port, args.log_level, args.uds)
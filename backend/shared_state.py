@@ -0,0 +1,271 @@
+"""
+多进程共享状态
+
+多 worker 模式（见 serve.py）下各 worker 是独立进程，模块级变量不再共享：
+- TempFileRegistry：临时文件登记表，多 worker 时另存放在 SQLite 中并记录登记进程；进程退出只清理
+  自己的文件，异常退出进程遗留的文件由清扫任务回收
+- FileLock：跨进程的排他锁（fcntl.flock / msvcrt.locking），用于分块上传元数据等读改写
+- LeaderLock：非阻塞文件锁选出唯一执行清扫任务的 worker，持有者退出后由其他 worker 接替
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# worker 进程数，由 serve.py 在导入 main 之前设置
+WORKER_COUNT = max(1, int(os.environ.get('YUNRAN_WORKERS', '1')))
+
+
+def _lock_fd(fd: int, blocking: bool) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        if blocking:
+            raise
+        return False
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    跨进程排他锁（with 语句使用）
+
+    flock 锁属于打开的文件描述，同一进程内的不同线程各自打开也会互斥。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> 'FileLock':
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock_fd(fd, blocking=True)
+        except OSError:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc) -> None:
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+
+class LeaderLock:
+    """非阻塞获取、一直持有到进程退出的文件锁"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if _lock_fd(fd, blocking=False):
+            self._fd = fd
+            logger.info(f"Process {os.getpid()} acquired {os.path.basename(self.path)}")
+            return True
+        os.close(fd)
+        return False
+
+
+def pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # 进程存在但无权限，或 Windows 上无法以信号 0 探测
+        return True
+    return True
+
+
+class TempFileRegistry:
+    """
+    临时文件登记表，接口与 set 相同（add / discard / len / 迭代）
+
+    本进程登记的文件保存在内存中，add / discard / owned 不做磁盘 IO，可在事件循环中直接调用。
+    shared 为 True（多 worker 模式）时同时写入 SQLite 并记录登记进程：写入由后台线程批量提交，
+    worker 争用写锁时也不会阻塞事件循环；len / 迭代 / orphaned 读取所有进程的登记，
+    会先等待本进程排队的写入完成，应在线程池或清扫任务中调用。
+    每个进程使用自己的连接与写入线程（fork 后自动重新创建），WAL 模式下各 worker 可并发读写。
+    """
+
+    def __init__(self, db_path: str, shared: bool = True):
+        self.db_path = db_path
+        self.shared = shared
+        self._reset()
+        if shared:
+            with self._lock:
+                self._connection().execute(
+                    "CREATE TABLE IF NOT EXISTS temp_files ("
+                    "path TEXT PRIMARY KEY, pid INTEGER NOT NULL, created REAL NOT NULL)"
+                )
+
+    def _reset(self) -> None:
+        """初始化进程内状态；fork 继承的连接、锁与待写队列不能在子进程中使用，直接丢弃"""
+        self._pid = os.getpid()
+        # _lock 保护 SQLite 连接；_cond 保护内存登记表与待写队列
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._local: Dict[str, float] = {}
+        self._pending: List[Tuple[str, tuple]] = []
+        self._writing = False
+        self._writer: Optional[threading.Thread] = None
+
+    def _check_fork(self) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connection(self) -> sqlite3.Connection:
+        """调用方需持有 self._lock"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """读取共享登记表，先等待本进程排队的写入完成"""
+        self.flush()
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _enqueue(self, sql: str, params: tuple) -> None:
+        """调用方需持有 self._cond"""
+        self._pending.append((sql, params))
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="temp-registry-writer", daemon=True)
+            self._writer.start()
+        self._cond.notify_all()
+
+    def _write_loop(self) -> None:
+        """后台线程：将排队的写入合并为一个事务提交"""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+                self._writing = True
+            try:
+                with self._lock:
+                    conn = self._connection()
+                    conn.execute("BEGIN")
+                    try:
+                        for sql, params in batch:
+                            conn.execute(sql, params)
+                        conn.execute("COMMIT")
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+            except sqlite3.Error as e:
+                # 登记只用于清理，写入失败时遗留的文件由按存活时间的清扫回收
+                logger.warning(f"Failed to write temp file registry ({len(batch)} changes): {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def flush(self) -> None:
+        """等待本进程排队的写入提交完成"""
+        self._check_fork()
+        with self._cond:
+            while self._pending or self._writing:
+                self._cond.wait()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, path: str) -> None:
+        self._check_fork()
+        created = time.time()
+        with self._cond:
+            self._local[path] = created
+            if self.shared:
+                self._enqueue("INSERT OR REPLACE INTO temp_files (path, pid, created) VALUES (?, ?, ?)",
+                              (path, self._pid, created))
+
+    def discard(self, path: str) -> None:
+        self._check_fork()
+        with self._cond:
+            self._local.pop(path, None)
+            if self.shared:
+                # 也可能是其他（已退出的）进程登记的文件
+                self._enqueue("DELETE FROM temp_files WHERE path = ?", (path,))
+
+    def __len__(self) -> int:
+        if not self.shared:
+            return len(self._local)
+        return self._execute("SELECT COUNT(*) FROM temp_files")[0][0]
+
+    def __iter__(self):
+        if not self.shared:
+            return iter(list(self._local))
+        return iter([row[0] for row in self._execute("SELECT path FROM temp_files")])
+
+    def __contains__(self, path: str) -> bool:
+        if path in self._local:
+            return True
+        return self.shared and bool(self._execute("SELECT 1 FROM temp_files WHERE path = ?", (path,)))
+
+    def owned(self, pid: Optional[int] = None) -> List[str]:
+        """指定进程（默认当前进程）登记的文件"""
+        self._check_fork()
+        if pid is None or pid == self._pid:
+            with self._cond:
+                return list(self._local)
+        if not self.shared:
+            return []
+        rows = self._execute("SELECT path FROM temp_files WHERE pid = ?", (pid,))
+        return [row[0] for row in rows]
+
+    def orphaned(self) -> List[str]:
+        """登记进程已退出的文件"""
+        if not self.shared:
+            return []
+        pids = [row[0] for row in self._execute("SELECT DISTINCT pid FROM temp_files")]
+        paths = []
+        for pid in pids:
+            if not pid_alive(pid):
+                paths.extend(self.owned(pid))
+        return paths
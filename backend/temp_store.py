@@ -0,0 +1,357 @@
+"""
+临时文件存储与配额管理
+
+temp 目录下的所有内容都计入配额：
+- cache/、results/ 为可淘汰区域，空间不足时按最近使用时间（mtime）淘汰，同名不同扩展名的
+  文件（如缩略图的 .json 与 .jpg、结果文件与元数据）作为一组一起删除
+- 其余为工作文件（转换中的输入输出、分段目录、HLS 任务），不参与淘汰，由清扫任务按存活时间回收
+- 结果缓存与结果目录、分块上传与工作文件之间以硬链接共享数据，用量按 inode 去重统计，
+  淘汰时只有删除最后一个链接才计为释放
+- 上传/转换接口处理请求前按上传大小预留空间，预留失败立即返回 507，而不是写满磁盘；
+  预留可能遍历目录并淘汰缓存，由中间件放到线程池中执行
+- 请求写入的文件同时出现在用量与预留中，已占用空间按 max(实际用量, 基准用量 + 预留) 计算，
+  基准为开始有预留时的用量，不重复计算
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 配额（字节）
+TEMP_QUOTA_BYTES = int(os.environ.get('YUNRAN_TEMP_QUOTA_MB', '10240')) * 1024 * 1024
+# 磁盘至少保留的可用空间（字节）
+MIN_FREE_BYTES = int(os.environ.get('YUNRAN_TEMP_MIN_FREE_MB', '512')) * 1024 * 1024
+# 清扫间隔（秒）
+SWEEP_INTERVAL = int(os.environ.get('YUNRAN_SWEEP_INTERVAL', '300'))
+# 用量统计缓存时间（秒），避免每次预留都遍历目录
+USAGE_TTL = 5.0
+
+# 各接口处理一个请求所需临时空间相对上传大小的估算倍数（输入 + 输出 + 中间文件），
+# 只有列出的上传/转换接口预留空间，其余请求（如身份证校验）不经过配额检查；
+# 分块上传的数据文件在创建时已按总大小检查，写入分块不再预留
+SPACE_FACTORS = {
+    '/api/audio/convert': 4,
+    '/api/audio/convert-multi': 8,
+    '/api/audio/waveform': 1,
+    '/api/video/convert': 3,
+    '/api/video/estimate': 1,
+    '/api/video/thumbnails': 1,
+    '/api/video/hls': 4,
+    '/api/pdf/merge': 3,
+    '/api/photo/remove-bg': 2,
+    '/api/photo/change-bg': 2,
+    '/api/pipeline/audio': 4,
+    '/api/pipeline/image': 2,
+    '/api/pipeline/pdf': 3,
+}
+
+
+class QuotaExceeded(Exception):
+    """临时空间不足"""
+
+    def __init__(self, requested: int, available: int):
+        super().__init__(f"临时空间不足：需要 {requested // (1024 * 1024)}MB，"
+                         f"可用 {max(0, available) // (1024 * 1024)}MB")
+        self.requested = requested
+        self.available = available
+
+
+class Reservation:
+    """一次空间预留，release() 后归还"""
+
+    def __init__(self, store: 'TempStore', nbytes: int):
+        self.store = store
+        self.nbytes = nbytes
+
+    def release(self) -> None:
+        if self.nbytes:
+            self.store._release(self.nbytes)
+            self.nbytes = 0
+
+    def __enter__(self) -> 'Reservation':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _file_size(stat: os.stat_result, seen: set) -> int:
+    """文件占用；有多个硬链接的文件按 (st_dev, st_ino) 只计一次"""
+    if stat.st_nlink > 1:
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in seen:
+            return 0
+        seen.add(inode)
+    return stat.st_size
+
+
+def _dir_size(path: str, seen: set) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += _file_size(os.stat(os.path.join(dirpath, name)), seen)
+            except OSError:
+                pass
+    return total
+
+
+class TempStore:
+    """temp 目录的配额、LRU 淘汰与清扫"""
+
+    def __init__(self, root: str, quota: int = TEMP_QUOTA_BYTES, min_free: int = MIN_FREE_BYTES,
+                 evictable: Tuple[str, ...] = ('cache', 'results')):
+        self.root = root
+        self.quota = quota
+        self.min_free = min_free
+        self.evictable = evictable
+        self.reserved = 0
+        self.evicted_bytes = 0
+        # _lock 保护预留判断与淘汰（可能持有较久）；_reserved_lock 只保护 reserved 计数，
+        # 归还预留不必等待正在进行的清扫
+        self._lock = threading.Lock()
+        self._reserved_lock = threading.Lock()
+        # 有未归还的预留时的基准用量与磁盘可用空间（由 _reserved_lock 保护）
+        self._base_usage = 0
+        self._base_free = 0
+        self._usage: Optional[Dict[str, int]] = None
+        self._usage_time = 0.0
+        self._sweep_hooks: List[Callable[[], None]] = []
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- 路径 ----------
+
+    def content_path(self, kind: str, key: str, ext: str) -> str:
+        """按内容哈希定位的缓存路径：cache/<kind>/<key 前两位>/<key>.<ext>"""
+        directory = os.path.join(self.root, 'cache', kind, key[:2])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{key}.{ext}")
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """标记最近使用（LRU 按 mtime 排序）"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    # ---------- 用量 ----------
+
+    def usage(self, refresh: bool = False) -> Dict[str, int]:
+        """各区域用量（字节），total 为合计"""
+        now = time.monotonic()
+        if refresh or self._usage is None or now - self._usage_time > USAGE_TTL:
+            areas: Dict[str, int] = {}
+            seen: set = set()
+            for entry in os.scandir(self.root):
+                area = entry.name if entry.is_dir() and entry.name in self.evictable else 'work'
+                try:
+                    size = _dir_size(entry.path, seen) if entry.is_dir() else _file_size(entry.stat(), seen)
+                except OSError:
+                    continue
+                areas[area] = areas.get(area, 0) + size
+            areas['total'] = sum(areas.values())
+            self._usage, self._usage_time = areas, now
+        return self._usage
+
+    def status(self) -> dict:
+        """供 /api/status 展示的用量信息"""
+        usage = self.usage()
+        disk = shutil.disk_usage(self.root)
+        return {
+            "used_bytes": usage['total'],
+            "reserved_bytes": self.reserved,
+            "quota_bytes": self.quota,
+            "areas": {k: v for k, v in usage.items() if k != 'total'},
+            "disk_free_bytes": disk.free,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+    def _committed(self) -> Tuple[int, int]:
+        """(计入配额的已占用空间, 磁盘可用空间)，均已计入尚未写入的预留"""
+        used = self.usage()['total']
+        free = shutil.disk_usage(self.root).free
+        with self._reserved_lock:
+            if not self.reserved:
+                return used, free
+            return (max(used, self._base_usage + self.reserved),
+                    min(free, self._base_free - self.reserved))
+
+    def _available(self) -> int:
+        used, free = self._committed()
+        return min(self.quota - used, free - self.min_free)
+
+    # ---------- 预留 ----------
+
+    def reserve(self, nbytes: int) -> Reservation:
+        """
+        预留 nbytes 空间，不足时先淘汰缓存，仍不足则抛出 QuotaExceeded
+
+        实际写入的文件会计入用量，预留只用于防止并发请求同时超额。
+        可能遍历目录并淘汰缓存，异步代码中应通过 run_in_threadpool 调用。
+        """
+        with self._lock:
+            available = self._available()
+            if nbytes > available:
+                usage = self.usage()
+                evictable = sum(usage.get(area, 0) for area in self.evictable)
+                if nbytes > available + evictable:
+                    # 淘汰全部缓存也不够时直接失败，不白白清空缓存
+                    raise QuotaExceeded(nbytes, available)
+                self.evict(nbytes - available)
+                self.usage(refresh=True)
+                available = self._available()
+                if nbytes > available:
+                    raise QuotaExceeded(nbytes, available)
+            base_usage, base_free = self.usage()['total'], shutil.disk_usage(self.root).free
+            with self._reserved_lock:
+                if not self.reserved:
+                    self._base_usage, self._base_free = base_usage, base_free
+                self.reserved += nbytes
+        return Reservation(self, nbytes)
+
+    def _release(self, nbytes: int) -> None:
+        """归还预留；在事件循环中调用，只使用缓存的用量，不遍历目录"""
+        free = shutil.disk_usage(self.root).free
+        with self._reserved_lock:
+            self.reserved = max(0, self.reserved - nbytes)
+            if self.reserved:
+                # 该请求写入后仍保留的文件（如结果）不再由预留覆盖，按其预留量为上限计入基准
+                used = self._usage['total'] if self._usage else self._base_usage
+                self._base_usage += min(nbytes, max(0, used - self._base_usage))
+                self._base_free -= min(nbytes, max(0, self._base_free - free))
+
+    # ---------- 淘汰与清扫 ----------
+
+    def _evictable_groups(self) -> List[Tuple[float, List[str]]]:
+        """可淘汰的文件组：(最近使用时间, 路径列表)"""
+        groups: Dict[Tuple[str, str], list] = {}
+        for area in self.evictable:
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, area)):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except OSError:
+                        continue
+                    group = groups.setdefault((dirpath, os.path.splitext(name)[0]), [0.0, []])
+                    group[0] = max(group[0], mtime)
+                    group[1].append(path)
+        return sorted(tuple(g) for g in groups.values())
+
+    def evict(self, need: int) -> int:
+        """
+        按 LRU 淘汰缓存与结果，直到释放 need 字节，返回实际释放量
+
+        删除仍有其他硬链接的文件（如结果目录中仍在使用的缓存产物）不释放空间，不计入释放量。
+        """
+        freed = 0
+        for _, paths in self._evictable_groups():
+            if freed >= need:
+                break
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                if stat.st_nlink == 1:
+                    freed += stat.st_size
+        if freed:
+            self.evicted_bytes += freed
+            with self._reserved_lock:
+                self._base_usage = max(0, self._base_usage - freed)
+                self._base_free += freed
+            logger.info(f"Evicted {freed} bytes from temp store")
+        return freed
+
+    def add_sweep_hook(self, hook: Callable[[], None]) -> None:
+        """注册清扫时执行的回调（如过期结果、过期任务的清理）"""
+        self._sweep_hooks.append(hook)
+
+    def sweep(self) -> None:
+        """执行清扫回调，并将用量压回配额以内"""
+        for hook in self._sweep_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"Temp sweep hook failed: {e}")
+        with self._lock:
+            self.usage(refresh=True)
+            over = self._committed()[0] - self.quota
+            if over > 0:
+                self.evict(over)
+                self.usage(refresh=True)
+
+    async def run_sweeper(self, interval: float = SWEEP_INTERVAL) -> None:
+        """立即清扫一次后周期性清扫，在线程池中执行以免阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.sweep)
+            await asyncio.sleep(interval)
+
+
+def space_factor(path: str) -> int:
+    """接口的临时空间倍数，0 表示不预留"""
+    return SPACE_FACTORS.get(path.rstrip('/'), 0)
+
+
+class QuotaMiddleware:
+    """
+    按 Content-Length 为上传/转换接口预留临时空间的 ASGI 中间件
+
+    在读取请求体之前完成预留，空间不足时直接返回 507；预留在响应结束后归还。
+    预留在线程池中执行，清扫持有锁或需要淘汰缓存时不会阻塞事件循环。
+    """
+
+    def __init__(self, app, store: TempStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = 0
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+
+        factor = space_factor(scope["path"])
+        if content_length <= 0 or factor == 0:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            reservation = await run_in_threadpool(self.store.reserve, content_length * factor)
+        except QuotaExceeded as e:
+            logger.warning(f"Rejecting {scope['path']}: {e}")
+            body = json.dumps({"detail": str(e)}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 507,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reservation.release()
@@ -0,0 +1,298 @@
+"""
+上传文件处理
+
+- UploadLimitMiddleware：按接口限制请求体大小，Content-Length 超限时在读取请求体之前
+  直接返回 413；未声明长度（分块传输）时边接收边计数，超限立即中止
+- receive_upload：将上传文件流式写入目标目录（或保持在 Starlette 的内存/磁盘缓冲中），
+  同时计算 sha256、检查大小，并按文件头魔数识别类型，不依赖文件扩展名
+处理函数拿到的是文件路径或文件对象，而不是整个文件的 bytes 副本。
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import uuid
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# 流式复制的块大小
+COPY_CHUNK_SIZE = 1 * MB
+# 多段表单的边界、字段等额外开销
+MULTIPART_SLACK = 1 * MB
+
+# 接口前缀 -> 请求体上限（字节），按最长前缀匹配
+UPLOAD_LIMITS = {
+    '/api/photo/': 20 * MB,
+    '/api/audio/': 100 * MB,
+    '/api/video/': 500 * MB,
+    '/api/pdf/merge': 500 * MB,
+    '/api/pipeline/image': 20 * MB,
+    '/api/pipeline/audio': 100 * MB,
+    '/api/pipeline/pdf': 500 * MB,
+    # 分块上传的单个分块
+    '/api/uploads/': 64 * MB,
+}
+
+# 文件类型 -> 类别
+FILE_CATEGORIES = {
+    'pdf': 'pdf',
+    'png': 'image', 'jpg': 'image', 'gif': 'image', 'webp': 'image', 'bmp': 'image', 'tiff': 'image',
+    'mp3': 'audio', 'wav': 'audio', 'flac': 'audio', 'ogg': 'audio', 'aac': 'audio', 'm4a': 'audio',
+    'mp4': 'video', 'mov': 'video', 'mkv': 'video', 'webm': 'video', 'avi': 'video', 'flv': 'video',
+    'asf': 'video',
+}
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """根据文件头魔数识别文件类型，返回类型名（用作扩展名），无法识别时返回 None"""
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if head.startswith(b'RIFF') and len(head) >= 12:
+        return {b'WEBP': 'webp', b'WAVE': 'wav', b'AVI ': 'avi'}.get(head[8:12])
+    if head.startswith(b'fLaC'):
+        return 'flac'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head.startswith(b'ID3'):
+        return 'mp3'
+    if head.startswith(b'FLV'):
+        return 'flv'
+    if head.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        # ASF 容器（wma/wmv）
+        return 'asf'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm' if b'webm' in head[:64] else 'mkv'
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in (b'M4A ', b'M4B ', b'M4P '):
+            return 'm4a'
+        if brand == b'qt  ':
+            return 'mov'
+        return 'mp4'
+    if len(head) >= 2 and head[0] == 0xFF:
+        # MPEG 音频帧同步：0xFFF1/0xFFF9 为 ADTS AAC，其余为 MP3
+        if head[1] in (0xF1, 0xF9):
+            return 'aac'
+        if head[1] & 0xE0 == 0xE0:
+            return 'mp3'
+    return None
+
+
+class SavedUpload:
+    """已接收的上传文件"""
+
+    def __init__(self, filename: str, size: int, sha256: str, kind: Optional[str],
+                 path: Optional[str] = None, file: Optional[BinaryIO] = None):
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.kind = kind
+        self.path = path
+        self.file = file
+
+    @property
+    def category(self) -> Optional[str]:
+        return FILE_CATEGORIES.get(self.kind)
+
+    @property
+    def ext(self) -> str:
+        """用于保存文件的扩展名：优先使用识别出的类型，其次为原文件扩展名"""
+        if self.kind:
+            return self.kind
+        _, ext = os.path.splitext(self.filename or '')
+        return ext[1:].lower() or 'bin'
+
+    def open(self) -> BinaryIO:
+        """以只读文件对象访问内容"""
+        if self.path:
+            return open(self.path, 'rb')
+        self.file.seek(0)
+        return self.file
+
+    def write_to(self, dest_path: str) -> None:
+        """将内容写入 dest_path（如缓存未命中时才需要落盘的场景）"""
+        if self.path:
+            shutil.copyfile(self.path, dest_path)
+            return
+        self.file.seek(0)
+        with open(dest_path, 'wb') as dest:
+            shutil.copyfileobj(self.file, dest, COPY_CHUNK_SIZE)
+
+    def mmap(self) -> mmap.mmap:
+        """只读内存映射视图，避免复制（内存中的缓冲文件会先转存到磁盘）"""
+        if self.path:
+            with open(self.path, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _too_large(filename: str, max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"文件 {filename} 超过{max_bytes // MB}MB限制")
+
+
+def _copy_upload(source: BinaryIO, dest_path: Optional[str], max_bytes: int,
+                 filename: str) -> Tuple[int, str]:
+    """流式复制（dest_path 为空时只读取）并计算哈希，超限时删除已写入部分并抛出 413"""
+    digest = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    dest = open(dest_path, 'wb') if dest_path else None
+    try:
+        while True:
+            chunk = source.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(filename, max_bytes)
+            digest.update(chunk)
+            if dest:
+                dest.write(chunk)
+    except BaseException:
+        if dest:
+            dest.close()
+            dest = None
+            os.remove(dest_path)
+        raise
+    finally:
+        if dest:
+            dest.close()
+    return size, digest.hexdigest()
+
+
+async def receive_upload(file: UploadFile, max_bytes: int, categories: Optional[Iterable[str]] = None,
+                         dest_dir: Optional[str] = None, prefix: str = 'upload') -> SavedUpload:
+    """
+    接收上传文件
+
+    dest_dir 不为空时写入该目录（文件名按识别出的类型取扩展名），供 ffmpeg 等按路径处理；
+    否则直接使用 Starlette 的缓冲文件（小文件在内存、大文件已落盘），不再复制。
+    categories 为允许的类别（如 {'image'}），识别出的类别不在其中时返回 400；
+    无法识别的文件交给后续处理判断。
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="未选择文件")
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(file.filename, max_bytes)
+
+    head = await run_in_threadpool(_read_head, file.file)
+    kind = sniff_type(head)
+    if categories is not None and kind is not None and FILE_CATEGORIES.get(kind) not in set(categories):
+        raise HTTPException(status_code=400, detail=f"不支持的文件类型: {file.filename}")
+
+    path = None
+    if dest_dir is not None:
+        ext = kind or (os.path.splitext(file.filename)[1][1:].lower() or 'bin')
+        path = os.path.join(dest_dir, f"{prefix}_{uuid.uuid4().hex}.{ext}")
+    size, sha256 = await run_in_threadpool(_copy_upload, file.file, path, max_bytes, file.filename)
+    if size == 0:
+        if path:
+            os.remove(path)
+        raise HTTPException(status_code=400, detail="上传的文件为空")
+    return SavedUpload(file.filename, size, sha256, kind, path=path, file=None if path else file.file)
+
+
+def _read_head(source: BinaryIO) -> bytes:
+    source.seek(0)
+    head = source.read(64)
+    source.seek(0)
+    return head
+
+
+def upload_limit(path: str) -> Optional[int]:
+    """接口的请求体上限（含多段表单开销），无限制时返回 None"""
+    matches = [prefix for prefix in UPLOAD_LIMITS if path.startswith(prefix)]
+    if not matches:
+        return None
+    return UPLOAD_LIMITS[max(matches, key=len)] + MULTIPART_SLACK
+
+
+def _limit_detail(limit: int) -> str:
+    return f"上传内容超过{(limit - MULTIPART_SLACK) // MB}MB限制"
+
+
+class _BodyTooLarge(HTTPException):
+    """请求体超限；为 HTTPException 以便表单解析过程中抛出时仍返回 413"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=_limit_detail(limit))
+
+
+class UploadLimitMiddleware:
+    """按接口限制请求体大小的 ASGI 中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        limit = upload_limit(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await self._reject(send, limit)
+                    return
+                break
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if started:
+                raise
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        detail = _limit_detail(limit)
+        logger.warning(detail)
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,177 @@
+"""
+按时间预算选择视频编码参数
+
+在本机编码输入中间的一小段样本测速：
+1. 只解码（含缩放与音频转码）一次，得到与预设无关的固定开销
+2. 用参考预设编码一次，扣除解码开销后按各预设的相对速度估算编码耗时
+3. 选出能在预算内完成的最慢（画质最好）预设，再对该预设单独采样校验
+测速结果可由调用方缓存，相同输入再次估算时无需重新采样。
+"""
+import os
+import logging
+from typing import List, Optional, Tuple
+
+from ffmpeg_runner import run_ffmpeg
+from media_utils import VIDEO_TRANSCODE_ARGS
+
+logger = logging.getLogger(__name__)
+
+# 样本时长（秒）
+SAMPLE_SECONDS = 4.0
+# 预算安全系数：估算耗时需低于预算的该比例
+BUDGET_SAFETY = 0.85
+# 封装、写盘等额外开销的估算比例
+OVERHEAD_RATIO = 0.05
+# 预算不足时最多上调的 CRF
+MAX_CRF_INCREASE = 5
+# 校验选中预设时最多追加的采样次数
+MAX_VERIFY_SAMPLES = 3
+
+# 预设由慢到快排列，数值为相对参考预设的编码速度倍数（不含解码，经验值）
+ENCODER_PROFILES = {
+    'libx264': {
+        'reference': 'medium',
+        'base_crf': 23,
+        'presets': [
+            ('veryslow', 0.3), ('slower', 0.5), ('slow', 0.75), ('medium', 1.0),
+            ('fast', 1.15), ('faster', 1.3), ('veryfast', 2.0), ('superfast', 2.9), ('ultrafast', 5.0),
+        ],
+    },
+    'libvpx-vp9': {
+        'reference': '4',
+        'base_crf': 30,
+        'presets': [
+            ('1', 0.2), ('2', 0.4), ('3', 0.65), ('4', 1.0), ('5', 1.5), ('6', 2.2), ('7', 3.0), ('8', 3.8),
+        ],
+    },
+}
+
+
+def encoder_for_target(target: str) -> str:
+    """目标格式转码时使用的视频编码器"""
+    video_args = VIDEO_TRANSCODE_ARGS[target][0]
+    return video_args[video_args.index('-c:v') + 1]
+
+
+def build_video_args(encoder: str, preset: str, crf: int, threads: int) -> List[str]:
+    """构建指定预设/CRF/线程数的视频编码参数"""
+    if encoder == 'libx264':
+        return ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-threads', str(threads)]
+    if encoder == 'libvpx-vp9':
+        return ['-c:v', 'libvpx-vp9', '-deadline', 'good', '-cpu-used', preset, '-row-mt', '1',
+                '-crf', str(crf), '-b:v', '0', '-threads', str(threads)]
+    raise ValueError(f"编码器 {encoder} 不支持时间预算模式")
+
+
+async def _sample_cost(input_path: str, duration: float, scale_filter: str,
+                       video_args: Optional[List[str]], audio_args: Optional[List[str]],
+                       request=None) -> float:
+    """
+    处理输入中间的一段样本，返回每秒媒体的实际耗时（秒）
+
+    video_args 为 None 时视频只解码（含缩放）不编码；audio_args 为 None 时忽略音频。
+    耗时从取得视频槽位后计起，不含排队等待；包含进程启动开销，结果偏保守。
+    """
+    sample_len = min(SAMPLE_SECONDS, duration)
+    start = max(0.0, duration / 2 - sample_len / 2)
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-ss", f"{start:.3f}", "-t", f"{sample_len:.3f}",
+           "-i", input_path]
+    if scale_filter:
+        cmd.extend(["-vf", scale_filter])
+    cmd.extend(video_args or ["-c:v", "wrapped_avframe"])
+    cmd.extend(audio_args or ["-an"])
+    cmd.extend(["-f", "null", "-"])
+
+    result = await run_ffmpeg(cmd, request, feature="video", timeout=120)
+    if result.returncode != 0:
+        raise ValueError(f"样本编码失败: {result.stderr[-500:]}")
+    return max(result.elapsed, 1e-3) / sample_len
+
+
+def estimate_seconds(target: str, costs: dict, preset: str, duration: float) -> float:
+    """估算使用 preset 完整编码所需秒数，已单独采样的预设直接使用实测值"""
+    profile = ENCODER_PROFILES[encoder_for_target(target)]
+    if preset in costs['presets']:
+        cost = costs['presets'][preset]
+    else:
+        multiplier = dict(profile['presets'])[preset]
+        encode_cost = max(costs['presets'][profile['reference']] - costs['decode'], 1e-3)
+        cost = costs['decode'] + encode_cost / multiplier
+    return duration * cost * (1 + OVERHEAD_RATIO)
+
+
+def choose_encode_settings(target: str, duration: float, costs: dict,
+                           budget: float, threads: Optional[int] = None) -> dict:
+    """
+    选择能在预算内完成的最高画质参数
+
+    返回 {encoder, preset, crf, threads, video_args, estimated_seconds, fits, extrapolated, ...}；
+    即使最快预设也超出预算时，选最快预设并适当上调 CRF，fits 为 False。
+    测速只在基准 CRF 下进行，上调 CRF 后的耗时未经实测，estimated_seconds 仍为基准 CRF 下的估算
+    （通常偏保守），此时 extrapolated 为 True。
+    """
+    encoder = encoder_for_target(target)
+    profile = ENCODER_PROFILES[encoder]
+    threads = threads or os.cpu_count() or 1
+    usable = budget * BUDGET_SAFETY
+
+    chosen = profile['presets'][-1][0]
+    fits = False
+    for preset, _ in profile['presets']:
+        if estimate_seconds(target, costs, preset, duration) <= usable:
+            chosen, fits = preset, True
+            break
+
+    crf = profile['base_crf']
+    estimated = estimate_seconds(target, costs, chosen, duration)
+    if not fits:
+        # 更高的 CRF 码率更低，编码略快；超出越多上调越多
+        crf += min(MAX_CRF_INCREASE, int(estimated / max(usable, 1e-3)))
+
+    return {
+        "encoder": encoder,
+        "preset": chosen,
+        "crf": crf,
+        "threads": threads,
+        "video_args": build_video_args(encoder, chosen, crf, threads),
+        "duration": round(duration, 3),
+        "budget": budget,
+        "estimated_seconds": round(estimated, 1),
+        "fits": fits,
+        "extrapolated": not fits,
+    }
+
+
+async def plan_deadline_encode(input_path: str, duration: float, target: str, budget: float,
+                               scale_filter: str = '', audio_args: Optional[List[str]] = None,
+                               costs: Optional[dict] = None, request=None) -> Tuple[dict, dict]:
+    """
+    按时间预算规划编码参数
+
+    audio_args 为音频需要转码时的编码参数，计入每次采样的固定开销。
+    costs 为之前的测速结果（{"decode": ..., "presets": {预设: 单位耗时}}），缺失的项会补测。
+    返回 (settings, costs)，调用方可缓存 costs 供后续请求复用。
+    """
+    encoder = encoder_for_target(target)
+    profile = ENCODER_PROFILES[encoder]
+    threads = os.cpu_count() or 1
+    costs = costs or {"decode": None, "presets": {}}
+
+    async def sample(preset: str) -> None:
+        args = build_video_args(encoder, preset, profile['base_crf'], threads)
+        costs['presets'][preset] = await _sample_cost(input_path, duration, scale_filter, args, audio_args, request)
+        logger.info(f"Sample encode ({encoder} {preset}): {costs['presets'][preset]:.3f}s per media second")
+
+    if costs['decode'] is None:
+        costs['decode'] = await _sample_cost(input_path, duration, scale_filter, None, audio_args, request)
+    if profile['reference'] not in costs['presets']:
+        await sample(profile['reference'])
+
+    settings = choose_encode_settings(target, duration, costs, budget, threads)
+    for _ in range(MAX_VERIFY_SAMPLES):
+        if settings['preset'] in costs['presets']:
+            break
+        # 对选中的预设单独采样校验，估算偏差较大时会改选其他预设
+        await sample(settings['preset'])
+        settings = choose_encode_settings(target, duration, costs, budget, threads)
+    return settings, costs
@@ -0,0 +1,111 @@
+"""
+分段并行视频编码
+
+单个 libx264/libvpx-vp9 进程无法占满多核 CPU（VP9 尤其明显）。并行模式下：
+1. 在关键帧处将视频流切分为若干片段（-c copy，不解码）
+2. 使用进程池并发编码各片段
+3. 通过 concat 分离器无损拼接，音频直接取自原始输入，保证连续
+"""
+import os
+import asyncio
+import logging
+from typing import List, Optional
+
+from ffmpeg_runner import run_ffmpeg, feature_slot
+
+logger = logging.getLogger(__name__)
+
+# 默认片段时长（秒），实际切点落在其后的第一个关键帧
+SEGMENT_SECONDS = float(os.environ.get('YUNRAN_SEGMENT_SECONDS', '10'))
+# 输入时长不足该值时并行收益有限，直接走普通编码
+MIN_PARALLEL_DURATION = SEGMENT_SECONDS * 2
+
+
+def default_workers() -> int:
+    """默认并发编码进程数"""
+    return max(1, os.cpu_count() or 1)
+
+
+class ParallelEncodeError(Exception):
+    """分段并行编码失败"""
+
+    def __init__(self, stage: str, stderr: str):
+        super().__init__(f"{stage}: {stderr[-500:]}")
+        self.stage = stage
+        self.stderr = stderr
+
+
+async def _run(cmd: List[str], stage: str, request, timeout: float) -> None:
+    result = await run_ffmpeg(cmd, request, feature="video_segment", timeout=timeout)
+    if result.returncode != 0:
+        raise ParallelEncodeError(stage, result.stderr)
+
+
+async def encode_parallel(input_path: str, output_path: str, work_dir: str,
+                          video_args: List[str], audio_args: Optional[List[str]],
+                          scale_filter: str = '', workers: Optional[int] = None,
+                          segment_seconds: float = SEGMENT_SECONDS,
+                          request=None, timeout: float = 3600) -> int:
+    """
+    分段并行编码视频
+
+    video_args 为视频编码参数（如 ['-c:v', 'libx264', ...]），audio_args 为音频参数，
+    为 None 时输出不含音频。work_dir 用于存放片段，调用方负责清理。
+    整个任务只占用一个 video 槽位，片段编码使用独立的 video_segment 进程池。
+    返回片段数量。
+    """
+    workers = workers or default_workers()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(work_dir, exist_ok=True)
+
+    async with feature_slot("video", request):
+        # 1. 在关键帧处切分视频流（流复制，不解码）
+        segment_pattern = os.path.join(work_dir, "seg_%05d.mkv")
+        await _run([
+            "ffmpeg", "-hide_banner", "-y", "-i", input_path,
+            "-map", "0:v:0", "-c", "copy", "-f", "segment",
+            "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+            segment_pattern
+        ], "split", request, timeout)
+
+        segments = sorted(
+            name for name in os.listdir(work_dir)
+            if name.startswith("seg_") and name.endswith(".mkv")
+        )
+        if not segments:
+            raise ParallelEncodeError("split", "未生成任何视频片段")
+        logger.info(f"Parallel encode: {len(segments)} segments, {workers} workers x {threads} threads")
+
+        # 2. 并发编码各片段
+        semaphore = asyncio.Semaphore(workers)
+        scale_args = ["-vf", scale_filter] if scale_filter else []
+
+        async def encode_segment(name: str) -> str:
+            encoded = os.path.join(work_dir, "enc_" + name[len("seg_"):])
+            async with semaphore:
+                await _run(
+                    ["ffmpeg", "-hide_banner", "-y", "-i", os.path.join(work_dir, name), "-an"]
+                    + scale_args + video_args + ["-threads", str(threads), encoded],
+                    f"encode {name}", request, timeout
+                )
+            return encoded
+
+        encoded_paths = await asyncio.gather(*(encode_segment(name) for name in segments))
+
+        # 3. 无损拼接，音频取自原始输入
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in encoded_paths:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        cmd = ["ffmpeg", "-hide_banner", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_args is not None:
+            cmd.extend(["-i", input_path, "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy"])
+            cmd.extend(audio_args)
+        else:
+            cmd.extend(["-map", "0:v:0", "-c:v", "copy"])
+        cmd.append(output_path)
+        await _run(cmd, "concat", request, timeout)
+
+    return len(segments)
@@ -0,0 +1,183 @@
+/**
+ * 主进程与 Python 后端之间的传输方式
+ *
+ * - macOS / Linux：后端监听 Unix 域套接字（位于仅当前用户可访问的临时目录），
+ *   渲染进程通过自定义协议 yunran://backend 访问，由主进程转发到套接字，不经过回环 TCP，也不会端口冲突
+ * - Windows（uvicorn 不支持命名管道）：监听 127.0.0.1，8000 被占用时改用系统分配的空闲端口
+ * - 设置 YUNRAN_TRANSPORT=tcp 时始终使用 TCP；设置 YUNRAN_BACKEND_URL 时使用已启动的后端（开发脚本）
+ */
+const { protocol } = require('electron')
+const fs = require('fs')
+const http = require('http')
+const net = require('net')
+const os = require('os')
+const path = require('path')
+const { Readable } = require('stream')
+
+const SCHEME = 'yunran'
+const DEFAULT_PORT = 8000
+
+// 必须在 app ready 之前调用：允许自定义协议使用 fetch/XHR、跨域与流式请求体
+function registerBackendScheme() {
+  protocol.registerSchemesAsPrivileged([
+    {
+      scheme: SCHEME,
+      privileges: { standard: true, secure: true, supportFetchAPI: true, corsEnabled: true, stream: true },
+    },
+  ])
+}
+
+// 检查端口是否可以监听，不可用时返回系统分配的空闲端口
+function findFreePort(preferred) {
+  return new Promise((resolve) => {
+    const server = net.createServer()
+    server.once('error', () => {
+      const fallback = net.createServer()
+      fallback.listen(0, '127.0.0.1', () => {
+        const { port } = fallback.address()
+        fallback.close(() => resolve(port))
+      })
+    })
+    server.listen(preferred, '127.0.0.1', () => {
+      server.close(() => resolve(preferred))
+    })
+  })
+}
+
+/**
+ * 选择传输方式
+ * @returns {Promise<object>} { type: 'uds' | 'tcp' | 'external', socketPath?, host?, port?, url, spawn }
+ */
+async function createTransport() {
+  if (process.env.YUNRAN_BACKEND_URL) {
+    const url = new URL(process.env.YUNRAN_BACKEND_URL)
+    return {
+      type: 'external',
+      host: url.hostname,
+      port: Number(url.port) || 80,
+      url: url.origin,
+      spawn: false,
+    }
+  }
+
+  if (process.platform !== 'win32' && process.env.YUNRAN_TRANSPORT !== 'tcp') {
+    // mkdtemp 创建的目录权限为 0700；macOS 套接字路径上限 104 字节，不放在 userData 下
+    const socketDir = fs.mkdtempSync(path.join(os.tmpdir(), 'yunran-'))
+    return {
+      type: 'uds',
+      socketDir,
+      socketPath: path.join(socketDir, 'backend.sock'),
+      url: `${SCHEME}://backend`,
+      spawn: true,
+    }
+  }
+
+  const port = await findFreePort(DEFAULT_PORT)
+  return { type: 'tcp', host: '127.0.0.1', port, url: `http://127.0.0.1:${port}`, spawn: true }
+}
+
+// uvicorn 命令行参数
+function uvicornArgs(transport) {
+  if (transport.type === 'uds') {
+    return ['--uds', transport.socketPath]
+  }
+  return ['--host', transport.host, '--port', String(transport.port)]
+}
+
+// 打包后的后端可执行文件通过环境变量指定监听方式
+function backendEnv(transport) {
+  if (transport.type === 'uds') {
+    return { YUNRAN_UDS: transport.socketPath }
+  }
+  return { YUNRAN_PORT: String(transport.port) }
+}
+
+function connectionOptions(transport) {
+  if (transport.type === 'uds') {
+    return { socketPath: transport.socketPath }
+  }
+  return { host: transport.host, port: transport.port }
+}
+
+/**
+ * 主进程直接请求后端（健康检查等）
+ * @returns {Promise<object>} { status, headers, body }
+ */
+function backendRequest(transport, urlPath, { method = 'GET', timeout = 2000 } = {}) {
+  return new Promise((resolve, reject) => {
+    const req = http.request({ ...connectionOptions(transport), path: urlPath, method, timeout }, (res) => {
+      const chunks = []
+      res.on('data', (chunk) => chunks.push(chunk))
+      res.on('end', () => resolve({
+        status: res.statusCode,
+        headers: res.headers,
+        body: Buffer.concat(chunks).toString('utf8'),
+      }))
+      res.on('error', reject)
+    })
+    req.on('timeout', () => req.destroy(new Error('timeout')))
+    req.on('error', reject)
+    req.end()
+  })
+}
+
+// 将 Node 响应头转换为 Fetch API 的 Headers（Set-Cookie 等多值头逐个追加）
+function toHeaders(rawHeaders) {
+  const headers = new Headers()
+  for (let i = 0; i < rawHeaders.length; i += 2) {
+    headers.append(rawHeaders[i], rawHeaders[i + 1])
+  }
+  return headers
+}
+
+/**
+ * 注册 yunran:// 协议：将渲染进程的请求转发到 Unix 域套接字，请求体与响应体都以流的方式传递
+ */
+function handleBackendScheme(transport) {
+  if (transport.type !== 'uds') {
+    return
+  }
+  protocol.handle(SCHEME, (request) => new Promise((resolve, reject) => {
+    const url = new URL(request.url)
+    const headers = Object.fromEntries(request.headers)
+    delete headers.host
+
+    const req = http.request({
+      socketPath: transport.socketPath,
+      method: request.method,
+      path: url.pathname + url.search,
+      headers,
+    }, (res) => {
+      const noBody = request.method === 'HEAD' || res.statusCode === 204 || res.statusCode === 304
+      resolve(new Response(noBody ? null : Readable.toWeb(res), {
+        status: res.statusCode,
+        statusText: res.statusMessage,
+        headers: toHeaders(res.rawHeaders),
+      }))
+    })
+    req.on('error', reject)
+
+    if (request.body) {
+      Readable.fromWeb(request.body).on('error', (err) => req.destroy(err)).pipe(req)
+    } else {
+      req.end()
+    }
+  }))
+}
+
+// 退出时删除套接字目录
+function cleanupTransport(transport) {
+  if (transport && transport.type === 'uds') {
+    fs.rmSync(transport.socketDir, { recursive: true, force: true })
+  }
+}
+
+module.exports = {
+  registerBackendScheme,
+  createTransport,
+  uvicornArgs,
+  backendEnv,
+  backendRequest,
+  handleBackendScheme,
+  cleanupTransport,
+}
@@ -3,6 +3,15 @@ const path = require('path')
 const { spawn } = require('child_process')
 const fs = require('fs')
 const log = require('electron-log')
+const {
+  registerBackendScheme,
+  createTransport,
+  uvicornArgs,
+  backendEnv,
+  backendRequest,
+  handleBackendScheme,
+  cleanupTransport,
+} = require('./backend-transport')
 
 // 配置日志
 log.initialize()
@@ -13,6 +22,11 @@ log.transports.console.level = 'debug'
 let mainWindow
 let pythonProcess = null
 let pythonReady = false
+// 与后端之间的传输方式（Unix 域套接字或 TCP），见 backend-transport.js
+let backendTransport = null
+
+// 自定义协议须在 app ready 之前注册
+registerBackendScheme()
 
 // 判断是否为开发环境
 const isDev = process.env.NODE_ENV === 'development' || !app.isPackaged
@@ -76,14 +90,11 @@ function getBackendPath() {
 
 // 检查Python后端是否就绪
 async function checkPythonHealth(maxRetries = 30, interval = 1000) {
-  const fetch = (await import('node-fetch')).default
-  
   for (let i = 0; i < maxRetries; i++) {
     try {
-      const response = await fetch('http://127.0.0.1:8000/api/health', { timeout: 2000 })
-      if (response.ok) {
-        const data = await response.json()
-        log.info('Python backend is ready:', data)
+      const response = await backendRequest(backendTransport, '/api/health', { timeout: 2000 })
+      if (response.status === 200) {
+        log.info('Python backend is ready:', response.body)
         return true
       }
     } catch (error) {
@@ -101,6 +112,7 @@ async function startPythonBackend() {
   
   log.info('Starting Python backend...')
   log.info('Backend path:', backendPath)
+  log.info('Backend transport:', backendTransport.type, backendTransport.socketPath || backendTransport.port)
   
   let pyProcess
   
@@ -110,6 +122,7 @@ async function startPythonBackend() {
     
     const env = {
       ...process.env,
+      ...backendEnv(backendTransport),
       PYTHONUNBUFFERED: '1',
     }
     
@@ -137,7 +150,7 @@ async function startPythonBackend() {
       PYTHONUNBUFFERED: '1',
     }
     
-    pyProcess = spawn(pythonPath, ['-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', '8000'], {
+    pyProcess = spawn(pythonPath, ['-m', 'uvicorn', 'main:app', ...uvicornArgs(backendTransport)], {
       cwd: backendPath,
       env: env,
       stdio: 'pipe'
@@ -218,7 +231,9 @@ function createWindow() {
     webPreferences: {
       nodeIntegration: false,
       contextIsolation: true,
-      preload: path.join(__dirname, 'preload.js')
+      preload: path.join(__dirname, 'preload.js'),
+      // 渲染进程访问后端的地址（yunran://backend 或 http://127.0.0.1:端口），由 preload 读取
+      additionalArguments: [`--yunran-backend-url=${backendTransport.url}`]
     },
     titleBarStyle: 'default',
     show: false, // 先不显示，等加载完成后再显示
@@ -288,12 +303,19 @@ function createWindow() {
 
 // Electron应用就绪
 app.whenReady().then(async () => {
+  backendTransport = await createTransport()
+  handleBackendScheme(backendTransport)
+  
   // 先创建窗口，即使后端启动失败也能看到界面
   createWindow()
   
   try {
-    // 启动Python后端
-    pythonProcess = await startPythonBackend()
+    // 启动Python后端（开发脚本已启动后端时只等待其就绪）
+    if (backendTransport.spawn) {
+      pythonProcess = await startPythonBackend()
+    } else if (await checkPythonHealth(30, 1000)) {
+      pythonReady = true
+    }
   } catch (error) {
     log.error('Failed to start Python backend:', error)
     // 显示警告但不退出
@@ -328,6 +350,10 @@ app.on('before-quit', () => {
   stopPythonBackend()
 })
 
+app.on('quit', () => {
+  cleanupTransport(backendTransport)
+})
+
 // IPC通信处理
 ipcMain.handle('get-app-version', () => {
   return app.getVersion()
@@ -340,9 +366,8 @@ ipcMain.handle('get-platform', () => {
 // 健康检查
 ipcMain.handle('check-health', async () => {
   try {
-    const fetch = (await import('node-fetch')).default
-    const response = await fetch('http://127.0.0.1:8000/api/health')
-    return await response.json()
+    const response = await backendRequest(backendTransport, '/api/health')
+    return JSON.parse(response.body)
   } catch (error) {
     log.error('Health check failed:', error)
     return { status: 'error', message: error.message }
@@ -353,6 +378,8 @@ ipcMain.handle('check-health', async () => {
 ipcMain.handle('get-backend-status', () => {
   return {
     ready: pythonReady,
-    pid: pythonProcess ? pythonProcess.pid : null
+    pid: pythonProcess ? pythonProcess.pid : null,
+    transport: backendTransport ? backendTransport.type : null,
+    url: backendTransport ? backendTransport.url : null
   }
 })
@@ -1,5 +1,9 @@
 const { contextBridge, ipcRenderer } = require('electron')
 
+// 主进程通过 additionalArguments 传入的后端地址
+const backendArg = process.argv.find((arg) => arg.startsWith('--yunran-backend-url='))
+const backendURL = backendArg ? backendArg.slice('--yunran-backend-url='.length) : null
+
 // 暴露安全的API给渲染进程
 contextBridge.exposeInMainWorld('electronAPI', {
   // 获取应用版本
@@ -11,6 +15,9 @@ contextBridge.exposeInMainWorld('electronAPI', {
   // 健康检查
   checkHealth: () => ipcRenderer.invoke('check-health'),
   
+  // 后端地址：Unix 域套接字模式下为 yunran://backend，由主进程转发
+  backendURL,
+  
   // 平台判断
   isWindows: () => process.platform === 'win32',
   isMac: () => process.platform === 'darwin',
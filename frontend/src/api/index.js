@@ -1,23 +1,20 @@
 import axios from 'axios'
 
-// 获取API基础URL
-const getBaseURL = () => {
-  // 开发环境使用本地后端
-  if (import.meta.env.DEV) {
-    return 'http://127.0.0.1:8000/api'
-  }
-  // 生产环境 - 同样使用本地后端（Electron会启动后端服务）
-  return 'http://127.0.0.1:8000/api'
-}
-
 // 获取完整的基础URL（包含协议和主机）
 const getFullBaseURL = () => {
-  if (import.meta.env.DEV) {
-    return 'http://127.0.0.1:8000'
+  // Electron 中使用主进程传入的地址：Unix 域套接字模式为 yunran://backend，否则为实际监听的端口
+  if (window.electronAPI?.backendURL) {
+    return window.electronAPI.backendURL
   }
+  // 浏览器中开发调试时使用本地后端
   return 'http://127.0.0.1:8000'
 }
 
+// 获取API基础URL
+const getBaseURL = () => {
+  return `${getFullBaseURL()}/api`
+}
+
 // 创建 axios 实例
 const api = axios.create({
   baseURL: getBaseURL(),
@@ -73,6 +70,11 @@ api.interceptors.response.use(
         case 413:
           errorMessage = '文件太大'
           break
+        case 429:
+          // 重负载功能繁忙，Retry-After 为建议的重试等待秒数
+          error.retryAfter = Number(error.response.headers?.['retry-after']) || 0
+          errorMessage = data?.detail || '服务繁忙，请稍后重试'
+          break
         case 500:
           errorMessage = data?.detail || '服务器内部错误'
           break
@@ -91,7 +93,7 @@ api.interceptors.response.use(
       if (error.code === 'ECONNABORTED') {
         errorMessage = '请求超时，请检查后端服务是否正常运行'
       } else if (error.code === 'ECONNREFUSED') {
-        errorMessage = '无法连接到后端服务 (127.0.0.1:8000)，请确保应用已正确启动'
+        errorMessage = `无法连接到后端服务 (${getFullBaseURL()})，请确保应用已正确启动`
       } else {
         errorMessage = '网络错误，后端服务可能未启动'
       }
@@ -156,11 +158,121 @@ export const getAreas = () => {
   return api.get('/idcard/areas')
 }
 
+// ==================== 分块上传 API ====================
+
+/**
+ * 将输入文件加入表单：File 对象作为 file 字段，字符串视为分块上传 ID
+ * @param {FormData} formData - 表单
+ * @param {File|string} file - 文件或 upload_id
+ */
+const appendFile = (formData, file) => {
+  if (typeof file === 'string') {
+    formData.append('upload_id', file)
+  } else {
+    formData.append('file', file)
+  }
+}
+
+/**
+ * 创建可续传上传
+ * @param {string} filename - 文件名
+ * @param {number} size - 文件大小（字节）
+ * @returns {Promise} upload_id、建议的分块大小（chunk_size）与已接收范围
+ */
+export const createUpload = (filename, size) => {
+  const formData = new FormData()
+  formData.append('filename', filename)
+  formData.append('size', size)
+  return api.post('/uploads', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  })
+}
+
+/**
+ * 上传一个分块
+ * @param {string} uploadId - 上传 ID
+ * @param {number} offset - 分块在文件中的起始字节
+ * @param {Blob} chunk - 分块数据
+ * @returns {Promise} 最新的上传状态
+ */
+export const uploadChunk = (uploadId, offset, chunk) => {
+  return api.put(`/uploads/${uploadId}`, chunk, {
+    params: { offset },
+    headers: { 'Content-Type': 'application/octet-stream' },
+  })
+}
+
+/**
+ * 查询上传状态
+ * @param {string} uploadId - 上传 ID
+ * @returns {Promise} 已接收的字节范围 ranges（[起始, 结束) 列表）等
+ */
+export const getUpload = (uploadId) => {
+  return api.get(`/uploads/${uploadId}`)
+}
+
+/**
+ * 完成上传
+ * @param {string} uploadId - 上传 ID
+ * @param {string} sha256 - 整个文件的 sha256（十六进制）
+ * @returns {Promise} 上传状态
+ */
+export const completeUpload = (uploadId, sha256) => {
+  const formData = new FormData()
+  formData.append('sha256', sha256)
+  return api.post(`/uploads/${uploadId}/complete`, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  })
+}
+
+/**
+ * 删除上传
+ * @param {string} uploadId - 上传 ID
+ * @returns {Promise} 删除结果
+ */
+export const deleteUpload = (uploadId) => {
+  return api.delete(`/uploads/${uploadId}`)
+}
+
+/**
+ * 以分块方式上传文件，只补传服务端缺失的范围（可用于中断后续传）
+ * @param {File} file - 文件
+ * @param {string} sha256 - 文件的 sha256
+ * @param {Function} onProgress - 进度回调函数 (progress: number) => void
+ * @param {string} uploadId - 续传时传入之前的上传 ID
+ * @returns {Promise<string>} 完成后的 upload_id，可代替文件传给转换、合并、抠图接口
+ */
+export const uploadResumable = async (file, sha256, onProgress, uploadId = '') => {
+  const { data: status } = uploadId ? await getUpload(uploadId) : await createUpload(file.name, file.size)
+  const id = status.upload_id
+  const chunkSize = status.chunk_size
+  let received = status.received
+
+  // 计算缺失的范围并逐块上传
+  let position = 0
+  const missing = []
+  for (const [start, end] of [...status.ranges, [file.size, file.size]]) {
+    if (start > position) missing.push([position, start])
+    position = Math.max(position, end)
+  }
+  for (const [start, end] of missing) {
+    for (let offset = start; offset < end; offset += chunkSize) {
+      const stop = Math.min(offset + chunkSize, end)
+      await uploadChunk(id, offset, file.slice(offset, stop))
+      received += stop - offset
+      if (onProgress) onProgress(Math.round((received * 100) / file.size))
+    }
+  }
+
+  await completeUpload(id, sha256)
+  return id
+}
+
 // ==================== PDF 合并 API ====================
 
 /**
  * 合并 PDF 文件
- * @param {File[]} files - PDF文件数组
+ * @param {Array<File|string>} files - PDF文件数组，可包含已完成的分块上传 ID（排在文件之后合并）
  * @param {Function} onProgress - 进度回调函数 (progress: number) => void
  * @returns {Promise} 合并后的 PDF 文件
  */
@@ -170,12 +282,18 @@ export const mergePdf = (files, onProgress) => {
   }
   
   const formData = new FormData()
+  const uploadIds = []
   files.forEach((file, index) => {
+    if (typeof file === 'string') {
+      uploadIds.push(file)
+      return
+    }
     if (file.size > 50 * 1024 * 1024) {
       throw new Error(`文件 ${file.name} 超过50MB限制`)
     }
     formData.append('files', file)
   })
+  if (uploadIds.length > 0) formData.append('upload_ids', uploadIds.join(','))
   
   return api.post('/pdf/merge', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
@@ -193,7 +311,7 @@ export const mergePdf = (files, onProgress) => {
 
 /**
  * 移除图片背景
- * @param {File} file - 图片文件
+ * @param {File|string} file - 图片文件，或已完成的分块上传 ID（见 uploadResumable）
  * @param {Function} onProgress - 进度回调函数
  * @returns {Promise} 处理后的图片
  */
@@ -204,7 +322,7 @@ export const removeBackground = (file, onProgress) => {
   
   // 检查文件类型
   const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/webp']
-  if (!allowedTypes.includes(file.type)) {
+  if (typeof file !== 'string' && !allowedTypes.includes(file.type)) {
     return Promise.reject(new Error('不支持的文件格式，请上传 JPG、PNG、BMP 或 WebP 格式的图片'))
   }
   
@@ -213,7 +331,7 @@ export const removeBackground = (file, onProgress) => {
   }
   
   const formData = new FormData()
-  formData.append('file', file)
+  appendFile(formData, file)
   
   return api.post('/photo/remove-bg', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
@@ -229,7 +347,7 @@ export const removeBackground = (file, onProgress) => {
 
 /**
  * 更换证件照背景色
- * @param {File} file - 图片文件
+ * @param {File|string} file - 图片文件，或已完成的分块上传 ID（见 uploadResumable）
  * @param {string} color - 背景色 (hex格式，如 #ffffff)
  * @param {Function} onProgress - 进度回调函数
  * @returns {Promise} 处理后的图片
@@ -241,7 +359,7 @@ export const changeBackground = (file, color = '#ffffff', onProgress) => {
   
   // 检查文件类型
   const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/webp']
-  if (!allowedTypes.includes(file.type)) {
+  if (typeof file !== 'string' && !allowedTypes.includes(file.type)) {
     return Promise.reject(new Error('不支持的文件格式，请上传 JPG、PNG、BMP 或 WebP 格式的图片'))
   }
   
@@ -256,7 +374,7 @@ export const changeBackground = (file, color = '#ffffff', onProgress) => {
   }
   
   const formData = new FormData()
-  formData.append('file', file)
+  appendFile(formData, file)
   formData.append('color', color)
   
   return api.post('/photo/change-bg', formData, {
@@ -275,13 +393,14 @@ export const changeBackground = (file, color = '#ffffff', onProgress) => {
 
 /**
  * 转换音频格式
- * @param {File} file - 音频文件
+ * @param {File|string} file - 音频文件，或已完成的分块上传 ID（见 uploadResumable）
  * @param {string} format - 目标格式 (mp3, wav, aac, flac, ogg)
  * @param {string} bitrate - 比特率 (如 192k)
  * @param {Function} onProgress - 进度回调函数
+ * @param {string} normalize - 目标响度 (LUFS，如 -16；留空不做标准化)
  * @returns {Promise} 转换后的音频文件
  */
-export const convertAudio = (file, format = 'mp3', bitrate = '192k', onProgress) => {
+export const convertAudio = (file, format = 'mp3', bitrate = '192k', onProgress, normalize = '') => {
   if (!file) {
     return Promise.reject(new Error('请选择音频文件'))
   }
@@ -296,9 +415,10 @@ export const convertAudio = (file, format = 'mp3', bitrate = '192k', onProgress)
   }
   
   const formData = new FormData()
-  formData.append('file', file)
+  appendFile(formData, file)
   formData.append('format', format)
   formData.append('bitrate', bitrate)
+  if (normalize) formData.append('normalize', normalize)
   
   return api.post('/audio/convert', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
@@ -313,24 +433,92 @@ export const convertAudio = (file, format = 'mp3', bitrate = '192k', onProgress)
   })
 }
 
+/**
+ * 一次上传转换为多种音频格式
+ * @param {File|string} file - 音频文件，或已完成的分块上传 ID（见 uploadResumable）
+ * @param {Array<{format: string, bitrate?: string}>} targets - 输出格式列表
+ * @param {Function} onProgress - 进度回调函数
+ * @param {string} normalize - 目标响度 (LUFS，如 -16；留空不做标准化)
+ * @returns {Promise} 包含全部输出的 zip 文件
+ */
+export const convertAudioMulti = (file, targets = [{ format: 'mp3', bitrate: '192k' }], onProgress, normalize = '') => {
+  if (!file) {
+    return Promise.reject(new Error('请选择音频文件'))
+  }
+  
+  if (file.size > 100 * 1024 * 1024) {
+    return Promise.reject(new Error('文件大小超过100MB限制'))
+  }
+  
+  if (!targets || targets.length === 0) {
+    return Promise.reject(new Error('请至少选择一种输出格式'))
+  }
+  
+  const formData = new FormData()
+  appendFile(formData, file)
+  formData.append('targets', targets.map(t => (t.bitrate ? `${t.format}:${t.bitrate}` : t.format)).join(','))
+  if (normalize) formData.append('normalize', normalize)
+  
+  return api.post('/audio/convert-multi', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+    responseType: 'blob',
+    timeout: 300000,
+    onUploadProgress: (progressEvent) => {
+      if (onProgress && progressEvent.total) {
+        const progress = Math.round((progressEvent.loaded * 100) / progressEvent.total)
+        onProgress(progress)
+      }
+    },
+  })
+}
+
+/**
+ * 获取音频波形峰值数据（用于预览）
+ * @param {File|string} file - 音频文件，或已完成的分块上传 ID（见 uploadResumable）
+ * @param {string} format - 返回格式 (json, binary)
+ * @returns {Promise} 多分辨率 min/max 峰值
+ */
+export const getAudioWaveform = (file, format = 'json') => {
+  if (!file) {
+    return Promise.reject(new Error('请选择音频文件'))
+  }
+  
+  if (file.size > 100 * 1024 * 1024) {
+    return Promise.reject(new Error('文件大小超过100MB限制'))
+  }
+  
+  const formData = new FormData()
+  appendFile(formData, file)
+  formData.append('format', format)
+  
+  return api.post('/audio/waveform', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+    responseType: format === 'binary' ? 'arraybuffer' : 'json',
+  })
+}
+
 // ==================== 视频转换 API（预留）====================
 
 /**
  * 转换视频格式（预留）
- * @param {File} file - 视频文件
+ * @param {File|string} file - 视频文件，或已完成的分块上传 ID（见 uploadResumable）
  * @param {string} format - 目标格式
  * @param {string} resolution - 分辨率
+ * @param {boolean} parallel - 是否分段并行编码（多核加速）
+ * @param {number} deadline - 时间预算（秒），大于 0 时按本机测速选择能在预算内完成的编码预设
  * @returns {Promise} 转换后的视频文件
  */
-export const convertVideo = (file, format = 'mp4', resolution = 'original') => {
+export const convertVideo = (file, format = 'mp4', resolution = 'original', parallel = false, deadline = 0) => {
   if (!file) {
     return Promise.reject(new Error('请选择视频文件'))
   }
   
   const formData = new FormData()
-  formData.append('file', file)
+  appendFile(formData, file)
   formData.append('format', format)
   formData.append('resolution', resolution)
+  if (parallel) formData.append('parallel', 'true')
+  if (deadline > 0) formData.append('deadline', deadline)
   
   return api.post('/video/convert', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
@@ -338,6 +526,116 @@ export const convertVideo = (file, format = 'mp4', resolution = 'original') => {
   })
 }
 
+/**
+ * 预估时间预算模式下的编码参数与完成时间
+ * @param {File|string} file - 视频文件，或已完成的分块上传 ID（见 uploadResumable）
+ * @param {string} format - 目标格式
+ * @param {string} resolution - 分辨率
+ * @param {number} deadline - 时间预算（秒）
+ * @param {boolean} parallel - 是否分段并发编码（与 convertVideo 一致）
+ * @returns {Promise} 选中的预设、CRF 与预计耗时（estimated_seconds）；extrapolated 为 true 时预计耗时未经实测，仅供参考
+ */
+export const estimateVideo = (file, format = 'mp4', resolution = 'original', deadline, parallel = false) => {
+  if (!file) {
+    return Promise.reject(new Error('请选择视频文件'))
+  }
+  
+  const formData = new FormData()
+  appendFile(formData, file)
+  formData.append('format', format)
+  formData.append('resolution', resolution)
+  formData.append('deadline', deadline)
+  if (parallel) formData.append('parallel', 'true')
+  
+  return api.post('/video/estimate', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  })
+}
+
+/**
+ * 生成关键帧缩略图精灵图
+ * @param {File|string} file - 视频文件，或已完成的分块上传 ID（见 uploadResumable）
+ * @param {number} count - 缩略图数量
+ * @param {number} width - 单张缩略图宽度
+ * @param {number} columns - 精灵图列数（0 为自动）
+ * @returns {Promise} 时间索引（frames 含每格位置与关键帧时间），精灵图地址见 sprite 字段
+ */
+export const getVideoThumbnails = (file, count = 10, width = 160, columns = 0) => {
+  if (!file) {
+    return Promise.reject(new Error('请选择视频文件'))
+  }
+  
+  const formData = new FormData()
+  appendFile(formData, file)
+  formData.append('count', count)
+  formData.append('width', width)
+  formData.append('columns', columns)
+  
+  return api.post('/video/thumbnails', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  })
+}
+
+/**
+ * 获取缩略图精灵图
+ * @param {string} spriteId - getVideoThumbnails 返回的 id
+ * @returns {Promise} 精灵图（JPEG）
+ */
+export const getVideoThumbnailSprite = (spriteId) => {
+  return api.get(`/video/thumbnails/${spriteId}`, { responseType: 'blob' })
+}
+
+/**
+ * 以 HLS 分段形式转换视频（后台任务，生成的分段可立即播放）
+ * @param {File|string} file - 视频文件，或已完成的分块上传 ID（见 uploadResumable）
+ * @param {string[]} renditions - 清晰度列表，如 ['720p', '360p']，默认仅原始分辨率
+ * @param {string} segmentType - 分段类型：fmp4 或 ts
+ * @param {number} segmentSeconds - 分段时长（秒）
+ * @returns {Promise} 任务信息（job_id、playlist 等）
+ */
+export const startHlsJob = (file, renditions = ['original'], segmentType = 'fmp4', segmentSeconds = 4) => {
+  if (!file) {
+    return Promise.reject(new Error('请选择视频文件'))
+  }
+  
+  const formData = new FormData()
+  appendFile(formData, file)
+  formData.append('renditions', renditions.join(','))
+  formData.append('segment_type', segmentType)
+  formData.append('segment_seconds', segmentSeconds)
+  
+  return api.post('/video/hls', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  })
+}
+
+/**
+ * 获取 HLS 任务状态
+ * @param {string} jobId - 任务 ID
+ * @returns {Promise} 任务状态（进度、已生成分段数、播放列表是否就绪）
+ */
+export const getHlsJob = (jobId) => {
+  return api.get(`/video/hls/${jobId}`)
+}
+
+/**
+ * 取消 HLS 任务并删除已生成的文件
+ * @param {string} jobId - 任务 ID
+ * @returns {Promise} 取消结果
+ */
+export const cancelHlsJob = (jobId) => {
+  return api.delete(`/video/hls/${jobId}`)
+}
+
+/**
+ * 获取 HLS 主播放列表的完整地址（供播放器使用）
+ * @param {string} jobId - 任务 ID
+ * @returns {string} 播放列表 URL
+ */
+export const getHlsPlaylistUrl = (jobId) => {
+  return `${getFullBaseURL()}/api/video/hls/${jobId}/master.m3u8`
+}
+
 /**
  * 获取视频转换功能状态
  * @returns {Promise} 功能状态
@@ -346,6 +644,46 @@ export const getVideoStatus = () => {
   return api.get('/video/status')
 }
 
+// ==================== 处理流水线 API ====================
+
+/**
+ * 多步处理流水线：一次上传，按顺序执行多个步骤，只在最后编码一次
+ * @param {string} kind - 流水线类型：image / pdf / audio
+ * @param {File|string|Array<File|string>} files - 输入文件或已完成的分块上传 ID（仅 pdf 可传多个）
+ * @param {Array<Object>} steps - 步骤列表，如 [{ op: 'remove-bg' }, { op: 'change-bg', color: '#438edb' }, { op: 'encode', format: 'jpeg' }]
+ * @param {Function} onProgress - 进度回调函数
+ * @returns {Promise} 处理结果，各步骤耗时见响应头 X-Pipeline-Timings
+ */
+export const runPipeline = (kind, files, steps, onProgress) => {
+  const inputs = Array.isArray(files) ? files : [files]
+  if (inputs.length === 0 || !inputs[0]) {
+    return Promise.reject(new Error('请选择文件'))
+  }
+
+  const formData = new FormData()
+  const uploadIds = []
+  inputs.forEach((file) => {
+    if (typeof file === 'string') {
+      uploadIds.push(file)
+    } else {
+      formData.append('files', file)
+    }
+  })
+  if (uploadIds.length > 0) formData.append('upload_ids', uploadIds.join(','))
+  formData.append('steps', JSON.stringify(steps))
+
+  return api.post(`/pipeline/${kind}`, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+    responseType: 'blob',
+    onUploadProgress: (progressEvent) => {
+      if (onProgress && progressEvent.total) {
+        const progress = Math.round((progressEvent.loaded * 100) / progressEvent.total)
+        onProgress(progress)
+      }
+    },
+  })
+}
+
 // ==================== 健康检查 API ====================
 
 /**
@@ -364,6 +702,91 @@ export const getStatus = () => {
   return api.get('/status')
 }
 
+/**
+ * 就绪检查：各功能模块的加载状态，预热完成前返回 503
+ * @returns {Promise} { ready, features, ffmpeg, ffprobe }
+ */
+export const getReady = () => {
+  return api.get('/ready', { validateStatus: (status) => status === 200 || status === 503 })
+}
+
+/**
+ * 获取正在运行的转换任务及进度
+ * @returns {Promise} 任务列表
+ */
+export const getTasks = () => {
+  return api.get('/tasks')
+}
+
+/**
+ * 获取运行指标（Prometheus 文本格式）
+ * @returns {Promise} 指标文本
+ */
+export const getMetrics = () => {
+  return api.get('/metrics', { responseType: 'text' })
+}
+
+/**
+ * 重新下载转换结果（支持断点续传）
+ * @param {string} resultId - 转换响应头 X-Result-Id 中的结果 ID
+ * @param {number} offset - 起始字节，大于 0 时只下载剩余部分
+ * @returns {Promise} 结果文件（从 offset 开始的部分）
+ */
+export const downloadResult = (resultId, offset = 0) => {
+  const headers = offset > 0 ? { Range: `bytes=${offset}-` } : {}
+  return api.get(`/results/${resultId}`, { headers, responseType: 'blob' })
+}
+
+/**
+ * 获取性能分析设置与已保存的分析结果
+ * @returns {Promise} { config, profiles }
+ */
+export const listProfiles = () => {
+  return api.get('/profiles')
+}
+
+/**
+ * 对之后若干个匹配路径前缀的请求做性能分析
+ * @param {string} path - 接口路径前缀，如 /api/photo/
+ * @param {number} count - 分析的请求数
+ * @param {string} mode - cpu / memory / all
+ * @returns {Promise} 分析设置
+ */
+export const armProfiling = (path = '/api/', count = 1, mode = 'cpu') => {
+  const formData = new FormData()
+  formData.append('path', path)
+  formData.append('count', count)
+  formData.append('mode', mode)
+  return api.post('/profiles/arm', formData)
+}
+
+/**
+ * 取消尚未用完的性能分析
+ * @returns {Promise} 分析设置
+ */
+export const disarmProfiling = () => {
+  return api.delete('/profiles/arm')
+}
+
+/**
+ * 获取分析文件的下载地址
+ * @param {string} profileId - 响应头 X-Profile-Id 中的分析结果 ID
+ * @param {string} kind - speedscope / pstats / tracemalloc
+ * @returns {string} 下载 URL
+ */
+export const getProfileDownloadUrl = (profileId, kind = 'speedscope') => {
+  return `${getFullBaseURL()}/api/profiles/${profileId}/${kind}`
+}
+
+/**
+ * 删除分析结果
+ * @param {string} profileId - 分析结果 ID
+ * @returns {Promise} 删除结果
+ */
+export const deleteProfile = (profileId) => {
+  return api.delete(`/profiles/${profileId}`)
+}
+
 /**
  * 手动触发临时文件清理
  * @returns {Promise} 清理结果
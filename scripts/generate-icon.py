@@ -2,106 +2,144 @@
 """
 生成云褍实用工具图标
 风格：蓝色渐变背景 + 发光工具箱图标
+
+只按最大尺寸（1024）绘制一次母版：渐变、发光层与频谱条直接用 NumPy 数组生成，
+圆角边框、提手等少量图形用 ImageDraw 绘制；各尺寸由母版高质量缩小（LANCZOS）得到，
+在线程池中并行处理。
+生成后在输出目录写入 icon-manifest.json（本脚本与依赖版本的哈希及各输出文件的哈希），
+再次运行时未变化则跳过，--force 强制重新生成。
+
+用法:
+    python scripts/generate-icon.py [--output build] [--force]
 """
 
-from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from PIL import Image, ImageDraw
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import io
+import json
 import math
+import os
+
+import numpy as np
+import PIL
+
+# 母版尺寸
+MASTER_SIZE = 1024
+# Windows 图标内含的尺寸（最大 256）
+ICO_SIZES = [16, 32, 48, 64, 128, 256]
+# macOS iconset 尺寸，<= 512 时另有 @2x
+ICONSET_SIZES = [16, 32, 64, 128, 256, 512, 1024]
 
-# 图标尺寸
-SIZES = {
-    'icon.png': 1024,
-    'icon.ico': 256,  # Windows 图标最大尺寸
-}
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'build')
+MANIFEST_NAME = 'icon-manifest.json'
 
 def create_gradient_background(size, color1=(10, 20, 60), color2=(30, 60, 150)):
-    """创建蓝色渐变背景"""
-    img = Image.new('RGB', (size, size), color1)
-    draw = ImageDraw.Draw(img)
-    
-    for y in range(size):
-        ratio = y / size
-        r = int(color1[0] + (color2[0] - color1[0]) * ratio)
-        g = int(color1[1] + (color2[1] - color1[1]) * ratio)
-        b = int(color1[2] + (color2[2] - color1[2]) * ratio)
-        draw.line([(0, y), (size, y)], fill=(r, g, b))
-    
-    return img
+    """创建蓝色渐变背景，返回 (size, size, 4) 的 uint8 数组"""
+    ratio = np.arange(size, dtype=np.float64) / size
+    rows = np.stack([c1 + (c2 - c1) * ratio for c1, c2 in zip(color1, color2)], axis=-1).astype(np.uint8)
+    background = np.empty((size, size, 4), dtype=np.uint8)
+    background[..., :3] = rows[:, None, :]
+    background[..., 3] = 255
+    return background
 
-def draw_rounded_rect(draw, xy, radius, fill, outline=None, width=1):
-    """绘制圆角矩形"""
+def rounded_rect_mask(xs, ys, xy, radius):
+    """圆角矩形覆盖的像素（端点包含在内，与 ImageDraw.rounded_rectangle 一致），xs / ys 为像素坐标"""
     x1, y1, x2, y2 = xy
-    # 绘制主体矩形
-    draw.rectangle([x1 + radius, y1, x2 - radius, y2], fill=fill)
-    draw.rectangle([x1, y1 + radius, x2, y2 - radius], fill=fill)
-    # 绘制四个圆角
-    draw.ellipse([x1, y1, x1 + radius * 2, y1 + radius * 2], fill=fill)
-    draw.ellipse([x2 - radius * 2, y1, x2, y1 + radius * 2], fill=fill)
-    draw.ellipse([x1, y2 - radius * 2, x1 + radius * 2, y2], fill=fill)
-    draw.ellipse([x2 - radius * 2, y2 - radius * 2, x2, y2], fill=fill)
-
-def draw_glow_effect(draw, center, size, color, intensity=0.3):
-    """绘制发光效果"""
-    x, y = center
-    for i in range(10, 0, -1):
-        alpha = int(255 * intensity * (i / 10))
-        radius = size + i * 8
-        glow_color = (*color, alpha)
-        # 这里简化处理，实际应该使用RGBA
-
-def create_toolbox_icon(size=1024):
-    """创建工具箱图标"""
+    # 到去掉圆角后的内部矩形的距离，只有四个角的区域大于 0
+    dx = np.maximum(np.maximum(x1 + radius - xs, xs - (x2 - radius)), 0)
+    dy = np.maximum(np.maximum(y1 + radius - ys, ys - (y2 - radius)), 0)
+    inside = (xs >= x1) & (xs <= x2) & (ys >= y1) & (ys <= y2)
+    return inside & (dx * dx + dy * dy <= radius * radius)
+
+def create_glow_layer(size, box, color=(100, 200, 255), steps=15):
+    """
+    工具箱周围的发光层，返回 alpha 通道（uint8 数组）
+
+    由外到内逐层扩大的圆角矩形，越靠内越不透明；每层直接覆盖上一层，
+    像素的透明度取包含它的最内层。
+    """
+    box_left, box_top, box_right, box_bottom = box
+    alpha = np.zeros((size, size), dtype=np.uint8)
+    # 只计算最外层覆盖的区域
+    reach = steps * 4
+    x0, y0 = max(0, int(box_left - reach)), max(0, int(box_top - reach))
+    x1, y1 = min(size, int(box_right + reach) + 1), min(size, int(box_bottom + reach) + 1)
+    xs = np.arange(x0, x1, dtype=np.float32)[None, :]
+    ys = np.arange(y0, y1, dtype=np.float32)[:, None]
+    region = alpha[y0:y1, x0:x1]
+    for i in range(steps, 0, -1):
+        offset = i * 4
+        mask = rounded_rect_mask(
+            xs, ys,
+            (box_left - offset, box_top - offset, box_right + offset, box_bottom + offset),
+            20 + offset // 2,
+        )
+        region[mask] = int(30 * (i / steps))
+    return alpha
+
+def composite(base, color, alpha):
+    """将纯色图层按 alpha 叠加到不透明的 base 上（原地修改，只处理 alpha 不为 0 的行列范围）"""
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if not len(rows):
+        return
+    window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    a = alpha[window][..., None].astype(np.float32) / 255
+    blended = base[window][..., :3] * (1 - a) + np.asarray(color, dtype=np.float32) * a
+    base[window + (slice(0, 3),)] = np.rint(blended).astype(np.uint8)
+
+def create_toolbox_icon(size=MASTER_SIZE):
+    """创建工具箱图标（绘制一次的母版，其他尺寸用 resize_icon 缩小得到）"""
     # 创建背景
-    img = create_gradient_background(size)
-    
-    # 转换为RGBA以便处理透明度
-    img = img.convert('RGBA')
-    
-    # 创建发光层
-    glow = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    glow_draw = ImageDraw.Draw(glow)
-    
+    pixels = create_gradient_background(size)
+
     # 计算工具箱位置和大小
     center_x = size // 2
     center_y = size // 2 - size // 20  # 稍微偏上
     box_width = size // 2.5
     box_height = size // 3
-    
-    # 工具箱颜色（青色发光）
-    toolbox_color = (100, 200, 255)
-    glow_color = (100, 200, 255, 100)
-    
-    # 绘制发光效果
-    for i in range(15, 0, -1):
-        alpha = int(30 * (i / 15))
-        offset = i * 4
-        glow_draw.rounded_rectangle(
-            [center_x - box_width//2 - offset, center_y - box_height//2 - offset,
-             center_x + box_width//2 + offset, center_y + box_height//2 + offset],
-            radius=20 + offset//2,
-            fill=(100, 200, 255, alpha)
-        )
-    
-    # 合并发光层
-    img = Image.alpha_composite(img, glow)
-    draw = ImageDraw.Draw(img)
-    
-    # 绘制工具箱主体
+
     box_left = center_x - box_width // 2
     box_top = center_y - box_height // 2
     box_right = center_x + box_width // 2
     box_bottom = center_y + box_height // 2
-    
-    # 工具箱主体（渐变效果）
-    for i in range(int(box_height)):
-        ratio = i / box_height
-        r = int(80 + 40 * ratio)
-        g = int(180 + 40 * ratio)
-        b = int(255)
-        alpha = 255
-        y = box_top + i
-        draw.line([(box_left + 15, y), (box_right - 15, y)], 
-                  fill=(r, g, b, alpha), width=1)
-    
+
+    # 发光效果（青色）
+    toolbox_color = (100, 200, 255)
+    composite(pixels, toolbox_color, create_glow_layer(size, (box_left, box_top, box_right, box_bottom), toolbox_color))
+
+    # 工具箱主体（纵向渐变，左右各留 15px）
+    ratio = np.arange(int(box_height), dtype=np.float64) / box_height
+    body = np.stack([80 + 40 * ratio, 180 + 40 * ratio, np.full_like(ratio, 255), np.full_like(ratio, 255)],
+                    axis=-1).astype(np.uint8)
+    top = int(box_top)
+    pixels[top:top + len(body), int(box_left + 15):int(box_right - 15) + 1] = body[:, None, :]
+
+    # 底部音频频谱效果（装饰），每根频谱条按高度渐变并带透明度
+    spectrum_bars = 20
+    bar_width = size // (spectrum_bars * 2)
+    max_bar_height = size // 12
+    bottom_y = size - size // 15
+
+    ratio = np.arange(max_bar_height, dtype=np.float64) / max_bar_height
+    bar_colors = np.stack([30 + 70 * ratio, 60 + 100 * ratio, 150 + 105 * ratio, 100 + 155 * ratio],
+                          axis=-1).astype(np.uint8)
+    for i in range(spectrum_bars):
+        x = size // 4 + i * bar_width * 2
+        # 使用正弦波创建起伏效果
+        height_factor = abs(math.sin(i * 0.5)) * 0.5 + 0.3
+        bar_height = int(max_bar_height * height_factor)
+        if bar_height <= 0 or x >= size:
+            continue
+        # 第 h 行（自底向上）位于 bottom_y - h
+        column = bar_colors[bar_height - 1::-1]
+        pixels[bottom_y - bar_height + 1:bottom_y + 1, x:min(size, x + bar_width - 1)] = column[:, None, :]
+
+    img = Image.fromarray(pixels, 'RGBA')
+    draw = ImageDraw.Draw(img)
+
     # 绘制工具箱边框（发光效果）
     border_color = (150, 220, 255)
     draw.rounded_rectangle(
@@ -110,7 +148,7 @@ def create_toolbox_icon(size=1024):
         outline=border_color,
         width=4
     )
-    
+
     # 绘制工具箱盖子/提手
     handle_height = box_height // 4
     draw.rounded_rectangle(
@@ -118,7 +156,7 @@ def create_toolbox_icon(size=1024):
         radius=20,
         fill=(60, 160, 230)
     )
-    
+
     # 绘制提手
     handle_width = box_width // 3
     handle_top = box_top - box_height // 6
@@ -130,7 +168,7 @@ def create_toolbox_icon(size=1024):
         outline=border_color,
         width=3
     )
-    
+
     # 绘制锁扣
     lock_width = box_width // 6
     lock_height = box_height // 8
@@ -142,85 +180,100 @@ def create_toolbox_icon(size=1024):
         outline=border_color,
         width=2
     )
-    
-    # 绘制底部音频频谱效果（装饰）
-    spectrum_bars = 20
-    bar_width = size // (spectrum_bars * 2)
-    max_bar_height = size // 12
-    bottom_y = size - size // 15
-    
-    for i in range(spectrum_bars):
-        x = size // 4 + i * bar_width * 2
-        # 使用正弦波创建起伏效果
-        height_factor = abs(math.sin(i * 0.5)) * 0.5 + 0.3
-        bar_height = int(max_bar_height * height_factor)
-        
-        # 渐变色
-        for h in range(bar_height):
-            ratio = h / max_bar_height
-            r = int(30 + 70 * ratio)
-            g = int(60 + 100 * ratio)
-            b = int(150 + 105 * ratio)
-            alpha = int(100 + 155 * ratio)
-            y = bottom_y - h
-            draw.line([(x, y), (x + bar_width - 2, y)], 
-                      fill=(r, g, b, alpha), width=1)
-    
+
     return img
 
-def create_ico_icon(size=256):
-    """创建Windows ICO图标"""
-    img = create_toolbox_icon(size)
-    return img.convert('RGBA')
+def resize_icon(master, size):
+    """由母版缩小到指定尺寸（RGBA 按预乘 alpha 重采样，透明边缘不发黑）"""
+    if master.width == size:
+        return master
+    return master.resize((size, size), Image.LANCZOS)
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-def create_icns_icon(size=1024):
-    """创建macOS ICNS图标"""
-    return create_toolbox_icon(size)
+def encode_png(img):
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
 
-def save_icons():
+def source_hash():
+    """生成结果只取决于本脚本与 Pillow / NumPy 版本"""
+    digest = hashlib.sha256()
+    with open(os.path.abspath(__file__), 'rb') as f:
+        digest.update(f.read())
+    digest.update(f"Pillow {PIL.__version__} NumPy {np.__version__}".encode())
+    return digest.hexdigest()
+
+def is_up_to_date(build_dir, source):
+    """清单中的源哈希一致且各输出文件未被修改"""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('source') != source or not manifest.get('outputs'):
+            return False
+        return all(file_sha256(os.path.join(build_dir, name)) == digest
+                   for name, digest in manifest['outputs'].items())
+    except (OSError, ValueError):
+        return False
+
+def save_icons(build_dir=BUILD_DIR, force=False):
     """保存所有格式的图标"""
-    import os
-    
-    build_dir = '/root/.openclaw/workspace/yunran-tools-v3/build'
+    build_dir = os.path.abspath(build_dir)
+    source = source_hash()
+    if not force and is_up_to_date(build_dir, source):
+        print(f"图标未变化，跳过生成（{build_dir}/{MANIFEST_NAME}）")
+        return
+
     os.makedirs(build_dir, exist_ok=True)
-    
-    # 生成 PNG (1024x1024)
-    print("生成 icon.png (1024x1024)...")
-    png_img = create_toolbox_icon(1024)
-    png_img.save(f'{build_dir}/icon.png', 'PNG')
-    
-    # 生成 ICO (多尺寸) - Windows 需要 256x256
-    print("生成 icon.ico (多尺寸)...")
-    ico_sizes = [16, 32, 48, 64, 128, 256]
-    ico_images = []
-    for s in ico_sizes:
-        img = create_toolbox_icon(s).convert('RGBA')
-        ico_images.append(img)
-    # PIL 保存 ICO 需要特殊处理
-    ico_images[-1].save(f'{build_dir}/icon.ico', format='ICO', sizes=[(s, s) for s in ico_sizes])
-    
-    # 生成 ICNS (macOS)
-    print("生成 icon.icns (macOS)...")
-    # ICNS 需要特殊处理，这里先保存为 PNG，后续可以用 iconutil 转换
-    icns_img = create_toolbox_icon(1024)
-    icns_img.save(f'{build_dir}/icon.icns.png', 'PNG')
-    
-    # 生成不同尺寸的图标用于 icon.iconset
-    iconset_dir = f'{build_dir}/icon.iconset'
+    iconset_dir = os.path.join(build_dir, 'icon.iconset')
     os.makedirs(iconset_dir, exist_ok=True)
-    
-    sizes = [16, 32, 64, 128, 256, 512, 1024]
-    for s in sizes:
-        img = create_toolbox_icon(s)
-        img.save(f'{iconset_dir}/icon_{s}x{s}.png', 'PNG')
+
+    print(f"绘制母版 ({MASTER_SIZE}x{MASTER_SIZE})...")
+    master = create_toolbox_icon(MASTER_SIZE)
+
+    # 各尺寸只缩小、编码一次（iconset 的 @2x 与更大一级的尺寸相同），在线程池中并行处理
+    sizes = sorted(set(ICO_SIZES) | set(ICONSET_SIZES) | {s * 2 for s in ICONSET_SIZES if s <= 512})
+    with ThreadPoolExecutor(max_workers=min(len(sizes), os.cpu_count() or 1)) as pool:
+        images = dict(zip(sizes, pool.map(lambda s: resize_icon(master, s), sizes)))
+        pngs = dict(zip(sizes, pool.map(encode_png, [images[s] for s in sizes])))
+
+    # 输出文件（相对 build_dir 的路径）-> 内容
+    # ICNS 需要特殊处理，这里先保存为 PNG（icon.icns.png），后续可以用 iconutil 转换
+    outputs = {'icon.png': pngs[MASTER_SIZE], 'icon.icns.png': pngs[MASTER_SIZE]}
+    for s in ICONSET_SIZES:
+        outputs[f'icon.iconset/icon_{s}x{s}.png'] = pngs[s]
         if s <= 512:
-            img2x = create_toolbox_icon(s * 2)
-            img2x.save(f'{iconset_dir}/icon_{s}x{s}@2x.png', 'PNG')
-    
+            outputs[f'icon.iconset/icon_{s}x{s}@2x.png'] = pngs[s * 2]
+
+    # 生成 ICO (多尺寸) - Windows 需要 256x256，各尺寸使用缩小后的图像
+    ico_images = [images[s] for s in ICO_SIZES]
+    buffer = io.BytesIO()
+    ico_images[-1].save(buffer, format='ICO', sizes=[(s, s) for s in ICO_SIZES], append_images=ico_images[:-1])
+    outputs['icon.ico'] = buffer.getvalue()
+
+    print("生成 icon.png、icon.ico、icon.icns.png 与 icon.iconset...")
+    for name, data in outputs.items():
+        with open(os.path.join(build_dir, name), 'wb') as f:
+            f.write(data)
+
+    names = sorted(outputs)
+    manifest = {
+        'source': source,
+        'outputs': {name: hashlib.sha256(outputs[name]).hexdigest() for name in names},
+    }
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
     print(f"图标已保存到 {build_dir}/")
     print("文件列表:")
-    for f in os.listdir(build_dir):
-        print(f"  - {f}")
+    for name in names:
+        print(f"  - {name}")
 
 if __name__ == '__main__':
-    save_icons()
+    parser = argparse.ArgumentParser(description="生成云褍实用工具图标")
+    parser.add_argument('--output', default=BUILD_DIR, help="输出目录，默认为项目的 build 目录")
+    parser.add_argument('--force', action='store_true', help="忽略清单，强制重新生成")
+    args = parser.parse_args()
+    save_icons(args.output, args.force)
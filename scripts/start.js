@@ -289,7 +289,9 @@ async function main() {
       env: { 
         ...process.env, 
         NODE_ENV: 'development',
-        VITE_DEV_SERVER_URL: 'http://localhost:5173'
+        VITE_DEV_SERVER_URL: 'http://localhost:5173',
+        // 使用上面已启动的后端（支持 --reload），Electron 不再另外启动
+        YUNRAN_BACKEND_URL: 'http://127.0.0.1:8000'
       }
     }
   )